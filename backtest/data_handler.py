@@ -61,6 +61,23 @@ class DataHandler:
     def load_data_from_csv(self, file_path) -> pd.DataFrame:
         """loading data from CSV file."""
         return pd.read_csv(file_path, parse_dates=True, index_col="date")
+
+    def load_data_from_store(self, store, timeframe: str = "1m") -> pd.DataFrame:
+        """
+        bars recorded by the live aggregator, read through a BarStore
+        (utils/bar_store.py); same columns as fetch_data, IST timestamps
+        """
+        bars = store.range(self.symbol, timeframe, self.start_date, self.end_date)
+        out = pd.DataFrame({c: bars[c] for c in ("open", "high", "low", "close", "volume")})
+        out.index = pd.to_datetime(bars["ts"], unit="ms", utc=True).tz_convert("Asia/Kolkata").tz_localize(None)
+        out.index.name = "date"
+
+        out["vwap"] = (out["open"] + out["high"] + out["low"] + out["close"]) / 4
+        out["change"] = out["close"].diff()
+        out["change_percent"] = out["close"].pct_change()
+        out["symbol"] = self.symbol
+
+        return out.dropna(subset=["change", "change_percent"])
     
     def yf_to_openbb(self, df: pd.DataFrame, symbol: str):
         out = df.copy()
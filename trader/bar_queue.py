@@ -0,0 +1,116 @@
+"""
+bounded bar queues with overflow policies
+
+- block       : put waits for room (backpressure on the producer)
+- drop_oldest : the oldest queued item is discarded to make room
+- conflate    : at most one queued item per key, a newer item is merged
+                into the one still waiting (latest bar per instrument)
+"""
+
+import asyncio
+from collections import deque
+
+
+POLICIES = ("block", "drop_oldest", "conflate")
+
+
+def bar_extremes(bar: dict) -> tuple:
+    """
+    (ts, high, low) of every bar merged into `bar`, oldest first
+    """
+    return bar.get("_extremes") or ((int(bar["ts"]), bar["high"], bar["low"]),)
+
+
+def merge_bars(old: dict, new: dict) -> dict:
+    """
+    conflates two bars of one instrument into a single bar covering both,
+    so high/low extremes (stop/target hits) are not lost. the extremes of
+    each merged bar are kept under `_extremes`, so exit checks can skip
+    the bars from before a position was entered
+    """
+    merged = dict(new)
+    merged["open"] = old.get("open", new.get("open"))
+    merged["high"] = max(old.get("high", new["high"]), new["high"])
+    merged["low"] = min(old.get("low", new["low"]), new["low"])
+    if "volume" in old or "volume" in new:
+        merged["volume"] = old.get("volume", 0) + new.get("volume", 0)
+    merged["_extremes"] = bar_extremes(old) + bar_extremes(new)
+    return merged
+
+
+def merge_keyed_bars(old: tuple, new: tuple) -> tuple:
+    """
+    merge for (instrument, bar) items
+    """
+    return (new[0], merge_bars(old[1], new[1]))
+
+
+class BarQueue(asyncio.Queue):
+    """
+    asyncio.Queue with a bound and an overflow policy.
+
+    key   : item -> conflation key (default: the whole queue is one key,
+            which is what a per-instrument queue wants)
+    merge : (queued, new) -> item that replaces the queued one
+    """
+    def __init__(self, maxsize: int = 0, policy: str = "block", key=None, merge=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown queue policy: {policy}")
+        self.policy = policy
+        self.key = key or (lambda item: None)
+        self.merge = merge or (lambda old, new: new)
+        self.dropped = 0
+        self.conflated = 0
+        super().__init__(maxsize)
+
+
+    ''' storage hooks used by asyncio.Queue '''
+    def _init(self, maxsize):
+        self._queue = deque()
+        self._pending = {}  # conflate only: key -> queued item
+
+    def _put(self, item):
+        if self.policy == "conflate":
+            k = self.key(item)
+            self._queue.append(k)
+            self._pending[k] = item
+        else:
+            self._queue.append(item)
+
+    def _get(self):
+        if self.policy == "conflate":
+            return self._pending.pop(self._queue.popleft())
+        return self._queue.popleft()
+
+
+    def put_nowait(self, item):
+        if self.policy == "conflate":
+            k = self.key(item)
+            if k in self._pending:
+                self._pending[k] = self.merge(self._pending[k], item)
+                self.conflated += 1
+                return
+
+        if self.policy != "block" and self.full():
+            self._get()
+            self.task_done()
+            self.dropped += 1
+
+        super().put_nowait(item)
+
+
+    async def put(self, item):
+        if self.policy == "block":
+            return await super().put(item)
+        # the other policies never wait
+        self.put_nowait(item)
+
+
+    def stats(self) -> dict:
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+        }
@@ -0,0 +1,232 @@
+"""
+off-loop decoding of raw websocket frames
+
+frames received within a short window are gathered
+and decoded as one batch on a worker pool (threads
+or processes), so the event loop only routes bars
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from google.protobuf.json_format import MessageToDict # type: ignore
+from utils.fetch_data_upstox import decode_protobuf
+from latency import stamp
+
+
+def extract_bars(data_dict: dict, instruments) -> list[tuple[str, dict]]:
+    """
+    pulls the last completed 1-min bar of every
+    subscribed instrument out of a decoded feed
+    """
+    bars = []
+    if data_dict.get("type") != "live_feed":
+        return bars
+
+    # only walk the feeds actually present in this frame, a sharded
+    # connection carries a small slice of a large universe
+    feeds = data_dict.get("feeds", {})
+    for instrument, feed in feeds.items():
+        if not feed or instrument not in instruments:
+            continue
+
+        instrument_type = "equity" if "NSE_EQ" in instrument else "index"
+        ohlc_path = feed.get("fullFeed", {}).get("marketFF" if instrument_type == "equity" else "indexFF", {}).get("marketOHLC", {}).get("ohlc")
+
+        if not ohlc_path or len(ohlc_path) < 2:
+            continue
+
+        minute = ohlc_path[1]
+        bar = {
+            "ts": minute.get("ts"),
+            "open": minute.get("open", 0),
+            "high": minute.get("high", 0),
+            "low": minute.get("low", 0),
+            "close": minute.get("close", 0),
+        }
+        if instrument_type == "equity":
+            bar["volume"] = int(minute.get("vol", 0))
+
+        bars.append((instrument, bar))
+
+    return bars
+
+
+def decode_frames(frames: list[tuple[int, bytes]], instruments) -> list[tuple[str, dict]]:
+    """
+    decodes a batch of (recv_ns, raw frame) in receive order.
+    runs on a worker, so it has to stay a picklable
+    module level function (process pools need that)
+    """
+    out = []
+    for recv_ns, frame in frames:
+        try:
+            data_dict = MessageToDict(decode_protobuf(frame))
+        except Exception as e:
+            print(f"[DECODER] Undecodable frame skipped: {e}")
+            continue
+        for instrument, bar in extract_bars(data_dict, instruments):
+            bar["_stamps"] = {"recv": recv_ns}
+            out.append((instrument, bar))
+    return out
+
+
+class BatchDecoder:
+    """
+    decode stage sitting between the websocket and the bar queues
+
+    - `submit` only timestamps and enqueues the raw frame
+    - a collector gathers frames for `window` seconds (or `max_batch` frames)
+      and hands the batch to the worker pool
+    - a router awaits batches strictly in submission order, so bars of
+      one instrument are never reordered, and calls `route(instrument, bar)`
+    """
+    def __init__(self,
+                 instruments: list[str],
+                 route,
+                 mode: str = "thread",
+                 workers: int = 2,
+                 window: float = 0.05,
+                 max_batch: int = 500,
+                 max_inflight: int = 4,
+                 report_every: float = 60.0):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"unknown decode mode: {mode}")
+
+        self.instruments = frozenset(instruments)
+        self.route = route
+        self.mode = mode
+        self.window = window
+        self.max_batch = max_batch
+        self.report_every = report_every
+
+        self.raw: asyncio.Queue = asyncio.Queue()
+        self.pending: asyncio.Queue = asyncio.Queue(maxsize=max_inflight)
+
+        if mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="DecodeExecutor")
+
+        self.submitted = 0
+        self.stats = {
+            "frames": 0,
+            "failed_frames": 0,
+            "batches": 0,
+            "bars": 0,
+            "queue_lag_ms_last": 0.0,   # receive -> handed to a worker (oldest frame of batch)
+            "queue_lag_ms_max": 0.0,
+            "route_lag_ms_last": 0.0,   # receive -> bars routed (oldest frame of batch)
+            "route_lag_ms_max": 0.0,
+        }
+
+
+    def submit(self, frame: bytes) -> None:
+        """
+        called from the receive loop, never blocks
+        """
+        self.raw.put_nowait((time.monotonic_ns(), frame))
+        self.submitted += 1
+
+
+    def backlog(self) -> int:
+        """
+        frames waiting to be decoded
+        """
+        return self.raw.qsize()
+
+
+    async def drain(self, poll: float = 0.01) -> None:
+        """
+        waits until every submitted frame has been decoded and routed
+        """
+        while self.stats["frames"] + self.stats["failed_frames"] < self.submitted:
+            await asyncio.sleep(poll)
+
+
+    async def _collect(self) -> list[tuple[int, bytes]]:
+        batch = [await self.raw.get()]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_batch:
+            # drain whatever is already there before sleeping on the queue
+            try:
+                batch.append(self.raw.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.raw.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+
+    async def _collector(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            first_recv = batch[0][0]
+
+            lag = (time.monotonic_ns() - first_recv) / 1e6
+            self.stats["queue_lag_ms_last"] = lag
+            self.stats["queue_lag_ms_max"] = max(self.stats["queue_lag_ms_max"], lag)
+
+            future = loop.run_in_executor(self.executor, decode_frames, batch, self.instruments)
+            # bounded, so a slow pool pushes back on collection instead of piling up futures
+            await self.pending.put((first_recv, len(batch), future))
+
+
+    async def _router(self):
+        while True:
+            first_recv, n_frames, future = await self.pending.get()
+            try:
+                bars = await future
+            except Exception as e:
+                print(f"[DECODER] Batch of {n_frames} frames failed: {e}")
+                self.stats["failed_frames"] += n_frames
+                continue
+
+            for instrument, bar in bars:
+                stamp(bar, "routed")
+                await self.route(instrument, bar)
+
+            lag = (time.monotonic_ns() - first_recv) / 1e6
+            self.stats["frames"] += n_frames
+            self.stats["batches"] += 1
+            self.stats["bars"] += len(bars)
+            self.stats["route_lag_ms_last"] = lag
+            self.stats["route_lag_ms_max"] = max(self.stats["route_lag_ms_max"], lag)
+
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            s = self.stats
+            print(
+                f"[DECODER] frames={s['frames']} batches={s['batches']} bars={s['bars']} "
+                f"backlog={self.backlog()} queue_lag_ms={s['queue_lag_ms_last']:.1f} (max {s['queue_lag_ms_max']:.1f}) "
+                f"route_lag_ms={s['route_lag_ms_last']:.1f} (max {s['route_lag_ms_max']:.1f})"
+            )
+
+
+    async def run(self):
+        """
+        runs collector, router and reporter until cancelled
+        """
+        tasks = [
+            asyncio.create_task(self._collector()),
+            asyncio.create_task(self._router()),
+            asyncio.create_task(self._reporter()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
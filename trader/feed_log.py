@@ -0,0 +1,164 @@
+"""
+raw websocket frame capture and replay
+
+log format (little endian), one record per frame:
+    uint64  receive time, ns since epoch
+    uint32  frame length
+    bytes   raw protobuf FeedResponse
+
+files are rotated once they cross `max_bytes`
+"""
+
+import asyncio
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+RECORD_HEADER = struct.Struct("<QI")
+
+
+class FeedRecorder:
+    """
+    appends raw frames to a length-prefixed binary log.
+    writes go to a large userspace buffer, so `write`
+    costs a memcpy on the hot path, not a syscall.
+    `run_flusher` pushes the buffer to disk every
+    `flush_interval` seconds, so a crash or a quiet feed
+    loses at most that much of the capture
+    """
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, prefix: str = "feed", flush_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+
+        self._file = None
+        self._written = 0
+        self._part = 0
+        self.frames = 0
+        self._open_next()
+
+
+    def _open_next(self):
+        if self._file:
+            self._file.close()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.directory / f"{self.prefix}_{stamp}_{self._part:04d}.bin"
+        self._part += 1
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        self._written = 0
+        self.path = path
+        print(f"[CAPTURE] Writing raw frames to {path}")
+
+
+    def write(self, frame, recv_ns: int | None = None) -> None:
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        if recv_ns is None:
+            recv_ns = time.time_ns()
+
+        self._file.write(RECORD_HEADER.pack(recv_ns, len(frame)))
+        self._file.write(frame)
+        self._written += RECORD_HEADER.size + len(frame)
+        self.frames += 1
+
+        if self._written >= self.max_bytes:
+            self._open_next()
+
+
+    def flush(self) -> None:
+        if self._file:
+            self._file.flush()
+
+
+    async def run_flusher(self) -> None:
+        """
+        flushes on a timer until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def read_feed_log(path):
+    """
+    yields (recv_ns, frame) from one capture file,
+    a truncated trailing record (crash mid-write) is ignored
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            recv_ns, length = RECORD_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                print(f"[REPLAY] Truncated record at the end of {path}, stopping.")
+                return
+            yield recv_ns, frame
+
+
+def capture_files(directory: str, prefix: str = "feed") -> list[Path]:
+    """
+    capture files of a directory in the order they were written
+    """
+    return sorted(Path(directory).glob(f"{prefix}_*.bin"))
+
+
+async def replay_feed(paths, submit, speed: float | None = 1.0, yield_every: int = 256) -> dict:
+    """
+    pushes captured frames into `submit` (e.g. BatchDecoder.submit)
+
+    speed: 1.0 -> original timing, N -> N times faster,
+           None or 0 -> as fast as possible (load test)
+    """
+    frames = 0
+    first_recv_ns = None
+    started = time.monotonic()
+
+    for path in paths:
+        for recv_ns, frame in read_feed_log(path):
+            if first_recv_ns is None:
+                first_recv_ns = recv_ns
+
+            if speed:
+                due = (recv_ns - first_recv_ns) / 1e9 / speed
+                delay = due - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif frames % yield_every == 0:
+                # let the decoder run even when replaying flat out
+                await asyncio.sleep(0)
+
+            submit(frame)
+            frames += 1
+
+    elapsed = time.monotonic() - started
+    rate = frames / elapsed if elapsed > 0 else 0.0
+    print(f"[REPLAY] {frames} frames in {elapsed:.2f}s ({rate:.0f} frames/s)")
+    return {"frames": frames, "elapsed_s": elapsed, "frames_per_s": rate}
+
+
+if __name__ == "__main__":
+    # load test / post-mortem: python feed_log.py <capture_dir> <instrument,...> [speed]
+    import sys
+    from market_adapter import MarketAdapter
+
+    capture_dir, keys = sys.argv[1], sys.argv[2].split(",")
+    replay_speed = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    async def _main():
+        adapter = MarketAdapter(keys)
+        await adapter.replay(capture_files(capture_dir), speed=replay_speed)
+        print({k: q.qsize() for k, q in adapter.queues.items()})
+
+    asyncio.run(_main())
@@ -0,0 +1,201 @@
+"""
+tick-to-decision latency instrumentation
+
+every bar carries monotonic timestamps of the pipeline stages
+it went through (`bar["_stamps"]`). latencies from websocket
+receipt to each stage go into log-linear (HDR-style) histograms,
+per stage and per instrument, with constant-time recording.
+
+stages, in order:
+    recv      frame received from the websocket (or simulated)
+    routed    decoded and put on the instrument queue
+    dequeued  picked up by process_instrument
+    signal    strategy signals computed (StrategyRegistry.on_bar)
+    risk      RiskEngine.determine_position returned
+    recorded  position applied by the portfolio actor
+"""
+
+import asyncio
+import json
+import time
+
+
+SUB_BUCKET_BITS = 5                 # 32 sub-buckets per power of two, ~3% precision
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+N_BUCKETS = SUB_BUCKETS * 40        # covers well past an hour in microseconds
+
+ALL = "*"
+
+
+def stamp(bar: dict, stage: str) -> None:
+    """
+    marks the moment a bar reaches a pipeline stage
+    """
+    bar.setdefault("_stamps", {})[stage] = time.monotonic_ns()
+
+
+class LatencyHistogram:
+    """
+    log-linear histogram of microsecond latencies
+    """
+    def __init__(self):
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return min(SUB_BUCKETS * (shift + 1) + (value >> shift) - SUB_BUCKETS, N_BUCKETS - 1)
+
+
+    @staticmethod
+    def _upper(index: int) -> int:
+        """
+        highest value that lands in a bucket
+        """
+        if index < SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+
+    def record(self, micros: int) -> None:
+        micros = max(0, int(micros))
+        self.counts[self._index(micros)] += 1
+        self.count += 1
+        self.total += micros
+        self.max = max(self.max, micros)
+        self.min = micros if self.min is None else min(self.min, micros)
+
+
+    def percentile(self, p: float) -> int:
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self._upper(index), self.max)
+        return self.max
+
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "min_us": self.min or 0,
+            "mean_us": round(self.total / self.count, 1) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "p999_us": self.percentile(99.9),
+            "max_us": self.max,
+        }
+
+
+class LatencyRecorder:
+    """
+    histograms keyed by (stage, instrument), plus (stage, "*")
+    for the stage across all instruments
+    """
+    def __init__(self, origin: str = "recv"):
+        self.origin = origin
+        self.histograms: dict[tuple[str, str], LatencyHistogram] = {}
+
+
+    def record(self, instrument: str, stage: str, micros: int) -> None:
+        for key in ((stage, instrument), (stage, ALL)):
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = LatencyHistogram()
+            h.record(micros)
+
+
+    def observe_stage(self, instrument: str, stamps: dict | None, stage: str) -> None:
+        """
+        records origin -> stage for one stamped stage
+        """
+        if not stamps or self.origin not in stamps or stage not in stamps:
+            return
+        self.record(instrument, stage, (stamps[stage] - stamps[self.origin]) // 1000)
+
+
+    def observe(self, instrument: str, bar: dict) -> None:
+        """
+        records origin -> stage for every stage a bar has been through
+        """
+        stamps = bar.get("_stamps")
+        if not stamps or self.origin not in stamps:
+            return
+        t0 = stamps[self.origin]
+        for stage, t in stamps.items():
+            if stage != self.origin:
+                self.record(instrument, stage, (t - t0) // 1000)
+
+
+    def summary(self, per_instrument: bool = False) -> dict:
+        out = {}
+        for (stage, instrument), h in sorted(self.histograms.items()):
+            if instrument != ALL and not per_instrument:
+                continue
+            out.setdefault(stage, {})[instrument] = h.summary()
+        return out
+
+
+    def print_summary(self) -> None:
+        print("\n--- LATENCY (recv -> stage, us) ---")
+        for stage, by_instr in self.summary().items():
+            s = by_instr[ALL]
+            print(f"{stage:<10} n={s['count']:<7} p50={s['p50_us']:<8} p90={s['p90_us']:<8} p99={s['p99_us']:<8} max={s['max_us']}")
+        print("-----------------------------------\n")
+
+
+    def dump_data(self) -> dict:
+        """
+        full per-stage / per-instrument summaries plus the
+        non-empty buckets, so runs can be compared later
+        """
+        return {
+            "origin": self.origin,
+            "summary": self.summary(per_instrument=True),
+            "buckets": {
+                f"{stage}|{instrument}": {str(LatencyHistogram._upper(i)): c for i, c in enumerate(h.counts) if c}
+                for (stage, instrument), h in self.histograms.items()
+            },
+        }
+
+
+    @staticmethod
+    def _write_sync(data: dict, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+    def dump(self, path: str) -> None:
+        self._write_sync(self.dump_data(), path)
+
+
+    async def run_reporter(self, interval: float = 60.0, dump_path: str | None = None):
+        """
+        periodic summaries (and dump file) until cancelled
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.print_summary()
+            if dump_path:
+                try:
+                    # built on the loop, written off it
+                    await asyncio.to_thread(self._write_sync, self.dump_data(), dump_path)
+                except Exception as e:
+                    print(f"[LATENCY] Failed to write {dump_path}: {e}")
+
+
+# process wide recorder, shared by the adapter, the pipeline and the portfolio actor
+LATENCY = LatencyRecorder()
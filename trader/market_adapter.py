@@ -10,14 +10,17 @@ import json
 from pathlib import Path
 from dotenv import load_dotenv # type: ignore
 from pymongo import MongoClient # type: ignore
-from utils.fetch_data_upstox import (
-    get_market_data_feed_authorize_v3,
-    decode_protobuf,
-)
+from utils.fetch_data_upstox import FeedAuthorizer
+from decoder import BatchDecoder
+from feed_log import FeedRecorder, replay_feed
+from bar_queue import BarQueue, merge_bars
+from latency import stamp
+from registry import dummy_base_price
 import ssl
 import websockets # type: ignore
 import asyncio
-from google.protobuf.json_format import MessageToDict # type: ignore
+import queue
+import multiprocessing as mp
 
 
 env_path = Path(__file__).resolve().parent.parent / '.env'
@@ -30,6 +33,41 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 # db = client["duckducktrade"]
 # collection = db["market-adapter-data"]
 
+def shard_instruments(instruments: list[str], n_shards: int) -> list[list[str]]:
+    """
+    splits instruments into at most n_shards round-robin groups,
+    so every shard ends up with a similar share of the universe
+    """
+    n = max(1, min(n_shards, len(instruments)))
+    return [instruments[i::n] for i in range(n)]
+
+
+def _shard_process_main(shard_id: int, instruments: list[str], out_queue, decode_window: float, capture_dir: str | None):
+    """
+    entry point of a shard worker process: owns one connection
+    for its instruments and forwards deduplicated bars to the parent
+    """
+    async def _run():
+        adapter = MarketAdapter(
+            instruments,
+            decode_window=decode_window,
+            capture_dir=f"{capture_dir}/shard_{shard_id}" if capture_dir else None,
+        )
+
+        async def forward(instrument):
+            q = adapter.queues[instrument]
+            while True:
+                bar = await q.get()
+                out_queue.put((instrument, bar))
+
+        await asyncio.gather(adapter.fetch(), *(forward(i) for i in instruments))
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+
+
 class MarketAdapter:
     """
     The main market adapter class
@@ -39,18 +77,71 @@ class MarketAdapter:
     - decode data coming from websocket
     - insert the data (once per minute) into DB
     """
-    def __init__(self, instruments: list[str]):
+    def __init__(self,
+                 instruments: list[str],
+                 decode_mode: str = "thread",
+                 decode_workers: int = 2,
+                 decode_window: float = 0.05,
+                 capture_dir: str | None = None,
+                 capture_max_bytes: int = 256 * 1024 * 1024,
+                 shards: int = 1,
+                 shard_processes: bool = False,
+                 queue_maxsize: int = 0,
+                 queue_policy: str = "block"):
         """
         class constructor
 
         instance variable: instruments : [list of instrument representation for upstox]
+        decode_mode : "thread" or "process" pool for off-loop protobuf decoding
+        decode_window : seconds of frames gathered into one decode batch
+        capture_dir : if set, every raw frame is logged there (see feed_log.py)
+        shards : number of websocket connections the subscriptions are split over
+        shard_processes : run every shard (connection + decode) in its own process
+        queue_maxsize, queue_policy : bound and overflow policy of every
+            per-instrument queue ("block", "drop_oldest" or "conflate", see bar_queue.py)
         """
         self.instruments = instruments
-        self.queues = {instrument: asyncio.Queue() for instrument in instruments}
+        self.shards = shard_instruments(instruments, shards)
+        self.shard_processes = shard_processes
+        self.capture_dir = capture_dir
+        self.decode_window = decode_window
+        self.queues = {
+            instrument: BarQueue(queue_maxsize, queue_policy, merge=merge_bars)
+            for instrument in instruments
+        }
         self.current_ts = {instrument: 0 for instrument in instruments}
+        self.decode_mode = decode_mode
+        self.decode_workers = decode_workers
+        self._decoder = None
+        self.recorder = FeedRecorder(capture_dir, max_bytes=capture_max_bytes) if capture_dir else None
         print("Market Adapter Initiated")
 
 
+    @property
+    def decoder(self) -> BatchDecoder:
+        """
+        created on first use, so only the paths that decode frames in
+        this process (fetch, replay) start a decode pool; dummy_fetch
+        and process-shard parents never do
+        """
+        if self._decoder is None:
+            self._decoder = BatchDecoder(
+                self.instruments,
+                self._route_bar,
+                mode=self.decode_mode,
+                workers=self.decode_workers,
+                window=self.decode_window,
+            )
+        return self._decoder
+
+
+    def queue_stats(self) -> dict:
+        """
+        size / dropped / conflated counters of every instrument queue
+        """
+        return {instrument: q.stats() for instrument, q in self.queues.items()}
+
+
     def insert_to_db(self, data_dict: dict) -> None:
         """
         insert 1-Min OHLC into MongoDB Collection
@@ -65,16 +156,124 @@ class MarketAdapter:
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
 
+        if self.shard_processes and len(self.shards) > 1:
+            await self._run_process_shards()
+            return
+
+        decoder_task = asyncio.create_task(self.decoder.run())
+        flusher_task = asyncio.create_task(self.recorder.run_flusher()) if self.recorder else None
+        self.authorizer = FeedAuthorizer(ACCESS_TOKEN)
+
+        try:
+            # authorize every shard's connection concurrently up front
+            await self.authorizer.prefetch(len(self.shards))
+
+            # one independent connection (and reconnect loop) per shard,
+            # all feeding the same decoder and per-instrument queues
+            await asyncio.gather(*(
+                self._connect_loop(ssl_context, shard, shard_id)
+                for shard_id, shard in enumerate(self.shards)
+            ))
+        finally:
+            decoder_task.cancel()
+            if flusher_task:
+                flusher_task.cancel()
+            await self.authorizer.close()
+            if self.recorder:
+                self.recorder.close()
+
+
+    async def _run_process_shards(self, supervise_every: float = 5.0):
+        """
+        one worker process per shard, bars come back over a
+        multiprocessing queue and are routed into self.queues.
+        a dead worker is restarted without touching the others
+        """
+        ctx = mp.get_context("spawn")
+        out_queue = ctx.Queue()
+        procs = {}
+
+        def start(shard_id):
+            proc = ctx.Process(
+                target=_shard_process_main,
+                args=(shard_id, self.shards[shard_id], out_queue, self.decode_window, self.capture_dir),
+                name=f"feed-shard-{shard_id}",
+                daemon=True,
+            )
+            proc.start()
+            procs[shard_id] = proc
+            print(f"[SHARD-{shard_id}] Worker process {proc.pid} started for {len(self.shards[shard_id])} instruments")
+
+        async def supervise():
+            while True:
+                await asyncio.sleep(supervise_every)
+                for shard_id, proc in list(procs.items()):
+                    if not proc.is_alive():
+                        print(f"[SHARD-{shard_id}] Worker exited ({proc.exitcode}), restarting")
+                        start(shard_id)
+
+        async def collect():
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    instrument, bar = await loop.run_in_executor(None, out_queue.get, True, 1.0)
+                except queue.Empty:
+                    continue
+                await self._route_bar(instrument, bar)
+
+        for shard_id in range(len(self.shards)):
+            start(shard_id)
+
+        try:
+            await asyncio.gather(supervise(), collect())
+        finally:
+            for proc in procs.values():
+                proc.terminate()
+
+
+    async def replay(self, paths, speed: float | None = 1.0):
+        """
+        feeds captured frames through the same decode path as `fetch`.
+        speed: 1.0 real time, N for N-x, None for max speed (load test)
+        """
+        decoder_task = asyncio.create_task(self.decoder.run())
+        try:
+            result = await replay_feed(paths, self.decoder.submit, speed=speed)
+            await self.decoder.drain()
+            result.update(self.decoder.stats)
+            print(f"[REPLAY] decoder stats: {self.decoder.stats}")
+            return result
+        finally:
+            decoder_task.cancel()
+
+
+    async def _route_bar(self, instrument: str, bar: dict) -> None:
+        """
+        called by the decoder, in receive order, for every decoded bar.
+        only forwards bars of a minute newer than the last one sent
+        """
+        ts = int(bar.get("ts"))
+        if ts > self.current_ts[instrument]:
+            await self.queues[instrument].put(bar)
+            self.current_ts[instrument] = ts
+
+
+    async def _connect_loop(self, ssl_context, instruments: list[str], shard_id: int = 0):
+        """
+        websocket connection for one shard with its own reconnect logic,
+        frames are handed to the decoder untouched
+        """
         while True:
             try:
-                response = get_market_data_feed_authorize_v3(ACCESS_TOKEN)
+                # async + cached, a reconnect never blocks the loop on HTTPS
+                ws_url = await self.authorizer.get_uri()
 
                 async with websockets.connect(
-                    response["data"]["authorized_redirect_uri"],
+                    ws_url,
                     ssl=ssl_context
                 ) as websocket:
 
-                    print(f'Connection established for {len(self.instruments)} instruments')
+                    print(f'[SHARD-{shard_id}] Connection established for {len(instruments)} instruments')
                     await asyncio.sleep(1)
 
                     data = {
@@ -82,7 +281,7 @@ class MarketAdapter:
                         "method": "sub",
                         "data": {
                             "mode": "full",
-                            "instrumentKeys": self.instruments
+                            "instrumentKeys": instruments
                         }
                     }
 
@@ -91,46 +290,17 @@ class MarketAdapter:
                     while True:
                         try:
                             message = await websocket.recv()
-                            decoded_data = decode_protobuf(message)
-                            data_dict = MessageToDict(decoded_data)
-
-                            if data_dict.get("type") != "live_feed":
-                                continue
-
-                            for instrument in self.instruments:
-                                feed = data_dict.get("feeds", {}).get(instrument)
-                                if not feed:
-                                    continue
-
-                                instrument_type = "equity" if "NSE_EQ" in instrument else "index"
-                                ohlc_path = feed.get("fullFeed", {}).get("marketFF" if instrument_type == "equity" else "indexFF", {}).get("marketOHLC", {}).get("ohlc")
-                                
-                                if not ohlc_path or len(ohlc_path) < 2:
-                                    continue
-                                
-                                minute = ohlc_path[1]
-
-                                if int(minute.get("ts")) > self.current_ts[instrument]:
-                                    current_minute_data = {
-                                        "ts": minute.get("ts"),
-                                        "open": minute.get("open", 0),
-                                        "high": minute.get("high", 0),
-                                        "low": minute.get("low", 0),
-                                        "close": minute.get("close", 0),
-                                    }
-                                    if instrument_type == "equity":
-                                        current_minute_data["volume"] = int(minute.get("vol", 0))
-                                    
-                                    await self.queues[instrument].put(current_minute_data)
-                                    self.current_ts[instrument] = int(minute.get("ts"))
+                            if self.recorder:
+                                self.recorder.write(message)
+                            self.decoder.submit(message)
 
                         except Exception as inner:
-                            print(f"[INNER-FETCH] Unhandled error: {inner}")
+                            print(f"[INNER-FETCH][SHARD-{shard_id}] Unhandled error: {inner}")
                             await asyncio.sleep(1)
                             break
 
             except Exception as outer:
-                print(f"[OUTER-FETCH] Loop crash: {outer}")
+                print(f"[OUTER-FETCH][SHARD-{shard_id}] Loop crash: {outer}")
                 await asyncio.sleep(2)
                 continue
 
@@ -155,7 +325,7 @@ class MarketAdapter:
         instrument_states = {}
         for instrument in self.instruments:
             # Assign a different starting price to each instrument for variety
-            base_price = 1000 + (hash(instrument) % 1500)
+            base_price = dummy_base_price(instrument)
             instrument_states[instrument] = {
                 "px": base_price,
                 "last_close": base_price,
@@ -205,6 +375,7 @@ class MarketAdapter:
                 state["last_close"] = close_price
 
                 # --- Put the bar into the correct instrument's queue ---
+                stamp(ohlc, "recv")
                 await self.queues[instrument].put(ohlc)
             
             # Wait 1 second to simulate the next minute's bars arriving
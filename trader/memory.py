@@ -0,0 +1,140 @@
+"""
+bounded runtime buffers and a memory report
+
+`DownsampledSeries` keeps a long-running time series in fixed
+memory: once full, it halves its resolution instead of growing, so
+a multi-day session is still plotted end to end.
+
+`memory_report(structures)` measures the deep size of named
+structures; the trader prints one on SIGUSR1 (`kill -USR1 <pid>`)
+"""
+
+import sys
+from collections import deque
+from types import MappingProxyType
+import numpy as np # type: ignore
+
+
+class DownsampledSeries:
+    """
+    list-like series capped at `capacity` points, always spanning
+    the whole session. each point holds the latest value of a slot
+    of `stride` appends; when full, the stride doubles and every
+    second point is dropped (the newest one is always kept)
+    """
+    def __init__(self, capacity: int = 1000, values=()):
+        self.capacity = max(4, capacity)
+        self.values: list = []
+        self.stride = 1
+        self._in_slot = 0
+        self.extend(values)
+
+
+    def append(self, value) -> None:
+        if self._in_slot == 0:
+            self.values.append(value)
+        else:
+            self.values[-1] = value
+        self._in_slot = (self._in_slot + 1) % self.stride
+
+        if len(self.values) > self.capacity:
+            self.values = self.values[::-1][::2][::-1]
+            self.stride *= 2
+            self._in_slot = 1
+
+
+    def extend(self, values) -> None:
+        for value in values:
+            self.append(value)
+
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+
+    def get_state(self) -> dict:
+        return {"values": list(self.values), "stride": self.stride, "in_slot": self._in_slot}
+
+
+    def set_state(self, state) -> None:
+        """
+        also accepts a plain list (older snapshots)
+        """
+        self.values, self.stride, self._in_slot = [], 1, 0
+        if isinstance(state, dict):
+            self.values = list(state["values"])
+            self.stride = state["stride"]
+            self._in_slot = state["in_slot"]
+        else:
+            self.extend(state)
+
+
+def deep_sizeof(obj, _seen: set | None = None) -> int:
+    """
+    approximate bytes held by obj and everything it references
+    (containers, numpy buffers, object __dict__ / __slots__).
+    pass plain buffers, not objects holding an event loop or futures
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # includes the data buffer when the array owns it
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, (dict, MappingProxyType)):
+        for k, v in obj.items():
+            size += deep_sizeof(k, seen) + deep_sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for name in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def _length(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def memory_report(structures: dict) -> list[dict]:
+    """
+    structures: name -> object. rows sorted by size, largest first
+    """
+    rows = [
+        {"name": name, "items": _length(obj), "bytes": deep_sizeof(obj)}
+        for name, obj in structures.items()
+    ]
+    rows.sort(key=lambda r: r["bytes"], reverse=True)
+    return rows
+
+
+def print_memory_report(structures: dict) -> list[dict]:
+    rows = memory_report(structures)
+    print("\n--- MEMORY ---")
+    for r in rows:
+        items = "" if r["items"] is None else f"{r['items']:>8} items"
+        print(f"{r['name']:<28} {r['bytes'] / 1024:>10.1f} KiB {items}")
+    print(f"{'total':<28} {sum(r['bytes'] for r in rows) / 1024:>10.1f} KiB")
+    print("--------------\n")
+    return rows
@@ -0,0 +1,220 @@
+"""
+async order gateway
+
+strategy coroutines hand orders to the gateway and move on;
+the gateway batches everything submitted within one tick,
+respects the broker's rate limit and tracks acknowledgements
+and fills. `SimulatedBroker` is an in-process stand-in for
+paper trading and benchmarks.
+"""
+
+import asyncio
+import itertools
+import time
+from latency import LatencyHistogram
+
+
+class RateLimiter:
+    """
+    token bucket: `rate` orders per second, bursts up to `burst`
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    async def acquire(self, n: int) -> int:
+        """
+        waits until at least one token is free, takes up to n,
+        returns how many were granted
+        """
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                granted = min(n, int(self.tokens))
+                self.tokens -= granted
+                return granted
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SimulatedBroker:
+    """
+    in-process broker: acks every order after `ack_delay`,
+    fills market orders at their reference price after `fill_delay`
+    """
+    def __init__(self, ack_delay: float = 0.002, fill_delay: float = 0.005, rate_limit: float = 10.0, burst: int = 20):
+        self.ack_delay = ack_delay
+        self.fill_delay = fill_delay
+        # advertised limits, the gateway reads them
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self._ids = itertools.count(1)
+
+
+    async def submit_batch(self, orders: list[dict]) -> list[dict]:
+        """
+        one round trip for the whole batch, returns one ack per order
+        """
+        await asyncio.sleep(self.ack_delay)
+        return [
+            {"client_order_id": o["client_order_id"], "broker_order_id": f"SIM-{next(self._ids)}", "status": "ACK"}
+            for o in orders
+        ]
+
+
+    async def fills(self, orders: list[dict]) -> list[dict]:
+        await asyncio.sleep(self.fill_delay)
+        return [
+            {"client_order_id": o["client_order_id"], "fill_price": o.get("price"), "fill_qty": o["qty"], "status": "FILLED"}
+            for o in orders
+        ]
+
+
+class OrderGateway:
+    """
+    - submit(order) is non-blocking and returns a future resolving to the ack
+    - every order submitted during one loop iteration goes out as one batch,
+      split further only by `max_batch` and the rate limiter
+    - `orders` keeps the latest state of each order (NEW, ACK, FILLED, REJECTED);
+      past `max_orders`, the oldest finished orders are forgotten
+    """
+    def __init__(self, broker, max_batch: int = 50, on_fill=None, max_orders: int = 10000):
+        self.broker = broker
+        self.max_batch = max_batch
+        self.max_orders = max_orders
+        self.on_fill = on_fill
+        self.limiter = RateLimiter(broker.rate_limit, broker.burst)
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.orders: dict[str, dict] = {}
+        self._acks: dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self.ack_latency = LatencyHistogram()
+        self._background: set = set()
+
+
+    def submit(self, instrument: str, side: str, qty: int, price: float | None = None, tag: str = "") -> asyncio.Future:
+        client_order_id = f"ORD-{next(self._ids)}"
+        order = {
+            "client_order_id": client_order_id,
+            "instrument": instrument,
+            "side": side,
+            "qty": qty,
+            "price": price,
+            "type": "MARKET",
+            "tag": tag,
+            "status": "NEW",
+            "submitted_ns": time.monotonic_ns(),
+        }
+        future = asyncio.get_running_loop().create_future()
+        self.orders[client_order_id] = order
+        self._acks[client_order_id] = future
+        self.queue.put_nowait(order)
+        return future
+
+
+    async def _next_batch(self) -> list[dict]:
+        batch = [await self.queue.get()]
+        # everything else submitted in the same tick rides along
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+
+    async def _send(self, batch: list[dict]):
+        try:
+            acks = await self.broker.submit_batch(batch)
+        except Exception as e:
+            print(f"[GATEWAY] Batch of {len(batch)} orders rejected: {e}")
+            for order in batch:
+                order["status"] = "REJECTED"
+                future = self._acks.pop(order["client_order_id"], None)
+                if future and not future.done():
+                    future.set_exception(e)
+            self._prune()
+            return
+
+        now = time.monotonic_ns()
+        for ack in acks:
+            order = self.orders[ack["client_order_id"]]
+            order.update(status="ACK", broker_order_id=ack["broker_order_id"])
+            self.ack_latency.record((now - order["submitted_ns"]) // 1000)
+            future = self._acks.pop(ack["client_order_id"], None)
+            if future and not future.done():
+                future.set_result(ack)
+
+        for fill in await self.broker.fills(batch):
+            order = self.orders[fill["client_order_id"]]
+            order.update(status="FILLED", fill_price=fill["fill_price"], fill_qty=fill["fill_qty"])
+            if self.on_fill:
+                self.on_fill(order)
+
+        self._prune()
+
+
+    def _prune(self):
+        if len(self.orders) <= self.max_orders:
+            return
+        # dicts keep submission order, so the oldest come first
+        excess = len(self.orders) - self.max_orders
+        for client_order_id in [
+            oid for oid, o in self.orders.items() if o["status"] in ("FILLED", "REJECTED")
+        ][:excess]:
+            del self.orders[client_order_id]
+
+
+    async def run(self):
+        """
+        sender loop, runs until cancelled
+        """
+        while True:
+            batch = await self._next_batch()
+            while batch:
+                granted = await self.limiter.acquire(len(batch))
+                chunk, batch = batch[:granted], batch[granted:]
+                # acks and fills are awaited in the background so the
+                # next tick's batch is not held up by this round trip
+                task = asyncio.create_task(self._send(chunk))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+
+async def benchmark(n_orders: int = 10000, rate_limit: float = 1e6, burst: int = 1000, per_tick: int = 20) -> dict:
+    """
+    orders/sec and ack latency against the simulated broker,
+    lower rate_limit to see the throttle take over
+    """
+    broker = SimulatedBroker(ack_delay=0.001, fill_delay=0.001, rate_limit=rate_limit, burst=burst)
+    gateway = OrderGateway(broker, max_batch=burst)
+    sender = asyncio.create_task(gateway.run())
+
+    started = time.monotonic()
+    futures = []
+    for i in range(n_orders):
+        futures.append(gateway.submit("SIM|BENCH", "BUY", 1, price=100.0))
+        if i % per_tick == per_tick - 1:
+            await asyncio.sleep(0)  # next tick
+    await asyncio.gather(*futures)
+    elapsed = time.monotonic() - started
+    sender.cancel()
+
+    result = {
+        "orders": n_orders,
+        "elapsed_s": round(elapsed, 3),
+        "orders_per_s": round(n_orders / elapsed),
+        "ack_latency_us": gateway.ack_latency.summary(),
+    }
+    print(f"[GATEWAY-BENCH] {result}")
+    return result
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
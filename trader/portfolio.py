@@ -0,0 +1,337 @@
+"""
+single-writer portfolio state
+
+one actor task owns positions, latest prices and realized pnl.
+everything else sends it commands over a queue and reads the
+immutable snapshot it publishes after every batch of commands
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from types import MappingProxyType
+from latency import LATENCY
+from position_book import PositionBook
+
+
+class Portfolio:
+    """
+    portfolio actor
+
+    commands (all non-blocking for the caller):
+    - open(instrument, params, stamps): record a new position
+    - close(instrument, bar, reason)  : exit a position and log the trade
+    - mark(instrument, bar)           : mark-to-market with the latest bar
+    - await request_snapshot()        : snapshot after every earlier command is applied
+    - await export_state()            : full mutable state copy, for persistence
+
+    with a `gateway`, the order behind an open or close is submitted by
+    the actor once it has accepted the command, so an ignored entry or a
+    close of a position that is already gone never reaches the broker
+
+    `snapshot` can be read at any time without locking, it is
+    replaced (never mutated) by the actor.
+    """
+    def __init__(self, initial_capital: float, trades_path: str = "trades.json", on_trade=None, max_trades: int = 1000, gateway=None):
+        """
+        on_trade: optional callable getting every new trade record
+        (entries and exits), e.g. TradeSink.emit
+        gateway: optional OrderGateway the accepted orders go to
+        max_trades: recent trades kept in memory (and in snapshots);
+        the full log is only on disk
+        """
+        self.initial_capital = initial_capital
+        self.trades_path = trades_path
+        self.on_trade = on_trade
+        self.gateway = gateway
+
+        self.peak_portfolio_value = initial_capital
+        self.total_realized_pnl = 0.0
+
+        # owned by the actor, never touched from outside
+        self._positions: dict = {}
+        self._book = PositionBook()  # column mirror of _positions for vectorized exits
+        self._latest_prices: dict = {}
+        self._trades: deque = deque(maxlen=max_trades)
+        self._unwritten: list = []  # trades not yet appended to trades_path
+        self._trades_dirty = asyncio.Event()
+
+        self.commands: asyncio.Queue = asyncio.Queue()
+        self.snapshot = self._build_snapshot()
+
+
+    ''' command API '''
+    def open(self, instrument: str, params: dict, stamps: dict | None = None) -> None:
+        """
+        stamps: pipeline timestamps of the bar behind the entry, the
+        recv -> recorded latency is taken once the position is applied
+        """
+        self.commands.put_nowait(("open", instrument, (params, stamps)))
+
+    def close(self, instrument: str, exit_bar: dict, reason: str = "") -> None:
+        self.commands.put_nowait(("close", instrument, (exit_bar, reason)))
+
+    def mark(self, instrument: str, bar: dict) -> None:
+        self.commands.put_nowait(("mark", instrument, bar))
+
+    async def request_snapshot(self):
+        future = asyncio.get_running_loop().create_future()
+        self.commands.put_nowait(("snapshot", None, future))
+        return await future
+
+    async def export_state(self) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.commands.put_nowait(("export", None, future))
+        return await future
+
+    def set_state(self, state: dict) -> None:
+        """
+        restore, only valid before `run` is started
+        """
+        self._positions = {k: dict(v) for k, v in state["positions"].items()}
+        self._book.clear()
+        for instrument, pos in self._positions.items():
+            self._book.add(instrument, pos)
+        self._latest_prices = dict(state["latest_prices"])
+        self._trades.clear()
+        self._trades.extend(state["trades"])
+        self.total_realized_pnl = state["total_realized_pnl"]
+        self.peak_portfolio_value = state["peak_portfolio_value"]
+        self.snapshot = self._build_snapshot()
+
+
+    ''' actor internals '''
+    def _apply_open(self, instrument, params, stamps=None):
+        if instrument in self._positions:
+            print(f"[PORTFOLIO] {instrument} already has an open position, entry ignored.")
+            return False
+
+        if stamps:
+            stamps = dict(stamps, recorded=time.monotonic_ns())
+            LATENCY.observe_stage(instrument, stamps, "recorded")
+
+        params = dict(params)
+        params["instrument"] = instrument
+        self._positions[instrument] = params
+        self._book.add(instrument, params)
+        self._record_trade(params)
+        self._submit(instrument, params["side"], params["size"], params["entry"], "ENTRY")
+        return True
+
+    def _apply_close(self, instrument, exit_bar, reason):
+        pos = self._positions.pop(instrument, None)
+        if pos is None:
+            return False
+        self._book.remove(instrument)
+
+        print(f"[{instrument}] {reason} EXIT triggered -> {pos}\n")
+        exit_side = "SELL" if pos["side"] == "BUY" else "BUY"
+        self._submit(instrument, exit_side, pos["size"], exit_bar.get("close"), f"EXIT-{reason}")
+
+        entry_price = pos["entry"]
+        size = pos["size"]
+        side = pos["side"]
+        exit_price = exit_bar.get("close", pos["entry"])
+
+        if reason == "TARGET":
+            exit_price = pos["target"]
+        elif reason == "STOP":
+            exit_price = pos["stop"]
+
+        if side == "BUY":
+            pnl = (exit_price - entry_price) * size
+        else: # SELL
+            pnl = (entry_price - exit_price) * size
+
+        self.total_realized_pnl += pnl
+
+        self._record_trade({
+            "instrument": instrument,
+            "side": side,
+            "entry": entry_price,
+            "exit_price": exit_price,
+            "pnl": round(pnl, 2),
+            "realized_pnl": round(self.total_realized_pnl, 2),
+            "reason": reason,
+            "target": pos["target"],
+            "stop": pos["stop"],
+            "size": size,
+            "ts_entry": pos['ts'],
+            "ts_exit": exit_bar["ts"],
+            "trade_duration" : (int(exit_bar['ts']) - int(pos['ts'])) / 1000,
+            "type": "EXIT"
+        })
+        return True
+
+    def _submit(self, instrument, side, size, price, tag):
+        if self.gateway is None:
+            return
+        ack = self.gateway.submit(instrument, side, size, price=price, tag=tag)
+        ack.add_done_callback(self._on_ack)
+
+    @staticmethod
+    def _on_ack(ack):
+        # the gateway marks the order REJECTED, the exception is only logged
+        if not ack.cancelled() and ack.exception() is not None:
+            print(f"[PORTFOLIO] Order rejected: {ack.exception()}")
+
+    def _record_trade(self, record):
+        self._trades.append(record)
+        self._unwritten.append(record)
+        if self.on_trade:
+            self.on_trade(record)
+
+    def _build_snapshot(self):
+        """
+        comprehensive, read-only view of the current portfolio state
+        """
+        open_positions_list = []
+        total_market_value = 0
+        total_unrealized_pnl = 0
+
+        for instr, pos in self._positions.items():
+            current_price = self._latest_prices.get(instr, {}).get("close", pos["entry"])
+            market_value = pos["size"] * current_price
+
+            if pos["side"] == "BUY":
+                unrealized_pnl = (current_price - pos["entry"]) * pos["size"]
+            else: # SELL
+                unrealized_pnl = (pos["entry"] - current_price) * pos["size"]
+
+            total_market_value += market_value
+            total_unrealized_pnl += unrealized_pnl
+            open_positions_list.append({ "instrument": instr, "side": pos["side"], "size": pos["size"] })
+
+        current_portfolio_value = self.initial_capital + self.total_realized_pnl + total_unrealized_pnl
+        self.peak_portfolio_value = max(self.peak_portfolio_value, current_portfolio_value)
+
+        drawdown_pct = (self.peak_portfolio_value - current_portfolio_value) / self.peak_portfolio_value if self.peak_portfolio_value > 0 else 0
+        leverage = total_market_value / current_portfolio_value if current_portfolio_value > 0 else 0
+
+        return MappingProxyType({
+            "current_portfolio_value": current_portfolio_value,
+            "peak_portfolio_value": self.peak_portfolio_value,
+            "portfolio_drawdown_pct": drawdown_pct,
+            "total_positions_value": total_market_value,
+            "total_realized_pnl": self.total_realized_pnl,
+            "total_unrealized_pnl": total_unrealized_pnl,
+            "open_positions_count": len(self._positions),
+            "leverage": leverage,
+            "open_positions": tuple(open_positions_list),
+            "positions": MappingProxyType({k: MappingProxyType(dict(v)) for k, v in self._positions.items()}),
+            "latest_prices": MappingProxyType(dict(self._latest_prices)),
+            "book": self._book.view(),
+        })
+
+    def _get_state(self) -> dict:
+        strip = lambda bar: {k: v for k, v in bar.items() if not k.startswith("_")}
+        return {
+            "positions": {k: dict(v) for k, v in self._positions.items()},
+            "latest_prices": {k: strip(v) for k, v in self._latest_prices.items()},
+            "trades": list(self._trades),  # the most recent max_trades only
+            "total_realized_pnl": self.total_realized_pnl,
+            "peak_portfolio_value": self.peak_portfolio_value,
+        }
+
+    def _append_trades_sync(self, trades):
+        """
+        appends to the JSON array in trades_path in place, so the
+        cost of a write does not grow with the session's trade count
+        """
+        items = ",\n".join(
+            "    " + json.dumps(t, indent=4).replace("\n", "\n    ") for t in trades
+        )
+
+        def last_char(file, pos):
+            # (position, byte) of the last non-whitespace byte before pos
+            while pos > 0:
+                file.seek(pos - 1)
+                ch = file.read(1)
+                if not ch.isspace():
+                    return pos - 1, ch
+                pos -= 1
+            return -1, b""
+
+        mode = "r+b" if os.path.exists(self.trades_path) else "w+b"
+        with open(self.trades_path, mode) as file:
+            close_pos, ch = last_char(file, file.seek(0, os.SEEK_END))
+            if close_pos < 0:
+                file.write(("[\n" + items + "\n]").encode())
+                return
+            if ch != b"]":
+                raise ValueError(f"{self.trades_path} does not end with a JSON array")
+
+            before_pos, before = last_char(file, close_pos)
+            file.seek(before_pos + 1)
+            file.truncate()
+            file.write((("\n" if before == b"[" else ",\n") + items + "\n]").encode())
+
+    async def _trade_writer(self):
+        """
+        appends trades to trades_path off the command loop, so a
+        slow disk never holds up the next batch of commands
+        """
+        while True:
+            await self._trades_dirty.wait()
+            self._trades_dirty.clear()
+            trades, self._unwritten = self._unwritten, []
+            try:
+                await asyncio.to_thread(self._append_trades_sync, trades)
+            except Exception as e:
+                print(f"[PORTFOLIO] Failed to persist trades: {e}")
+                # kept for the next write
+                self._unwritten = trades + self._unwritten
+
+    async def run(self):
+        """
+        drains every queued command, applies them as one batch,
+        then publishes a single snapshot; trades are persisted by
+        a writer task alongside
+        """
+        writer = asyncio.create_task(self._trade_writer())
+        try:
+            while True:
+                await self._run_batch()
+        finally:
+            writer.cancel()
+
+    async def _run_batch(self):
+        batch = [await self.commands.get()]
+        while not self.commands.empty():
+            batch.append(self.commands.get_nowait())
+
+        waiters = []
+        exports = []
+        trades_dirty = False
+
+        for kind, instrument, payload in batch:
+            try:
+                if kind == "open":
+                    trades_dirty |= self._apply_open(instrument, *payload)
+                elif kind == "close":
+                    trades_dirty |= self._apply_close(instrument, *payload)
+                elif kind == "mark":
+                    self._latest_prices[instrument] = payload
+                elif kind == "snapshot":
+                    waiters.append(payload)
+                elif kind == "export":
+                    exports.append(payload)
+            except Exception as e:
+                print(f"[PORTFOLIO] Error applying {kind} for {instrument}: {e}")
+
+        self.snapshot = self._build_snapshot()
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(self.snapshot)
+
+        if exports:
+            state = self._get_state()
+            for future in exports:
+                if not future.done():
+                    future.set_result(state)
+
+        if trades_dirty:
+            self._trades_dirty.set()
@@ -0,0 +1,141 @@
+"""
+array-backed book of open positions
+
+side / stop / target / size / entry live in preallocated numpy
+columns, with a dict from instrument to row. stop and target hits
+for every position with a new bar are found in one vectorized pass,
+with the same precedence as before: STOP wins over TARGET. only
+bars after a position's entry bar count towards its exits.
+"""
+
+from typing import NamedTuple
+import numpy as np # type: ignore
+from bar_queue import bar_extremes
+
+
+NO_EXIT, STOP, TARGET = 0, 1, 2
+REASONS = {STOP: "STOP", TARGET: "TARGET"}
+
+
+class BookView(NamedTuple):
+    """
+    read-only copy of the book, safe to publish in snapshots
+    """
+    index: dict
+    side: np.ndarray
+    stop: np.ndarray
+    target: np.ndarray
+    size: np.ndarray
+    entry: np.ndarray
+    entry_ts: np.ndarray
+    active: np.ndarray
+
+
+class PositionBook:
+    def __init__(self, capacity: int = 64):
+        self.index: dict[str, int] = {}
+        self._free: list[int] = []
+        self._alloc(capacity)
+
+
+    def _alloc(self, capacity: int):
+        old = getattr(self, "side", None)
+        n_old = 0 if old is None else len(old)
+
+        def grow(name, dtype):
+            col = np.zeros(capacity, dtype=dtype)
+            if n_old:
+                col[:n_old] = getattr(self, name)
+            setattr(self, name, col)
+
+        grow("side", np.int8)       # +1 BUY, -1 SELL
+        grow("stop", np.float64)
+        grow("target", np.float64)
+        grow("size", np.float64)
+        grow("entry", np.float64)
+        grow("entry_ts", np.int64)  # ts (ms) of the entry bar
+        grow("active", np.bool_)
+        self._free.extend(range(capacity - 1, n_old - 1, -1))
+
+
+    def add(self, instrument: str, pos: dict) -> None:
+        if instrument in self.index:
+            self.remove(instrument)
+        if not self._free:
+            self._alloc(len(self.side) * 2)
+
+        row = self._free.pop()
+        self.index[instrument] = row
+        self.side[row] = 1 if pos["side"] == "BUY" else -1
+        self.stop[row] = pos["stop"]
+        self.target[row] = pos["target"]
+        self.size[row] = pos["size"]
+        self.entry[row] = pos["entry"]
+        self.entry_ts[row] = int(pos.get("ts", 0))
+        self.active[row] = True
+
+
+    def remove(self, instrument: str) -> None:
+        row = self.index.pop(instrument, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self._free.append(row)
+
+
+    def clear(self) -> None:
+        for instrument in list(self.index):
+            self.remove(instrument)
+
+
+    def view(self) -> BookView:
+        def frozen(col):
+            col = col.copy()
+            col.setflags(write=False)
+            return col
+
+        return BookView(
+            dict(self.index),
+            frozen(self.side), frozen(self.stop), frozen(self.target),
+            frozen(self.size), frozen(self.entry), frozen(self.entry_ts), frozen(self.active),
+        )
+
+
+def find_exits(book: BookView, bars: dict) -> list[tuple[str, str]]:
+    """
+    bars: instrument -> bar with the latest high/low, possibly merged
+    (see bar_queue.merge_bars). only the extremes of bars after the
+    position's entry bar are compared.
+    returns (instrument, "STOP" | "TARGET") for every position hit
+    """
+    rows, highs, lows, names = [], [], [], []
+    for instrument, bar in bars.items():
+        row = book.index.get(instrument)
+        if row is None:
+            continue
+        entry_ts = book.entry_ts[row]
+        after = [(high, low) for ts, high, low in bar_extremes(bar) if ts > entry_ts]
+        if not after:
+            continue
+        rows.append(row)
+        highs.append(max(high for high, _ in after))
+        lows.append(min(low for _, low in after))
+        names.append(instrument)
+
+    if not rows:
+        return []
+
+    rows = np.asarray(rows)
+    high = np.asarray(highs, dtype=np.float64)
+    low = np.asarray(lows, dtype=np.float64)
+
+    is_buy = book.side[rows] == 1
+    stop, target = book.stop[rows], book.target[rows]
+
+    stop_hit = np.where(is_buy, low <= stop, high >= stop)
+    target_hit = np.where(is_buy, high >= target, low <= target)
+
+    reason = np.where(stop_hit, STOP, np.where(target_hit, TARGET, NO_EXIT))
+    reason[~book.active[rows]] = NO_EXIT
+
+    return [(names[i], REASONS[int(reason[i])]) for i in np.flatnonzero(reason)]
@@ -0,0 +1,267 @@
+"""
+shared-memory price board and intent rings
+
+the adapter process appends every bar of an instrument to that
+instrument's ring of `depth` slots in a shared-memory table; strategy
+worker processes read the bars they have not seen yet in place, in
+order. signals travel back to the portfolio / risk process through
+one single-producer ring per worker. both are plain numpy views over
+`multiprocessing.shared_memory`, nothing is pickled once the segments
+exist.
+
+every instrument has a published bar count; bar n goes to slot
+n % depth. slots are guarded by a sequence number (seqlock): 2n + 1
+while bar n is being written, 2n + 2 once it is complete. a reader
+more than `depth` bars behind, or lapped while copying a slot, skips
+the overwritten bars and counts them.
+"""
+
+import os
+import select
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np # type: ignore
+
+
+BAR_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("recv_ns", "<i8"),
+])
+
+INTENT_DTYPE = np.dtype([
+    ("instrument", "<i4"),
+    ("strategy", "<i4"),
+    ("signal", "<i4"),
+    ("ts", "<i8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("atr", "<f8"),
+    ("avg_volume", "<f8"),
+    ("recv_ns", "<i8"),
+    ("signal_ns", "<i8"),
+])
+
+RING_HEADER = np.dtype([("head", "<u8"), ("tail", "<u8")])
+
+
+class PriceBoard:
+    """
+    one bar ring per instrument, in the order of `instruments`.
+    create it in the writer (`PriceBoard.create`), attach to it by
+    name in readers (`PriceBoard.attach`, with the same `depth`)
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, instruments: list[str], depth: int, owner: bool):
+        self.shm = shm
+        self.instruments = list(instruments)
+        self.index = {instrument: i for i, instrument in enumerate(self.instruments)}
+        self.depth = depth
+        n = len(self.instruments)
+        self.counts = np.ndarray((n,), dtype="<u8", buffer=shm.buf)
+        self.rows = np.ndarray((n, depth), dtype=BAR_DTYPE, buffer=shm.buf, offset=8 * n)
+        self.owner = owner
+
+
+    @classmethod
+    def create(cls, instruments: list[str], depth: int = 256) -> "PriceBoard":
+        n = len(instruments)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, n * (8 + depth * BAR_DTYPE.itemsize)))
+        board = cls(shm, instruments, depth, owner=True)
+        board.counts[:] = 0
+        board.rows[:] = np.zeros((n, depth), dtype=BAR_DTYPE)
+        return board
+
+
+    @classmethod
+    def attach(cls, name: str, instruments: list[str], depth: int = 256) -> "PriceBoard":
+        return cls(shared_memory.SharedMemory(name=name), instruments, depth, owner=False)
+
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+
+    def write(self, instrument: str, bar: dict) -> None:
+        """
+        single writer per board
+        """
+        i = self.index[instrument]
+        n = int(self.counts[i])
+        slot = n % self.depth
+        row = self.rows[i, slot]
+        self.rows["seq"][i, slot] = 2 * n + 1
+        row["ts"] = int(bar["ts"])
+        row["open"] = bar["open"]
+        row["high"] = bar["high"]
+        row["low"] = bar["low"]
+        row["close"] = bar["close"]
+        row["volume"] = bar.get("volume", 0)
+        row["recv_ns"] = bar.get("_stamps", {}).get("recv", 0)
+        self.rows["seq"][i, slot] = 2 * n + 2
+        # publish only once the slot is fully written
+        self.counts[i] = n + 1
+
+
+    def count(self, i: int) -> int:
+        """
+        bars published so far for instrument row i
+        """
+        return int(self.counts[i])
+
+
+    def read_since(self, i: int, seen: int) -> tuple[list, int, int]:
+        """
+        bars of instrument row i after the first `seen`, oldest first:
+        -> (records, new seen count, bars skipped because they were
+        overwritten before they could be read)
+        """
+        count = int(self.counts[i])
+        start = max(seen, count - self.depth)
+        records = []
+        for n in range(start, count):
+            slot = n % self.depth
+            record = self.rows[i, slot].copy()
+            if int(record["seq"]) != 2 * n + 2 or int(self.rows["seq"][i, slot]) != 2 * n + 2:
+                continue  # lapped by the writer while copying
+            records.append(record)
+        return records, count, count - seen - len(records)
+
+
+    def close(self) -> None:
+        # views must go before the mapping can be closed
+        self.counts = self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def record_to_bar(record) -> dict:
+    """
+    board row back to the bar dicts used everywhere else
+    """
+    return {
+        "ts": str(int(record["ts"])),
+        "open": float(record["open"]),
+        "high": float(record["high"]),
+        "low": float(record["low"]),
+        "close": float(record["close"]),
+        "volume": float(record["volume"]),
+        "_stamps": {"recv": int(record["recv_ns"])},
+    }
+
+
+class IntentRing:
+    """
+    fixed-size single-producer / single-consumer ring of intents.
+    the producer only moves `head`, the consumer only moves `tail`;
+    a full ring drops the new intent and counts it
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self.shm = shm
+        self.capacity = capacity
+        self.header = np.ndarray((1,), dtype=RING_HEADER, buffer=shm.buf)
+        self.slots = np.ndarray((capacity,), dtype=INTENT_DTYPE, buffer=shm.buf, offset=RING_HEADER.itemsize)
+        self.owner = owner
+        self.dropped = 0
+
+
+    @classmethod
+    def create(cls, capacity: int = 1024) -> "IntentRing":
+        shm = shared_memory.SharedMemory(create=True, size=RING_HEADER.itemsize + capacity * INTENT_DTYPE.itemsize)
+        ring = cls(shm, capacity, owner=True)
+        ring.header[0] = (0, 0)
+        return ring
+
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "IntentRing":
+        return cls(shared_memory.SharedMemory(name=name), capacity, owner=False)
+
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+
+    def push(self, instrument: int, strategy: int, signal: int, record, features: dict) -> bool:
+        head = int(self.header["head"][0])
+        if head - int(self.header["tail"][0]) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.slots[head % self.capacity] = (
+            instrument, strategy, signal,
+            record["ts"], record["close"], record["volume"],
+            features["atr"] or 0.0, features["avg_volume"],
+            record["recv_ns"], time.monotonic_ns(),
+        )
+        # publish only once the slot is fully written
+        self.header["head"][0] = head + 1
+        return True
+
+
+    def pop_all(self) -> list:
+        head = int(self.header["head"][0])
+        tail = int(self.header["tail"][0])
+        out = [self.slots[i % self.capacity].copy() for i in range(tail, head)]
+        self.header["tail"][0] = head
+        return out
+
+
+    def close(self) -> None:
+        self.header = self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class Doorbell:
+    """
+    cross-process wakeup over a pipe, so neither side polls.
+    `ring()` never blocks: a full pipe already means a wakeup is
+    pending. the reader waits with `wait(timeout)` (or watches
+    `fileno()` from an event loop) and drains with `clear()`.
+    can be passed to spawn processes
+    """
+    def __init__(self):
+        self._reader, self._writer = mp.Pipe(duplex=False)
+        # O_NONBLOCK is shared with the copies the children get
+        os.set_blocking(self._reader.fileno(), False)
+        os.set_blocking(self._writer.fileno(), False)
+
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+
+    def ring(self) -> None:
+        try:
+            os.write(self._writer.fileno(), b"\0")
+        except BlockingIOError:
+            pass
+
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        True once rung, False on timeout; does not clear
+        """
+        return bool(select.select([self._reader.fileno()], [], [], timeout)[0])
+
+
+    def clear(self) -> None:
+        try:
+            while os.read(self._reader.fileno(), 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
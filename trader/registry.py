@@ -0,0 +1,191 @@
+"""
+multi-strategy registry
+
+any number of strategies subscribe to one instrument stream.
+indicators they share (SMA windows, ATR, average volume) are
+computed once per bar by the instrument's IndicatorSet and the
+resulting features are fanned out to every subscriber.
+"""
+
+import random
+import zlib
+from collections import defaultdict, deque
+
+
+def dummy_base_price(instrument: str) -> float:
+    """
+    starting price of an instrument in the simulated pipeline, shared by
+    dummy_fetch and dummy_prime (crc32: the same in every process)
+    """
+    return 1000 + zlib.crc32(instrument.encode()) % 1500
+
+
+class IndicatorSet:
+    """
+    incremental indicators for one instrument
+
+    features returned by `update(bar)`:
+        sma / prev_sma : {period: value or None}, current and previous bar
+        atr            : average true range over the last `atr_period` bars
+        avg_volume     : average of the last `volume_period` non-zero volumes
+
+    every buffer is bounded for the whole session: `closes` holds the
+    longest SMA window and nothing more, true ranges and volumes their
+    own windows
+    """
+    def __init__(self, instrument: str, atr_period: int = 14, volume_period: int = 20):
+        self.instrument = instrument
+        self.sma_periods: set[int] = set()
+        self.closes: deque = deque(maxlen=1)  # maxlen follows the longest SMA window
+        self.sma: dict[int, float | None] = {}
+
+        self.atr_period = atr_period
+        self.volume_period = volume_period
+        self.prev_close = None
+        self.true_ranges: deque = deque(maxlen=atr_period)
+        self.volumes: deque = deque(maxlen=volume_period)
+
+
+    def require_sma(self, period: int) -> None:
+        if period in self.sma_periods:
+            return
+        self.sma_periods.add(period)
+        self.closes = deque(self.closes, maxlen=max(self.sma_periods))
+        self.sma[period] = self._sma(period)
+
+
+    @property
+    def warmup_window(self) -> int:
+        return max(self.sma_periods, default=1)
+
+
+    def _sma(self, period: int):
+        if len(self.closes) < period:
+            return None
+        # windows are a few dozen bars, an exact sum beats drifting running sums
+        total = 0.0
+        for i in range(1, period + 1):
+            total += self.closes[-i]
+        return total / period
+
+
+    def _push_close(self, close) -> dict:
+        prev = dict(self.sma)
+        self.closes.append(close)
+        for period in self.sma_periods:
+            self.sma[period] = self._sma(period)
+        return prev
+
+
+    def prime(self, closes: list) -> None:
+        """
+        primes the SMA windows from historical closes
+        """
+        self.closes.clear()
+        for close in closes[-self.warmup_window:]:
+            self._push_close(close)
+        if closes:
+            self.prev_close = closes[-1]
+
+
+    def dummy_prime(self) -> None:
+        """
+        primes with a synthetic random walk, for the simulated pipeline.
+        the walk ends at the price dummy_fetch starts from, so the first
+        simulated bar's true range is an ordinary one
+        """
+        px = dummy_base_price(self.instrument)
+        closes = [px]
+        for _ in range(self.warmup_window + 19):
+            px += random.uniform(-1, 1)
+            closes.append(px)
+        closes.reverse()
+        self.prime(closes)
+        print(f"[{self.instrument}] DUMMY PRIME: Loaded {len(closes)} synthetic bars.")
+
+
+    def update(self, bar: dict) -> dict:
+        prev_sma = self._push_close(bar.get("close"))
+
+        high, low = bar["high"], bar["low"]
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.true_ranges.append(tr)
+        self.prev_close = bar.get("close")
+
+        if bar.get("volume", 0) > 0:
+            self.volumes.append(bar["volume"])
+
+        return {
+            "close": bar.get("close"),
+            "sma": dict(self.sma),
+            "prev_sma": prev_sma,
+            "atr": sum(self.true_ranges) / len(self.true_ranges),
+            "avg_volume": sum(self.volumes) / len(self.volumes) if self.volumes else 0,
+        }
+
+
+    def get_state(self) -> dict:
+        return {
+            "closes": list(self.closes),
+            "prev_close": self.prev_close,
+            "true_ranges": list(self.true_ranges),
+            "volumes": list(self.volumes),
+        }
+
+
+    def set_state(self, state: dict) -> None:
+        self.closes.clear()
+        for close in state["closes"]:
+            self._push_close(close)
+        self.prev_close = state["prev_close"]
+        self.true_ranges.clear()
+        self.volumes.clear()
+        self.true_ranges.extend(state["true_ranges"])
+        self.volumes.extend(state["volumes"])
+
+
+class StrategyRegistry:
+    """
+    strategies register against an instrument (optionally with a risk
+    budget, a fraction of capital tracked by the RiskEngine); the registry
+    owns one IndicatorSet per instrument. strategy ids must be unique,
+    budgets and exposure are keyed by them
+    """
+    def __init__(self, risk_engine=None):
+        self.risk_engine = risk_engine
+        self.indicators: dict[str, IndicatorSet] = {}
+        self.strategies: dict[str, list] = defaultdict(list)
+        self.strategy_ids: set[str] = set()
+
+
+    def register(self, strategy, budget: float | None = None) -> None:
+        if strategy.strategy_id in self.strategy_ids:
+            raise ValueError(f"strategy {strategy.strategy_id} is already registered")
+        self.strategy_ids.add(strategy.strategy_id)
+
+        instrument = strategy.instrument
+        indicators = self.indicators.get(instrument)
+        if indicators is None:
+            indicators = self.indicators[instrument] = IndicatorSet(instrument)
+        for period in strategy.required_smas():
+            indicators.require_sma(period)
+
+        self.strategies[instrument].append(strategy)
+        if budget is not None and self.risk_engine is not None:
+            self.risk_engine.set_budget(strategy.strategy_id, budget)
+
+
+    def instruments(self) -> list[str]:
+        return list(self.indicators)
+
+
+    def on_bar(self, instrument: str, bar: dict) -> tuple[dict, list]:
+        """
+        one indicator update, then every subscriber's signal:
+        returns (features, [(strategy, signal), ...])
+        """
+        features = self.indicators[instrument].update(bar)
+        return features, [(s, s.signal_from(features)) for s in self.strategies[instrument]]
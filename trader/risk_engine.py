@@ -27,6 +27,44 @@ class RiskEngine:
         self.atr_values = []
         self.max_allowed_dd = 0.15   # don't scale the position beyond 15%
 
+        self.budgets = {}   # strategy_id -> fraction of capital it may use
+
+
+    def set_budget(self, strategy_id: str, fraction: float):
+        """
+        caps a strategy to `fraction` of capital, both for its
+        risk per trade and its total (levered) exposure
+        """
+        self.budgets[strategy_id] = fraction
+
+
+    def strategy_exposure(self, strategy_id: str, portfolio_state) -> float:
+        """market value of the open positions a strategy entered"""
+        if not portfolio_state:
+            return 0.0
+        return sum(
+            pos["size"] * pos["entry"]
+            for pos in portfolio_state.get("positions", {}).values()
+            if pos.get("strategy") == strategy_id
+        )
+
+
+    def get_state(self) -> dict:
+        """
+        rolling ATR / volume windows, for snapshots
+        """
+        return {
+            "prev_close": self.prev_close,
+            "atr_values": list(self.atr_values),
+            "volume_values": list(self.volume_values),
+        }
+
+
+    def set_state(self, state: dict):
+        self.prev_close = state["prev_close"]
+        self.atr_values = list(state["atr_values"])
+        self.volume_values = list(state["volume_values"])
+
 
     async def update_atr(self, bar):
         """update ATR incrementally"""
@@ -69,14 +107,18 @@ class RiskEngine:
         return sum(self.volume_values) / len(self.volume_values)
 
 
-    async def determine_position(self, signal, bar, instrument_type="index", portfolio_state=None):
+    async def determine_position(self, signal, bar, instrument_type="index", portfolio_state=None,
+                                 features=None, strategy_id=None):
         """
         Compute size, stop, target based on:
         - signal direction
         - volatility (ATR)
         - volume confirmation (for equities)
-        - capital risk budget
+        - capital risk budget (per strategy, if one is set)
         - portfolio exposure and leverage
+
+        features: shared per-instrument indicators from the registry;
+        when given, their ATR / average volume replace the local windows
         """
         if signal is None or signal == 0:
             return None
@@ -86,16 +128,25 @@ class RiskEngine:
                 print("[RISK-THROTTLE]: Portfolio drawdown exceeds max allowed. No new trades.")
                 return None
 
-        await self.update_atr(bar)
-        atr = self._get_atr()
+        if features is not None:
+            atr = features.get("atr")
+        else:
+            await self.update_atr(bar)
+            atr = self._get_atr()
         if atr is None or atr == 0:
             return None
 
+        budget = self.budgets.get(strategy_id, 1.0)
+        capital = self.capital * budget
+
         volume_factor = 1.0
         if instrument_type == "equity":
-            await self.update_volume(bar)
+            if features is not None:
+                avg_volume = features.get("avg_volume", 0)
+            else:
+                await self.update_volume(bar)
+                avg_volume = self._get_avg_volume()
             current_volume = bar.get("volume", 0)
-            avg_volume = self._get_avg_volume()
 
             if avg_volume > 0 and current_volume > 0:
                 if current_volume > avg_volume * 1.5:  # High volume
@@ -112,14 +163,19 @@ class RiskEngine:
         target_price = entry_price + direction * (stop_distance * 1.2)
 
         # risk capital
-        capital_at_risk = self.capital * self.risk_per_trade
+        capital_at_risk = capital * self.risk_per_trade
         size = capital_at_risk / stop_distance
 
         # Apply volume factor
         size *= volume_factor
 
         # enforce single position limits
-        size = min(size, self.capital * self.max_position_pct / entry_price)
+        size = min(size, capital * self.max_position_pct / entry_price)
+
+        # --- Strategy Budget Check ---
+        if strategy_id in self.budgets:
+            available_value = self.max_leverage * capital - self.strategy_exposure(strategy_id, portfolio_state)
+            size = min(size, max(available_value, 0) / entry_price)
 
         # --- Leverage Check (Portfolio Level) ---
         if portfolio_state:
@@ -149,5 +205,6 @@ class RiskEngine:
             "stop": round(stop_price, 2),
             "target": round(target_price, 2),
             "valid": True,
-            "atr" : round(atr, 3)
+            "atr" : round(atr, 3),
+            "strategy": strategy_id,
         }
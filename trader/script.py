@@ -5,11 +5,23 @@ main script for running the trader
 import asyncio
 from market_adapter import MarketAdapter
 from risk_engine import RiskEngine
-from strategy import SMA_CROSS
-from threading import Lock
-from pymongo import MongoClient # type: ignore
+from strategy import SMA_CROSS, ACCESS_TOKEN
+from registry import StrategyRegistry
+from price_board import PriceBoard
+from strategy_workers import StrategyWorkerPool
+from warmup import warm_up, replay_gap, FirstSignalClock
+from state_store import StateStore
+from orders import OrderGateway, SimulatedBroker
+from portfolio import Portfolio
+from bar_queue import BarQueue, merge_bars, merge_keyed_bars
+from position_book import find_exits
+from latency import LATENCY, stamp
+from trade_sink import TradeSink, mongo_collection
+from memory import DownsampledSeries, print_memory_report
 import json
 import os
+import signal
+import sys
 import pyfiglet # type: ignore
 from dotenv import load_dotenv # type: ignore
 from pathlib import Path
@@ -17,26 +29,55 @@ from uniplot import plot, plot_gen # type: ignore
 import warnings
 warnings.filterwarnings("ignore")
 
-lock = Lock()
+# live feed + broker history, or the fully simulated pipeline
+LIVE = False
 
-# Globals for Portfolio State Management
-INITIAL_CAPITAL = 1000000.0
-peak_portfolio_value = INITIAL_CAPITAL
-total_realized_pnl = 0.0
+# > 0 runs strategies in that many worker processes fed from a
+# shared-memory price board (see strategy_workers.py)
+STRATEGY_PROCESSES = 0
 
-positions = {}
-latest_prices = {}
-pnl_series = []
-portfolio_queue = asyncio.Queue()
-pnl_plot = plot_gen()
+# started at import, i.e. at (re)start of the trader
+first_signal_clock = FirstSignalClock()
 
 # Mongo Set-up
-# env_path = Path(__file__).resolve().parent.parent / '.env'
-# load_dotenv(env_path)
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(env_path)
+
+# trade events are batched to Mongo, spilling to disk while it is unreachable
+MONGO_CONN_STRING = os.getenv("MONGO_CONN_STRING")
+trade_sink = TradeSink(mongo_collection(MONGO_CONN_STRING), spill_path="trade_spill.jsonl") if MONGO_CONN_STRING else None
+
+# live priming reads 1-minute closes from the aggregator's sink first
+# (a sink url, see utils/sinks.py) and only downloads what it lacks;
+# unset, every instrument is primed from broker history
+BAR_STORE_URL = os.getenv("BAR_STORE_URL")
+# stored closes older than this are not live history any more
+BAR_STORE_MAX_AGE_MS = 5 * 60 * 1000
+
 
-# client = MongoClient(os.getenv("MONGO_CONN_STRING"))
-# db = client["trade_logs"]
-# collection = db["sma_2_7"]
+def open_bar_store(url):
+    # utils/bar_store.py imports its siblings as top-level modules
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
+    from bar_store import BarStore # type: ignore
+    return BarStore(url)
+
+
+# orders go to an in-process simulated broker until a live gateway exists
+gateway = OrderGateway(SimulatedBroker())
+
+# Portfolio State Management (single writer, see portfolio.py);
+# the actor submits the orders for the entries and exits it accepts
+INITIAL_CAPITAL = 1000000.0
+portfolio = Portfolio(INITIAL_CAPITAL, trades_path="trades.json", on_trade=trade_sink.emit if trade_sink else None, gateway=gateway)
+
+# dashboard PnL history, fixed size: older points are thinned out
+pnl_series = DownsampledSeries(capacity=1000)
+last_processed_ts = {}  # instrument -> ts (ms) of the last bar through the pipeline
+state_store = StateStore("trader_state.bin", interval=10.0)
+# the monitor only needs the latest bar per instrument; conflation merges
+# high/low so a stop or target touched by a skipped bar is still seen
+portfolio_queue = BarQueue(maxsize=1000, policy="conflate", key=lambda item: item[0], merge=merge_keyed_bars)
+pnl_plot = plot_gen()
 
 
 def render_portfolio(state):
@@ -67,9 +108,8 @@ def render_portfolio(state):
     print(f)
 
     print("\n--- LATEST BARS ---")
-    with lock:
-        for instrument, bar in latest_prices.items():
-            print(f"{instrument}: {bar}")
+    for instrument, bar in state["latest_prices"].items():
+        print(f"{instrument}: { {k: v for k, v in bar.items() if not k.startswith('_')} }")
     print("---------------------\n")
 
     print("\n--- PORTFOLIO METRICS ---")
@@ -81,106 +121,54 @@ def render_portfolio(state):
     print(f"Total Positions MV  : {state['total_positions_value']:.2f}")
     print(f"Open Positions Count: {pos_color}{ops}\033[0m")
     print(f"Leverage            : {state['leverage']:.2f}")
-    print(f"Open Positions      : {pos_color}{state['open_positions']}\033[0m")
+    print(f"Open Positions      : {pos_color}{list(state['open_positions'])}\033[0m")
     print("-------------------\n")
+
+    q = portfolio_queue.stats()
+    print(f"Monitor Queue       : {q['size']}/{q['maxsize']} (dropped {q['dropped']}, conflated {q['conflated']})")
     
 
     print("\n--- PNL GRAPH ---")
-    plot(pnl_series, title="Portfolio Value - PnL over Time", color=color)
+    plot(pnl_series.values, title="Portfolio Value - PnL over Time", color=color)
     print("-----------------\n")
 
 
-async def close_and_log_position(instrument, pos, exit_bar, reason=""):
+def close_and_log_position(instrument, exit_bar, reason=""):
     """
-    Handles the logic for closing a position, calculating P&L,
-    and logging the trade.
+    Hands the exit to the portfolio actor, which submits the exit
+    order, calculates P&L and logs the trade.
     """
-    global total_realized_pnl
-    
-    print(f"[{instrument}] {reason} EXIT triggered -> {pos}\n")
-    # await trader_global.exit_position(pos)
-
-    entry_price = pos["entry"]
-    size = pos["size"]
-    side = pos["side"]
-    exit_price = exit_bar.get("close", pos["entry"])
-
-    if reason == "TARGET":
-        exit_price = pos["target"]
-    elif reason == "STOP":
-        exit_price = pos["stop"]
-
-    if side == "BUY":
-        pnl = (exit_price - entry_price) * size
-    else: # SELL
-        pnl = (entry_price - exit_price) * size
-
-    total_realized_pnl += pnl
-
-    exit_record = {
-        "instrument": instrument,
-        "side": side,
-        "entry": entry_price,
-        "exit_price": exit_price,
-        "pnl": round(pnl, 2),
-        "realized_pnl": round(total_realized_pnl, 2),
-        "reason": reason,
-        "target": pos["target"],
-        "stop": pos["stop"],
-        "size": size,
-        "ts_entry": pos['ts'],
-        "ts_exit": exit_bar["ts"],
-        "trade_duration" : (int(exit_bar['ts']) - int(pos['ts'])) / 1000,
-        "type": "EXIT"
-    }
-
-    # collection.insert_one(exit_record) # insert into mongo
-
-    with lock:
-        positions.pop(instrument, None)
-        
-        try:
-            with open("trades.json", "r") as file:
-                trades = json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            trades = []
-        trades.append(exit_record)
-
-        with open("trades.json", "w") as file:
-            json.dump(trades, file, indent=4)
+    portfolio.close(instrument, exit_bar, reason=reason)
 
 
 async def portfolio_monitor():
     """
     Runs continuously.
-    - Processes bars from the queue to check for stop/target hits.
+    - Drains every bar queued since the last pass (a minute's worth at most).
+    - Checks stop/target hits for all open positions in one vectorized pass.
     - Renders the portfolio state to the console.
     """
 
     while True:
         try:
-            instrument, bar = await asyncio.wait_for(portfolio_queue.get(), timeout=5.0)
-
-            # update latest prices and render the portfolio
-            with lock:
-                latest_prices[instrument] = bar
-            
-            portfolio_state = build_portfolio_state()
+            batch = [await asyncio.wait_for(portfolio_queue.get(), timeout=5.0)]
+            while not portfolio_queue.empty():
+                batch.append(portfolio_queue.get_nowait())
+
+            # latest bar per instrument; repeated bars keep their extremes
+            bars = {}
+            for instrument, bar in batch:
+                bars[instrument] = merge_bars(bars[instrument], bar) if instrument in bars else bar
+                portfolio.mark(instrument, bar)
+
+            # marks are only queued: wait for the actor to apply them so
+            # exits are checked against the current book, not the last one
+            portfolio_state = await portfolio.request_snapshot()
             render_portfolio(portfolio_state)
 
-            # check for stop/target hits
-            pos = positions.get(instrument)
-            if pos:
-                exit_reason = ""
-                if pos["side"] == "BUY":
-                    if bar["low"] <= pos["stop"]: exit_reason = "STOP"
-                    elif bar["high"] >= pos["target"]: exit_reason = "TARGET"
-                else: # SELL
-                    if bar["high"] >= pos["stop"]: exit_reason = "STOP"
-                    elif bar["low"] <= pos["target"]: exit_reason = "TARGET"
-
-                if exit_reason:
-                    await close_and_log_position(instrument, pos, bar, reason=exit_reason)
+            # check for stop/target hits (STOP takes precedence over TARGET)
+            for instrument, exit_reason in find_exits(portfolio_state["book"], bars):
+                close_and_log_position(instrument, bars[instrument], reason=exit_reason)
 
         except asyncio.TimeoutError:
             # on timeout, just re-render the last known state
@@ -191,88 +179,61 @@ async def portfolio_monitor():
 
 def build_portfolio_state():
     """
-    Builds a comprehensive snapshot of the current portfolio state.
+    Latest immutable snapshot published by the portfolio actor.
+    Lock-free, never waits on pending mutations.
     """
-    global peak_portfolio_value
-    
-    with lock:
-        open_positions_list = []
-        total_market_value = 0
-        total_unrealized_pnl = 0
-        
-        for instr, pos in positions.items():
-            current_price = latest_prices.get(instr, {}).get("close", pos["entry"])
-            market_value = pos["size"] * current_price
-            
-            if pos["side"] == "BUY":
-                unrealized_pnl = (current_price - pos["entry"]) * pos["size"]
-            else: # SELL
-                unrealized_pnl = (pos["entry"] - current_price) * pos["size"]
-
-            total_market_value += market_value
-            total_unrealized_pnl += unrealized_pnl
-            open_positions_list.append({ "instrument": instr, "side": pos["side"], "size": pos["size"] })
-
-        current_portfolio_value = INITIAL_CAPITAL + total_realized_pnl + total_unrealized_pnl
-        peak_portfolio_value = max(peak_portfolio_value, current_portfolio_value)
-        
-        drawdown_pct = (peak_portfolio_value - current_portfolio_value) / peak_portfolio_value if peak_portfolio_value > 0 else 0
-        leverage = total_market_value / current_portfolio_value if current_portfolio_value > 0 else 0
-
-        return {
-            "current_portfolio_value": current_portfolio_value,
-            "peak_portfolio_value": peak_portfolio_value,
-            "portfolio_drawdown_pct": drawdown_pct,
-            "total_positions_value": total_market_value,
-            "total_realized_pnl": total_realized_pnl,
-            "total_unrealized_pnl": total_unrealized_pnl,
-            "open_positions_count": len(positions),
-            "leverage": leverage,
-            "open_positions": open_positions_list
-        }
-
-
-async def process_instrument(instrument: str, strat: SMA_CROSS, risk: RiskEngine, bar_queue: asyncio.Queue):
+    return portfolio.snapshot
+
+
+def enter_position(instrument, params, bar):
+    print(instrument, "PARAMS:", params, "\n")
+
+    # fire-and-forget: the actor submits the order once it accepts the
+    # entry, acks and fills are tracked by the gateway
+    portfolio.open(instrument, params, stamps=bar.get("_stamps"))
+
+
+async def process_instrument(instrument: str, registry: StrategyRegistry, risk: RiskEngine, bar_queue: asyncio.Queue):
     """
-    Processes the data stream for a single instrument to generate signals and manage positions.
+    Processes the data stream for a single instrument: indicators are updated
+    once per bar and every strategy subscribed to the instrument gets a say.
     """
     _type = "equity" if "NSE_EQ" in instrument else "index"
     
     while True:
         try:
             bar = await bar_queue.get()
+            stamp(bar, "dequeued")
+            last_processed_ts[instrument] = int(bar["ts"])
             
             await portfolio_queue.put((instrument, bar))
 
-            signal = await strat.generate_signal(bar)
+            features, signals = registry.on_bar(instrument, bar)
+            stamp(bar, "signal")
+            first_signal_clock.mark(instrument)
 
-            if instrument in positions:
-                continue
-            
             # latest portfolio state for risk calculation
             portfolio_state = build_portfolio_state()
-            
-            params = await risk.determine_position(
-                signal, bar, instrument_type=_type, portfolio_state=portfolio_state
-            )
+
+            if instrument in portfolio_state["positions"]:
+                LATENCY.observe(instrument, bar)
+                continue
+
+            # one position per instrument: the first strategy the risk engine sizes wins
+            params = None
+            for strat, signal in signals:
+                params = await risk.determine_position(
+                    signal, bar, instrument_type=_type, portfolio_state=portfolio_state,
+                    features=features, strategy_id=strat.strategy_id,
+                )
+                if params is not None:
+                    break
+            stamp(bar, "risk")
+            LATENCY.observe(instrument, bar)
             if params is None:
                 continue
 
-            print(instrument, "PARAMS:", params, "\n")
-
-            with lock:
-                params['instrument'] = instrument
-                positions[instrument] = params
-                
-                try:
-                    with open("trades.json", "r") as file:
-                        trades = json.load(file)
-                except (FileNotFoundError, json.JSONDecodeError):
-                    trades = []
-                trades.append(params)
-
-                with open("trades.json", "w") as file:
-                    json.dump(trades, file, indent=4)
+            enter_position(instrument, params, bar)
         except asyncio.CancelledError:
             print(f"Pipeline for {instrument} cancelled.")
             break
@@ -280,46 +241,203 @@ async def process_instrument(instrument: str, strat: SMA_CROSS, risk: RiskEngine
             print(f"[{instrument}] Error in process_instrument: {e}")
 
 
+async def publish_bars(instrument: str, pool: StrategyWorkerPool, bar_queue: asyncio.Queue):
+    """
+    multi-process mode: moves an instrument's bars from the adapter
+    queue onto the shared price board, waking the strategy worker
+    """
+    while True:
+        bar = await bar_queue.get()
+        stamp(bar, "dequeued")
+        last_processed_ts[instrument] = int(bar["ts"])
+        await portfolio_queue.put((instrument, bar))
+        pool.publish(instrument, bar)
+
+
+def intent_handler(risk: RiskEngine):
+    """
+    multi-process mode: sizes the signals coming back from the
+    strategy workers, one position per instrument as in process_instrument
+    """
+    async def on_intent(instrument, strategy_id, signal, bar, features):
+        first_signal_clock.mark(instrument)
+        portfolio_state = build_portfolio_state()
+        if instrument in portfolio_state["positions"]:
+            return
+
+        _type = "equity" if "NSE_EQ" in instrument else "index"
+        params = await risk.determine_position(
+            signal, bar, instrument_type=_type, portfolio_state=portfolio_state,
+            features=features, strategy_id=strategy_id,
+        )
+        stamp(bar, "risk")
+        LATENCY.observe(instrument, bar)
+        if params is not None:
+            enter_position(instrument, params, bar)
+
+    return on_intent
+
+
+async def collect_state(registry, risk_engine):
+    """
+    everything needed to resume mid-session, gathered on the loop.
+    indicator sets living in worker processes are not included
+    """
+    return {
+        "portfolio": await portfolio.export_state(),
+        "indicators": {
+            i: ind.get_state() for i, ind in registry.indicators.items()
+        } if not STRATEGY_PROCESSES else {},
+        "risk": risk_engine.get_state(),
+        "pnl_series": pnl_series.get_state(),
+        "last_ts": dict(last_processed_ts),
+    }
+
+
+def restore_state(state, registry, risk_engine):
+    portfolio.set_state(state["portfolio"])
+    for instrument, indicators in registry.indicators.items():
+        if instrument in state.get("indicators", {}):
+            indicators.set_state(state["indicators"][instrument])
+    risk_engine.set_state(state["risk"])
+    pnl_series.set_state(state["pnl_series"])
+    last_processed_ts.update(state["last_ts"])
+
+
+def memory_structures(adapter, registry) -> dict:
+    """
+    every long-lived runtime buffer, for the memory report
+    """
+    return {
+        "portfolio.positions": portfolio._positions,
+        "portfolio.book": portfolio._book,
+        "portfolio.latest_prices": portfolio._latest_prices,
+        "portfolio.trades": portfolio._trades,
+        "portfolio.snapshot": portfolio.snapshot,
+        "pnl_series": pnl_series,
+        "last_processed_ts": last_processed_ts,
+        "portfolio_queue": portfolio_queue._queue,
+        "adapter.queues": {i: q._queue for i, q in adapter.queues.items()},
+        "registry.indicators": registry.indicators,
+        "registry.strategies": registry.strategies,
+        "gateway.orders": gateway.orders,
+        "latency.histograms": LATENCY.histograms,
+        "trade_sink.queue": trade_sink.queue._queue if trade_sink else None,
+    }
+
+
 async def main():
     # --- Configuration ---
+    # (instrument, short_sma, long_sma, risk budget as a fraction of capital);
+    # an instrument may appear several times with different parameters
     instrument_configs = [
-        # ("NSE_EQ|INE002A01018", 5, 12), # RELIANCE
-        # ("NSE_EQ|INE467B01029", 2, 7),  # TCS
-        # ("NSE_EQ|INE0HOQ01053", 5, 12),  # GROWW
-        ("NSE_EQ|INE171A01029", 5, 12), # Federal Bank
-        ("NSE_EQ|INE200M01039", 5, 12), # VBL
-        ("NSE_EQ|INE155A01022", 5, 12),  # TMPV
+        # ("NSE_EQ|INE002A01018", 5, 12, 0.25), # RELIANCE
+        # ("NSE_EQ|INE467B01029", 2, 7, 0.25),  # TCS
+        # ("NSE_EQ|INE0HOQ01053", 5, 12, 0.25),  # GROWW
+        ("NSE_EQ|INE171A01029", 5, 12, 0.25), # Federal Bank
+        ("NSE_EQ|INE200M01039", 5, 12, 0.25), # VBL
+        ("NSE_EQ|INE155A01022", 5, 12, 0.25),  # TMPV
     ]
-    instrument_keys = [config[0] for config in instrument_configs]
+    instrument_keys = list(dict.fromkeys(config[0] for config in instrument_configs))
 
-    adapter = MarketAdapter(instrument_keys)
+    # bounded per-instrument queues: a slow strategy loses its oldest
+    # bars instead of stalling the adapter for every other instrument
+    adapter = MarketAdapter(instrument_keys, queue_maxsize=500, queue_policy="drop_oldest")
     risk_engine = RiskEngine(capital=INITIAL_CAPITAL)
     
     tasks = []
 
+    # Strategies share one indicator set per instrument
+    registry = StrategyRegistry(risk_engine)
+    for instrument, short_sma, long_sma, budget in instrument_configs:
+        registry.register(SMA_CROSS(short_sma, long_sma, instrument), budget=budget)
+    indicator_sets = list(registry.indicators.values())
+
+    # Prime every indicator set before any bar flows
+    bar_store = open_bar_store(BAR_STORE_URL) if LIVE and BAR_STORE_URL else None
+    state = state_store.load()
+    if state:
+        # resume: no history download, only the bars missed while down
+        restore_state(state, registry, risk_engine)
+        if LIVE:
+            # positions restored from the snapshot are checked against the
+            # gap too, a stop hit while the trader was down is still taken
+            await replay_gap(
+                indicator_sets, last_processed_ts, ACCESS_TOKEN,
+                book=portfolio.snapshot["book"],
+                on_exit=lambda instrument, bar, reason: portfolio.close(instrument, bar, reason=reason),
+            )
+            # the feed must not hand back minutes the strategies already saw
+            adapter.current_ts.update(last_processed_ts)
+        # e.g. a snapshot taken in multi-process mode carries no indicators
+        unprimed = [ind for i, ind in registry.indicators.items() if i not in state.get("indicators", {})]
+        if unprimed and not STRATEGY_PROCESSES:
+            if LIVE:
+                await warm_up(unprimed, ACCESS_TOKEN, store=bar_store, store_max_age_ms=BAR_STORE_MAX_AGE_MS)
+            else:
+                for indicators in unprimed:
+                    indicators.dummy_prime()
+        print(f"[STATE] Trader state restored in {first_signal_clock.since_start():.3f}s")
+    else:
+        with open("trades.json", "w") as f:
+            json.dump([], f)
+        if STRATEGY_PROCESSES:
+            pass  # every worker primes its own indicator sets
+        elif LIVE:
+            # concurrent, cached history download for the whole universe
+            await warm_up(indicator_sets, ACCESS_TOKEN, store=bar_store, store_max_age_ms=BAR_STORE_MAX_AGE_MS)
+        else:
+            for indicators in indicator_sets:
+                indicators.dummy_prime()
+
+    # The portfolio actor owns all position state
+    tasks.append(asyncio.create_task(portfolio.run()))
+    tasks.append(asyncio.create_task(gateway.run()))
+    if trade_sink:
+        tasks.append(asyncio.create_task(trade_sink.run()))
+
+    # periodic compact snapshots for crash recovery
+    tasks.append(asyncio.create_task(state_store.run(lambda: collect_state(registry, risk_engine))))
+
     # Create a single data fetching task
-    fetch_task = asyncio.create_task(adapter.dummy_fetch())
+    fetch_task = asyncio.create_task(adapter.fetch() if LIVE else adapter.dummy_fetch())
     fetch_task.add_done_callback(lambda t: print(f"Master fetch task done. Exception: {t.exception()}"))
     tasks.append(fetch_task)
 
-    # Create a processing task for each instrument
-    for instrument, short_sma, long_sma in instrument_configs:
-        strategy = SMA_CROSS(short_sma, long_sma, instrument)
-        strategy.dummy_patch()
-        
-        bar_queue = adapter.queues[instrument]
-        
-        instrument_task = asyncio.create_task(
-            process_instrument(instrument, strategy, risk_engine, bar_queue)
+    if STRATEGY_PROCESSES:
+        # bars go out through shared memory, intents come back through rings
+        board = PriceBoard.create(registry.instruments())
+        pool = StrategyWorkerPool(
+            board,
+            [s for strategies in registry.strategies.values() for s in strategies],
+            workers=STRATEGY_PROCESSES,
+            live=LIVE,
         )
-        tasks.append(instrument_task)
+        tasks.append(asyncio.create_task(pool.run(intent_handler(risk_engine))))
+        for instrument in registry.instruments():
+            tasks.append(asyncio.create_task(publish_bars(instrument, pool, adapter.queues[instrument])))
+    else:
+        # Create a processing task for each instrument
+        for instrument in registry.instruments():
+            bar_queue = adapter.queues[instrument]
+            
+            instrument_task = asyncio.create_task(
+                process_instrument(instrument, registry, risk_engine, bar_queue)
+            )
+            tasks.append(instrument_task)
 
     tasks.append(asyncio.create_task(portfolio_monitor()))
 
+    # periodic latency summaries + dump for p99 budgets
+    tasks.append(asyncio.create_task(LATENCY.run_reporter(interval=60.0, dump_path="latency.json")))
+
+    # `kill -USR1 <pid>` prints the size of every runtime buffer
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGUSR1, lambda: print_memory_report(memory_structures(adapter, registry))
+    )
+
     await asyncio.gather(*tasks)
     
 
 if __name__ == "__main__":
-    with open("trades.json", "w") as f:
-        json.dump([], f)
     asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+snapshot / restore of trader runtime state
+
+a snapshot is one compact binary file:
+    8 bytes   magic + format version
+    rest      zlib-compressed pickle of a plain dict of components
+
+components expose `get_state()` / `set_state(state)` (the portfolio
+actor exports through its command queue). files are written to a
+temp name and renamed, so a crash mid-write never leaves a torn snapshot.
+"""
+
+import asyncio
+import pickle
+import time
+import zlib
+from pathlib import Path
+
+
+MAGIC = b"BLIPSNP1"
+
+
+def write_snapshot(path: str, state: dict) -> int:
+    payload = MAGIC + zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    tmp.replace(path)
+    return len(payload)
+
+
+def read_snapshot(path: str) -> dict | None:
+    """
+    None when there is no usable snapshot
+    """
+    try:
+        with open(path, "rb") as f:
+            payload = f.read()
+    except FileNotFoundError:
+        return None
+
+    if not payload.startswith(MAGIC):
+        print(f"[STATE] {path} is not a trader snapshot (or an old format), ignoring.")
+        return None
+    try:
+        return pickle.loads(zlib.decompress(payload[len(MAGIC):]))
+    except Exception as e:
+        print(f"[STATE] Corrupt snapshot {path}, ignoring: {e}")
+        return None
+
+
+class StateStore:
+    """
+    periodic snapshots of every registered component
+
+    collect_state: async callable returning the full state dict,
+    gathered on the event loop so it is consistent; compression
+    and disk I/O then happen off the loop
+    """
+    def __init__(self, path: str = "trader_state.bin", interval: float = 30.0, max_age: float = 6 * 3600):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+
+
+    def load(self) -> dict | None:
+        """
+        the last snapshot, if it is recent enough to resume from
+        """
+        started = time.monotonic()
+        state = read_snapshot(self.path)
+        if state is None:
+            return None
+
+        age = time.time() - state.get("saved_at", 0)
+        if age > self.max_age:
+            print(f"[STATE] Snapshot is {age:.0f}s old, starting fresh.")
+            return None
+
+        print(f"[STATE] Loaded snapshot ({age:.0f}s old) in {(time.monotonic() - started) * 1000:.1f}ms")
+        return state
+
+
+    async def save(self, collect_state) -> None:
+        state = await collect_state()
+        state["saved_at"] = time.time()
+        started = time.monotonic()
+        size = await asyncio.to_thread(write_snapshot, self.path, state)
+        print(f"[STATE] Snapshot written: {size} bytes in {(time.monotonic() - started) * 1000:.1f}ms")
+
+
+    async def run(self, collect_state):
+        """
+        snapshot loop, runs until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save(collect_state)
+            except Exception as e:
+                print(f"[STATE] Snapshot failed: {e}")
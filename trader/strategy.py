@@ -1,5 +1,6 @@
 """
-ingests market data (one unit)
+SMA crossover on features computed by the instrument's
+IndicatorSet (see registry.py), which is also what is primed
 generates signal +-1
 returns only a flag
 """
@@ -7,8 +8,6 @@ returns only a flag
 import os
 from dotenv import load_dotenv # type: ignore
 from pathlib import Path
-import pandas as pd # type: ignore
-from utils.fetch_data_upstox import fetch_intraday_historical_data
 from typing import Any
 
 
@@ -20,9 +19,10 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 class SMA_CROSS:
     def __init__(self, short_sma: int, long_sma: int, instrument: str):
         self.instrument: str = instrument
+        # unique per instrument, risk budgets are tracked by strategy_id
+        self.strategy_id: str = f"SMA_CROSS_{short_sma}_{long_sma}:{instrument}"
         self.period_s: int = short_sma
         self.period_l: int = long_sma
-        self._data: list = [] # close prices only
         self.sma_s: Any
         self.sma_l: Any
         self.prev_sma_s: Any
@@ -47,75 +47,24 @@ class SMA_CROSS:
         return 0
 
 
-    def patch(self):
-        '''
-        integrating a strategy into the system
-        '''
-        self.load_historical_bars(self.instrument)
-        if len(self._data) >= self.period_l:
-            self.prev_sma_s = pd.Series(self._data[len(self._data) - self.period_s:]).mean()
-            self.prev_sma_l = pd.Series(self._data[len(self._data) - self.period_l:]).mean()
-
-    
-    def dummy_patch(self):
+    def required_smas(self) -> tuple[int, int]:
         """
-        Simulates loading historical data by generating a synthetic price series.
-        This allows the strategy to be primed with enough data to calculate
-        initial SMAs for testing purposes.
+        SMA windows this strategy needs from a shared IndicatorSet
         """
-        import random
-        
-        # We need at least self.period_l bars to calculate the initial long SMA.
-        # Let's generate a bit more for a better starting point.
-        num_bars = self.period_l + 20
-        
-        # Generate a simple random walk for the close prices.
-        px = 1000 + (hash(self.instrument) % 500) # Start price based on instrument
-        dummy_prices = []
-        for _ in range(num_bars):
-            px += random.uniform(-1, 1)
-            dummy_prices.append(px)
-            
-        self._data = dummy_prices
-        
-        print(f"[{self.instrument}] DUMMY PATCH: Loaded {len(self._data)} synthetic bars.")
+        return (self.period_s, self.period_l)
 
-        # This part is identical to the real patch() method.
-        # It calculates the initial SMAs based on the synthetic historical data.
-        if len(self._data) >= self.period_l:
-            self.prev_sma_s = pd.Series(self._data[len(self._data) - self.period_s:]).mean()
-            self.prev_sma_l = pd.Series(self._data[len(self._data) - self.period_l:]).mean()
-
-
-    async def generate_signal(self, bar):
-        '''
-        everything that happens as each bar is recieved
-        from the market adapter
-        '''
-        try: 
-            self._data.append(bar.get("close")) 
-        except Exception as e: 
-            print("[ERROR] recieved bar doesn't have a close price: ", e) 
-
-        if len(self._data) < self.period_l:
-            return 0
 
-        self.sma_s = pd.Series(self._data[len(self._data) - self.period_s:]).mean()
-        self.sma_l = pd.Series(self._data[len(self._data) - self.period_l:]).mean()
-
-        signal = self.apply_strategy()
-
-        # update the previous state for the next iteration
-        self.prev_sma_s = self.sma_s
-        self.prev_sma_l = self.sma_l
-        
-        return signal
-
-
-    def load_historical_bars(self, instrument): 
+    def signal_from(self, features: dict) -> int:
         """
-        loads historical data from upstox
-        and puts the close prices in the self._data list
+        signal from SMAs computed once per bar by the
+        instrument's IndicatorSet (see registry.py)
         """
-        fetched_data = fetch_intraday_historical_data(instrument, ACCESS_TOKEN)
-        self._data = [x[4] for x in fetched_data]
+        sma_s = features["sma"].get(self.period_s)
+        sma_l = features["sma"].get(self.period_l)
+        if sma_s is None or sma_l is None:
+            return 0
+
+        self.prev_sma_s = features["prev_sma"].get(self.period_s)
+        self.prev_sma_l = features["prev_sma"].get(self.period_l)
+        self.sma_s, self.sma_l = sma_s, sma_l
+        return self.apply_strategy()
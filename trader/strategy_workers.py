@@ -0,0 +1,199 @@
+"""
+strategy worker processes
+
+instruments are split across N spawn processes. each worker owns
+a StrategyRegistry for its share of the strategy configs, reads every
+new bar of its instruments from the shared PriceBoard, in order, and
+pushes non-zero signals (with the features risk sizing needs) into its
+own IntentRing. the portfolio / risk side stays in the parent, so a
+CPU-heavy strategy only delays the instruments that share its worker.
+
+nobody polls: the parent rings a worker's doorbell after publishing
+one of its bars, a worker rings its own intent doorbell after pushing
+intents. only a worker more than the board's `depth` bars behind
+loses bars (counted in `skipped`).
+"""
+
+import asyncio
+import multiprocessing as mp
+from price_board import PriceBoard, IntentRing, Doorbell, record_to_bar
+from market_adapter import shard_instruments
+
+
+def _worker_main(worker_id: int, board_name: str, board_depth: int, instruments: list[str], configs: list[tuple],
+                 ring_name: str, ring_capacity: int, live: bool, bars_bell: Doorbell, intents_bell: Doorbell):
+    """
+    configs: (strategy index, instrument, short_sma, long_sma) for this worker
+    """
+    from strategy import SMA_CROSS, ACCESS_TOKEN
+    from registry import StrategyRegistry
+    from warmup import warm_up
+
+    board = PriceBoard.attach(board_name, instruments, board_depth)
+    ring = IntentRing.attach(ring_name, ring_capacity)
+
+    registry = StrategyRegistry()
+    strategy_index = {}
+    for index, instrument, short_sma, long_sma in configs:
+        strategy = SMA_CROSS(short_sma, long_sma, instrument)
+        registry.register(strategy)
+        strategy_index[id(strategy)] = index
+
+    if live:
+        asyncio.run(warm_up(list(registry.indicators.values()), ACCESS_TOKEN))
+    else:
+        for indicators in registry.indicators.values():
+            indicators.dummy_prime()
+
+    rows = [(board.index[instrument], instrument) for instrument in registry.instruments()]
+    # a (re)started worker picks up from the bars published from now on
+    seen = {i: board.count(i) for i, _ in rows}
+    skipped = 0
+    print(f"[WORKER-{worker_id}] Ready with {len(rows)} instruments")
+
+    try:
+        while True:
+            bars_bell.wait()
+            # cleared before reading, a bar published meanwhile rings again
+            bars_bell.clear()
+            pushed = False
+            for i, instrument in rows:
+                records, seen[i], lost = board.read_since(i, seen[i])
+                skipped += lost
+                for record in records:
+                    features, signals = registry.on_bar(instrument, record_to_bar(record))
+                    for strategy, signal in signals:
+                        if signal:
+                            pushed |= ring.push(i, strategy_index[id(strategy)], signal, record, features)
+            if pushed:
+                intents_bell.ring()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if skipped or ring.dropped:
+            print(f"[WORKER-{worker_id}] skipped {skipped} bars, dropped {ring.dropped} intents")
+
+
+class StrategyWorkerPool:
+    """
+    parent side: owns the rings, starts and supervises the workers
+    and hands every intent to `on_intent(instrument, strategy_id,
+    signal, bar, features)`. `strategies` are the parent's registered
+    SMA_CROSS instances; workers rebuild them from their parameters.
+    bars go onto the board through `publish`, which wakes the worker
+    owning the instrument
+    """
+    def __init__(self,
+                 board: PriceBoard,
+                 strategies: list,
+                 workers: int = 2,
+                 live: bool = False,
+                 ring_capacity: int = 1024):
+        self.board = board
+        self.strategies = strategies
+        self.live = live
+        self.ring_capacity = ring_capacity
+
+        instruments = list(dict.fromkeys(s.instrument for s in strategies))
+        self.shards = shard_instruments(instruments, workers)
+        self.worker_of = {i: worker_id for worker_id, shard in enumerate(self.shards) for i in shard}
+        self.rings = [IntentRing.create(ring_capacity) for _ in self.shards]
+        self.bar_bells = [Doorbell() for _ in self.shards]
+        self.intent_bells = [Doorbell() for _ in self.shards]
+        self.procs = {}
+        self.stats = {"intents": 0, "restarts": 0}
+
+
+    def _start(self, worker_id: int):
+        shard = set(self.shards[worker_id])
+        configs = [
+            (index, s.instrument, s.period_s, s.period_l)
+            for index, s in enumerate(self.strategies)
+            if s.instrument in shard
+        ]
+        proc = mp.get_context("spawn").Process(
+            target=_worker_main,
+            args=(worker_id, self.board.name, self.board.depth, self.board.instruments, configs,
+                  self.rings[worker_id].name, self.ring_capacity, self.live,
+                  self.bar_bells[worker_id], self.intent_bells[worker_id]),
+            name=f"strategy-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        self.procs[worker_id] = proc
+        print(f"[WORKER-{worker_id}] Process {proc.pid} started for {len(shard)} instruments")
+
+
+    def publish(self, instrument: str, bar: dict) -> None:
+        self.board.write(instrument, bar)
+        worker_id = self.worker_of.get(instrument)
+        if worker_id is not None:
+            self.bar_bells[worker_id].ring()
+
+
+    async def run(self, on_intent, supervise_every: float = 5.0):
+        """
+        drains the rings whenever a worker rings, until cancelled;
+        dead workers are restarted
+        """
+        for worker_id in range(len(self.shards)):
+            self._start(worker_id)
+
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        for bell in self.intent_bells:
+            loop.add_reader(bell.fileno(), wakeup.set)
+        next_check = loop.time() + supervise_every
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=max(0.0, next_check - loop.time()))
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+
+                for bell, ring in zip(self.intent_bells, self.rings):
+                    bell.clear()
+                    for intent in ring.pop_all():
+                        self.stats["intents"] += 1
+                        await self._dispatch(intent, on_intent)
+
+                if loop.time() >= next_check:
+                    next_check = loop.time() + supervise_every
+                    for worker_id, proc in list(self.procs.items()):
+                        if not proc.is_alive():
+                            print(f"[WORKER-{worker_id}] Exited ({proc.exitcode}), restarting")
+                            self.stats["restarts"] += 1
+                            self._start(worker_id)
+        finally:
+            for bell in self.intent_bells:
+                loop.remove_reader(bell.fileno())
+            self.close()
+
+
+    async def _dispatch(self, intent, on_intent):
+        instrument = self.board.instruments[int(intent["instrument"])]
+        bar = {
+            "ts": str(int(intent["ts"])),
+            "close": float(intent["close"]),
+            "volume": float(intent["volume"]),
+            "_stamps": {"recv": int(intent["recv_ns"]), "signal": int(intent["signal_ns"])},
+        }
+        features = {"atr": float(intent["atr"]) or None, "avg_volume": float(intent["avg_volume"])}
+        try:
+            await on_intent(instrument, self.strategies[int(intent["strategy"])].strategy_id, int(intent["signal"]), bar, features)
+        except Exception as e:
+            print(f"[{instrument}] Error handling intent: {e}")
+
+
+    def close(self) -> None:
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            proc.join(timeout=1.0)
+        for ring in self.rings:
+            ring.close()
+        for bell in self.bar_bells + self.intent_bells:
+            bell.close()
+        self.rings = []
+        self.bar_bells = self.intent_bells = []
@@ -0,0 +1,68 @@
+"""
+FeedAuthorizer against a local aiohttp stand-in for the authorize endpoint
+"""
+
+import asyncio
+from aiohttp import web # type: ignore
+from utils.fetch_data_upstox import FeedAuthorizer
+
+
+async def serve(data):
+    """
+    authorize stand-in, every call returns a new URI plus `data`
+    (the real response carries nothing else);
+    -> (runner, base_url, calls)
+    """
+    calls = []
+
+    async def authorize(request):
+        calls.append(request.headers["Authorization"])
+        uri = f"wss://feed.test/{len(calls)}"
+        return web.json_response({"status": "success", "data": dict(data, authorized_redirect_uri=uri)})
+
+    app = web.Application()
+    app.router.add_get("/v3/feed/market-data-feed/authorize", authorize)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", calls
+
+
+def test_prefetched_uris_are_cache_hits():
+    async def run():
+        runner, base_url, calls = await serve({})
+        auth = FeedAuthorizer("token", base_url=base_url)
+        try:
+            assert await auth.prefetch(2) == 2
+            assert len(calls) == 2
+            uris = {await auth.get_uri(), await auth.get_uri()}
+            assert uris == {"wss://feed.test/1", "wss://feed.test/2"}
+            assert len(calls) == 2  # both served from the cache
+
+            # handed out once each: the next one is a fresh request
+            assert await auth.get_uri() == "wss://feed.test/3"
+            assert calls == ["Bearer token"] * 3
+        finally:
+            await auth.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_uris_expire_after_ttl():
+    async def run():
+        runner, base_url, calls = await serve({})
+        auth = FeedAuthorizer("token", base_url=base_url, ttl=0.05)
+        try:
+            await auth.prefetch(1)
+            assert await auth.prefetch(1) == 1
+            assert len(calls) == 1  # still valid, no new request
+            await asyncio.sleep(0.1)
+            assert await auth.get_uri() == "wss://feed.test/2"
+        finally:
+            await auth.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
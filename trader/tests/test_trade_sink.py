@@ -0,0 +1,68 @@
+"""
+TradeSink against the provided InMemoryCollection
+"""
+
+import asyncio
+import json
+from trade_sink import TradeSink, InMemoryCollection
+
+
+def trade(ts, **extra):
+    return dict({"instrument": "NSE_EQ|TEST", "ts": ts}, **extra)
+
+
+def emitted(sink):
+    docs = []
+    while not sink.queue.empty():
+        docs.append(sink.queue.get_nowait())
+    return docs
+
+
+def test_rejected_records_are_dead_lettered_not_retried(tmp_path):
+    # mongo's unique _id index
+    collection = InMemoryCollection(unique_key="_id", reject=lambda d: d.get("bad"))
+    sink = TradeSink(collection, spill_path=tmp_path / "spill.jsonl", dead_letter_path=tmp_path / "dead.jsonl")
+
+    async def run():
+        sink.emit(trade(1))
+        await sink.flush(emitted(sink))
+        # 1 is already stored, 3 is rejected, 2 and 4 go in
+        for record in (trade(1), trade(2), trade(3, bad=True), trade(4)):
+            sink.emit(record)
+        await sink.flush(emitted(sink))
+
+    asyncio.run(run())
+
+    assert sorted(d["ts"] for d in collection.docs) == [1, 2, 4]
+    assert sink.stats["written"] == 4  # the duplicate counts as written
+    assert sink.stats["duplicates"] == 1
+    assert sink.stats["spilled"] == 0
+    assert sink.stats["dead_lettered"] == 1
+    assert not (tmp_path / "spill.jsonl").exists()
+    dead = [json.loads(line) for line in (tmp_path / "dead.jsonl").read_text().splitlines()]
+    assert [(d["error"]["code"], d["record"]["ts"]) for d in dead] == [(121, 3)]
+
+
+def test_outage_spills_the_batch_and_replays_it_once(tmp_path):
+    collection = InMemoryCollection(unique_key="_id")
+    sink = TradeSink(collection, spill_path=tmp_path / "spill.jsonl", dead_letter_path=tmp_path / "dead.jsonl")
+
+    async def run():
+        for record in (trade(1), trade(2)):
+            sink.emit(record)
+        batch = emitted(sink)
+        # 1 went in before the connection dropped
+        await collection.insert_many([dict(batch[0])])
+        collection.available = False
+        await sink.flush(batch)
+        assert sink.stats["spilled"] == 2
+        collection.available = True
+        sink.emit(trade(3))
+        await sink.flush(emitted(sink))
+
+    asyncio.run(run())
+
+    assert sorted(d["ts"] for d in collection.docs) == [1, 2, 3]
+    assert sink.stats["replayed"] == 2
+    assert sink.stats["duplicates"] == 1
+    assert not (tmp_path / "spill.jsonl").exists()
@@ -0,0 +1,232 @@
+"""
+batched async sink for trade events
+
+trade records are buffered and written with one `insert_many`
+once `max_batch` records are waiting or `max_delay` seconds have
+passed. when the database is unreachable the batch is spilled to a
+local jsonl file, which is replayed after the next successful write.
+
+every record gets a deterministic `_id` (see `trade_id`), so a record
+written twice (a replay after a partial write, a batch cancelled
+mid-write) is a duplicate key error, counted as written. other
+per-record write errors of a BulkWriteError (validation, ...) are
+permanent: those records go to a dead-letter file with their error
+instead of being retried forever.
+
+works with a motor collection or any object with an async
+`insert_many(docs, ordered=...)`, e.g. `InMemoryCollection`
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+import motor.motor_asyncio # type: ignore
+from pymongo.errors import BulkWriteError # type: ignore
+
+
+DUPLICATE_KEY = 11000
+
+
+def trade_id(record: dict) -> str:
+    """
+    stable key of a trade record: one position per instrument at a
+    time, so an entry is its instrument and entry bar, an exit adds
+    the exit bar
+    """
+    if record.get("type") == "EXIT":
+        return f"EXIT:{record['instrument']}:{record['ts_entry']}:{record['ts_exit']}"
+    return f"ENTRY:{record['instrument']}:{record['ts']}"
+
+
+def mongo_collection(mongo_uri: str, db_name: str = "trade_logs", coll_name: str = "sma_2_7"):
+    client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    return client[db_name][coll_name]
+
+
+class InMemoryCollection:
+    """
+    stand-in for a motor collection; set `available = False`
+    to simulate an outage.
+
+    unique_key: field with a unique index, a record repeating a stored
+    value fails with a duplicate key error
+    reject: optional doc -> bool, matching records fail validation
+
+    like an unordered insert_many, the other records of a batch are
+    inserted and the failures are raised as one BulkWriteError
+    """
+    def __init__(self, unique_key: str | None = None, reject=None):
+        self.docs: list[dict] = []
+        self.available = True
+        self.calls = 0
+        self.unique_key = unique_key
+        self.reject = reject
+
+
+    async def insert_many(self, docs, ordered: bool = True):
+        self.calls += 1
+        if not self.available:
+            raise ConnectionError("in-memory collection unavailable")
+        keys = {d.get(self.unique_key) for d in self.docs} if self.unique_key else set()
+        errors = []
+        for index, doc in enumerate(docs):
+            if self.unique_key and doc.get(self.unique_key) in keys:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": "duplicate key"})
+            elif self.reject and self.reject(doc):
+                errors.append({"index": index, "code": 121, "errmsg": "document failed validation"})
+            else:
+                self.docs.append(doc)
+                if self.unique_key:
+                    keys.add(doc.get(self.unique_key))
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+
+class TradeSink:
+    def __init__(self,
+                 collection,
+                 max_batch: int = 100,
+                 max_delay: float = 1.0,
+                 spill_path: str = "trade_spill.jsonl",
+                 dead_letter_path: str = "trade_dead_letter.jsonl"):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.spill_path = Path(spill_path)
+        self.dead_letter_path = Path(dead_letter_path)
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._batch: list[dict] = []  # taken off the queue, not yet written
+        self.stats = {"written": 0, "batches": 0, "spilled": 0, "replayed": 0, "duplicates": 0, "dead_lettered": 0}
+
+
+    def emit(self, record: dict) -> None:
+        """
+        non-blocking, called from the portfolio actor
+        """
+        record = dict(record)
+        record.setdefault("_id", trade_id(record))
+        self.queue.put_nowait(record)
+
+
+    async def _next_batch(self) -> list[dict]:
+        batch = self._batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+
+    async def _write(self, docs: list[dict]) -> None:
+        """
+        raises when nothing could be written; records rejected by the
+        database go to the dead-letter file
+        """
+        try:
+            await self.collection.insert_many([dict(d) for d in docs], ordered=False)
+            written, rejected = len(docs), []
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            duplicates = sum(1 for err in errors if err.get("code") == DUPLICATE_KEY)
+            rejected = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+            written = e.details.get("nInserted", 0) + duplicates
+            self.stats["duplicates"] += duplicates
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        if rejected:
+            print(f"[{datetime.now()}] --[X]-- [TRADE-SINK] {len(rejected)} of {len(docs)} trades rejected, "
+                  f"see {self.dead_letter_path}.")
+            await asyncio.to_thread(self._dead_letter_sync, [
+                {"error": {"code": err.get("code"), "errmsg": err.get("errmsg")}, "record": docs[err["index"]]}
+                for err in rejected
+            ])
+            self.stats["dead_lettered"] += len(rejected)
+
+
+    def _spill_sync(self, docs: list[dict]) -> None:
+        with open(self.spill_path, "a") as f:
+            for d in docs:
+                f.write(json.dumps(d, default=str) + "\n")
+
+
+    def _dead_letter_sync(self, entries: list[dict]) -> None:
+        with open(self.dead_letter_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+
+    def _take_spill_sync(self) -> list[dict]:
+        """
+        moves the spill file aside and returns its records
+        """
+        if not self.spill_path.exists():
+            return []
+        replaying = self.spill_path.with_suffix(".replaying")
+        os.replace(self.spill_path, replaying)
+        with open(replaying, "r") as f:
+            docs = [json.loads(line) for line in f if line.strip()]
+        replaying.unlink()
+        return docs
+
+
+    async def _replay_spill(self) -> None:
+        docs = await asyncio.to_thread(self._take_spill_sync)
+        if not docs:
+            return
+        done = 0
+        try:
+            while done < len(docs):
+                chunk = docs[done:done + self.max_batch]
+                await self._write(chunk)
+                done += len(chunk)
+            print(f"[{datetime.now()}] [TRADE-SINK] Replayed {len(docs)} spilled trades.")
+        except Exception as e:
+            print(f"[{datetime.now()}] [TRADE-SINK] Spill replay failed, keeping {len(docs) - done} for later: {e}")
+        if done < len(docs):
+            await asyncio.to_thread(self._spill_sync, docs[done:])
+        self.stats["replayed"] += done
+
+
+    async def flush(self, docs: list[dict]) -> None:
+        try:
+            await self._write(docs)
+        except Exception as e:
+            print(f"[{datetime.now()}] --[X]-- [TRADE-SINK] insert_many failed, spilling {len(docs)} trades: {e}")
+            await asyncio.to_thread(self._spill_sync, docs)
+            self.stats["spilled"] += len(docs)
+            return
+
+        if self.spill_path.exists():
+            await self._replay_spill()
+
+
+    async def run(self):
+        """
+        writer loop, runs until cancelled; whatever is buffered
+        at cancellation goes to the spill file
+        """
+        if self.spill_path.exists():
+            await self._replay_spill()
+        try:
+            while True:
+                await self.flush(await self._next_batch())
+                self._batch = []
+        except asyncio.CancelledError:
+            # at-least-once: a batch cancelled mid-write is replayed, what
+            # already went in is a duplicate key
+            leftover = self._batch
+            while not self.queue.empty():
+                leftover.append(self.queue.get_nowait())
+            if leftover:
+                self._spill_sync(leftover)
+            raise
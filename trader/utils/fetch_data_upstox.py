@@ -4,11 +4,14 @@ high frequency data from upstox api
 
 import asyncio
 import json
+import time
+from collections import deque
 from urllib.parse import quote 
 from bson import ObjectId # type: ignore
 import ssl
 import websockets # type: ignore
 import requests # type: ignore
+import aiohttp # type: ignore
 from google.protobuf.json_format import MessageToDict # type: ignore
 from dotenv import load_dotenv # type: ignore
 import os
@@ -22,6 +25,9 @@ load_dotenv(env_path)
 # INSTRUMENT = "NSE_INDEX|Nifty 50"
 INSTRUMENT = "NSE_EQ|INE839G01010"
 
+# overridable so the clients can be pointed at a local HTTP stand-in
+UPSTOX_API_BASE = os.getenv("UPSTOX_API_BASE", "https://api.upstox.com")
+
 def get_market_data_feed_authorize_v3(access_token):
     """Get authorization for market data feed."""
     # access_token = os.getenv("ACCESS_TOKEN")
@@ -29,11 +35,106 @@ def get_market_data_feed_authorize_v3(access_token):
         'Accept': 'application/json',
         'Authorization': f'Bearer {access_token}'
     }
-    url = 'https://api.upstox.com/v3/feed/market-data-feed/authorize'
+    url = f'{UPSTOX_API_BASE}/v3/feed/market-data-feed/authorize'
     api_response = requests.get(url=url, headers=headers)
     return api_response.json()
 
 
+class FeedAuthorizer:
+    """
+    non-blocking market data feed authorization
+
+    - one pooled aiohttp session for every request
+    - redirect URIs are cached for `ttl` seconds and handed out once
+      each, since every websocket connection needs its own. the
+      authorize response (`data.authorized_redirect_uri`) carries no
+      expiry, `ttl` is a conservative guess at how long one stays valid
+    - `prefetch(n)` authorizes n connections concurrently (one per shard)
+    """
+    def __init__(self,
+                 access_token,
+                 base_url: str | None = None,
+                 ttl: float = 50.0,
+                 timeout: float = 10.0):
+        self.access_token = access_token
+        self.url = f"{base_url or UPSTOX_API_BASE}/v3/feed/market-data-feed/authorize"
+        self.ttl = ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._cache: deque = deque()  # (expires_at, uri), soonest expiry first
+        self._lock = asyncio.Lock()
+
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                headers={
+                    'Accept': 'application/json',
+                    'Authorization': f'Bearer {self.access_token}'
+                },
+            )
+        return self._session
+
+
+    async def _authorize(self) -> tuple[float, str]:
+        """
+        -> (expires_at on the monotonic clock, uri)
+        """
+        session = await self._get_session()
+        async with session.get(self.url) as resp:
+            resp.raise_for_status()
+            payload = await resp.json()
+
+        data = payload.get("data", {})
+        uri = data.get("authorized_redirect_uri")
+        if not uri:
+            raise RuntimeError(f"no authorized_redirect_uri in response: {payload}")
+        return time.monotonic() + self.ttl, uri
+
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        while self._cache and self._cache[0][0] <= now:
+            self._cache.popleft()
+
+
+    async def prefetch(self, n: int) -> int:
+        """
+        fills the cache up to n valid URIs with concurrent requests,
+        returns how many are cached afterwards
+        """
+        async with self._lock:
+            self._drop_expired()
+            missing = n - len(self._cache)
+            if missing > 0:
+                results = await asyncio.gather(
+                    *(self._authorize() for _ in range(missing)), return_exceptions=True
+                )
+                for r in results:
+                    if isinstance(r, Exception):
+                        print(f"[AUTH] Prefetch failed: {r}")
+                    else:
+                        self._cache.append(r)
+                self._cache = deque(sorted(self._cache))
+            return len(self._cache)
+
+
+    async def get_uri(self) -> str:
+        """
+        a still-valid cached URI if there is one, otherwise a fresh one
+        """
+        self._drop_expired()
+        if self._cache:
+            return self._cache.popleft()[1]
+        return (await self._authorize())[1]
+
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
 def decode_protobuf(buffer):
     """Decode protobuf message."""
     feed_response = pb.FeedResponse() # type: ignore
@@ -109,7 +210,7 @@ def fetch_intraday_historical_data(instrument, access_token) -> list[list[float]
     """
     instrument = quote(instrument)
 
-    url = f'https://api.upstox.com/v3/historical-candle/intraday/{instrument}/minutes/1'
+    url = f'{UPSTOX_API_BASE}/v3/historical-candle/intraday/{instrument}/minutes/1'
     headers = {
         'Content-Type': 'application/json',
         'Accept': 'application/json',
@@ -128,6 +229,28 @@ def fetch_intraday_historical_data(instrument, access_token) -> list[list[float]
     
     return [[]]
 
+
+async def fetch_intraday_historical_data_async(instrument, access_token, session) -> list[list[float]]:
+    """
+    non-blocking variant of fetch_intraday_historical_data,
+    meant to be run concurrently over a shared aiohttp session
+    """
+    url = f'{UPSTOX_API_BASE}/v3/historical-candle/intraday/{quote(instrument)}/minutes/1'
+    headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Authorization': f'Bearer {access_token}'
+    }
+    async with session.get(url, headers=headers) as response:
+        if response.status != 200:
+            print(f"Error: {response.status} - {await response.text()}")
+            return []
+        payload = await response.json()
+
+    data = payload.get('data', {}).get('candles', [])
+    data.reverse()
+    return data
+
 # data = fetch_intraday_historical_data("NSE_EQ|INE839G01010", os.getenv("ACCESS_TOKEN"))
 # data.reverse()
 # print(data)
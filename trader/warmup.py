@@ -0,0 +1,200 @@
+"""
+strategy warm-up at trader startup
+
+history for every configured instrument is fetched concurrently
+(one request per instrument, however many strategies use it),
+kept in a local on-disk cache and handed to each strategy (or
+shared IndicatorSet) trimmed to the window it needs.
+
+anything with `instrument`, `warmup_window` and `prime(closes)`
+can be warmed up; gap replay additionally needs `update(bar)`.
+
+given a `store` (anything with `closes(symbol, timeframe, n, max_age_ms)`,
+e.g. utils/bar_store.py's BarStore over the aggregator's sink), 1-minute
+closes already stored locally are used before asking the broker, as
+long as they are from today and reach up to the last `store_max_age_ms`
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+import aiohttp # type: ignore
+from position_book import find_exits
+from utils.fetch_data_upstox import fetch_intraday_historical_data_async
+
+
+class HistoryCache:
+    """
+    one json file of intraday candles per instrument and day.
+    a file younger than `max_age` seconds is served without a
+    download, so crash/restart loops don't hit the broker
+    """
+    def __init__(self, directory: str = "cache/history", max_age: float = 120.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+
+
+    def path(self, instrument: str) -> Path:
+        day = datetime.now().strftime("%Y%m%d")
+        safe = instrument.replace("|", "_").replace(" ", "_")
+        return self.directory / f"{safe}_{day}.json"
+
+
+    def load(self, instrument: str) -> list | None:
+        path = self.path(instrument)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+    def store(self, instrument: str, candles: list) -> None:
+        path = self.path(instrument)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(candles, f)
+        tmp.replace(path)
+
+
+async def warm_up(strategies, access_token, cache: HistoryCache | None = None, concurrency: int = 8, store=None,
+                  store_max_age_ms: int = 300000) -> dict:
+    """
+    primes every strategy from stored, cached or freshly fetched history.
+    returns per-run stats (store / cache hits, downloads, elapsed)
+    """
+    started = time.monotonic()
+    cache = cache or HistoryCache()
+    instruments = sorted({s.instrument for s in strategies})
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"instruments": len(instruments), "store_hits": 0, "cache_hits": 0, "downloads": 0, "failed": 0}
+    needed = {}
+    for s in strategies:
+        needed[s.instrument] = max(needed.get(s.instrument, 0), s.warmup_window)
+
+    async def load_one(session, instrument):
+        if store is not None:
+            try:
+                # the aggregator stores symbols without the exchange prefix
+                closes = await asyncio.to_thread(
+                    store.closes, instrument.split("|")[-1], "1m", needed[instrument], store_max_age_ms,
+                )
+            except Exception as e:
+                print(f"[WARMUP] {instrument}: bar store read failed: {e}")
+                closes = []
+            if len(closes) >= needed[instrument]:
+                stats["store_hits"] += 1
+                # same shape as broker candles, only the close is read
+                return instrument, [[None, None, None, None, c] for c in closes]
+
+        candles = await asyncio.to_thread(cache.load, instrument)
+        if candles is not None:
+            stats["cache_hits"] += 1
+            return instrument, candles
+
+        async with semaphore:
+            try:
+                candles = await fetch_intraday_historical_data_async(instrument, access_token, session)
+            except Exception as e:
+                print(f"[WARMUP] {instrument}: history fetch failed: {e}")
+                stats["failed"] += 1
+                return instrument, []
+
+        stats["downloads"] += 1
+        if candles:
+            await asyncio.to_thread(cache.store, instrument, candles)
+        return instrument, candles
+
+    async with aiohttp.ClientSession() as session:
+        results = dict(await asyncio.gather(*(load_one(session, i) for i in instruments)))
+
+    for strategy in strategies:
+        closes = [c[4] for c in results.get(strategy.instrument, []) if len(c) > 4]
+        strategy.prime(closes)
+        print(f"[WARMUP] [{strategy.instrument}] primed with {min(len(closes), strategy.warmup_window)} of {len(closes)} closes.")
+
+    stats["elapsed_s"] = round(time.monotonic() - started, 3)
+    print(f"[WARMUP] {stats}")
+    return stats
+
+
+def candle_ts_ms(candle: list) -> int:
+    """
+    upstox candles carry an ISO timestamp, bars carry epoch ms
+    """
+    return int(datetime.fromisoformat(candle[0]).timestamp() * 1000)
+
+
+async def replay_gap(strategies, last_ts: dict, access_token, cache: HistoryCache | None = None,
+                     book=None, on_exit=None) -> dict:
+    """
+    after a restore, feeds each indicator set only the bars it missed
+    (ts newer than the last one processed before the crash).
+    no signals are taken on gap bars, but stops and targets are: with
+    the restored position book (a BookView), the gap bars are checked
+    in order and on_exit(instrument, bar, reason) gets the first hit of
+    every open position
+    """
+    started = time.monotonic()
+    cache = cache or HistoryCache()
+    instruments = sorted({s.instrument for s in strategies})
+
+    async def load_one(session, instrument):
+        candles = await asyncio.to_thread(cache.load, instrument)
+        if candles is None:
+            candles = await fetch_intraday_historical_data_async(instrument, access_token, session)
+            if candles:
+                await asyncio.to_thread(cache.store, instrument, candles)
+        return instrument, candles
+
+    async with aiohttp.ClientSession() as session:
+        results = dict(await asyncio.gather(*(load_one(session, i) for i in instruments)))
+
+    replayed = {}
+    for strategy in strategies:
+        since = last_ts.get(strategy.instrument, 0)
+        gap = [
+            {"ts": str(candle_ts_ms(c)), "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5]}
+            for c in results.get(strategy.instrument, []) if len(c) > 5 and candle_ts_ms(c) > since
+        ]
+        for bar in gap:
+            strategy.update(bar)
+        if gap:
+            last_ts[strategy.instrument] = int(gap[-1]["ts"])
+        replayed[strategy.instrument] = len(gap)
+
+        if book is not None and on_exit and strategy.instrument in book.index:
+            for bar in gap:
+                exits = find_exits(book, {strategy.instrument: bar})
+                if exits:
+                    on_exit(strategy.instrument, bar, exits[0][1])
+                    break
+
+    print(f"[WARMUP] Gap replayed {replayed} in {time.monotonic() - started:.3f}s")
+    return replayed
+
+
+class FirstSignalClock:
+    """
+    reports restart-to-first-signal time once, the first
+    time any strategy evaluates a live bar
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.elapsed = None
+
+
+    def since_start(self) -> float:
+        return time.monotonic() - self.started
+
+
+    def mark(self, instrument: str) -> None:
+        if self.elapsed is not None:
+            return
+        self.elapsed = time.monotonic() - self.started
+        print(f"[WARMUP] Restart-to-first-signal: {self.elapsed:.3f}s ({instrument})")
@@ -1,39 +1,271 @@
 """
-Tick aggregator for 1-minute OHLCV generation + MongoDB time-series flush
-Uses motor (async) and an asyncio.Queue for non-blocking operation.
+Tick aggregator for 1-minute OHLCV generation + flush to a storage sink
+(MongoDB time-series via motor, SQLite, columnar files or in-memory, see
+sinks.py). Uses an asyncio.Queue for non-blocking operation.
+
+Ticks are drained from the queue and applied to the buckets in batches.
+Buckets are indexed by their closing minute (a min-heap of minutes), so a
+flush only touches buckets that are due, not every bucket of every symbol.
+Symbols are interned to integer ids and each minute's bars live in typed
+columns (`MinuteBuckets`) indexed by id, with no per-bucket objects.
+Closed 1-minute bars are folded into higher timeframes (`Rollup`, aligned
+to the IST session open), each flushed to its own `bars_<label>` collection.
+Writes go through one `BulkWriter` per collection (see bar_writer.py):
+retried with backoff, spilled to disk while Mongo is unreachable.
+
+Minutes close on a watermark: the newest tick time seen less a reorder
+window (or wall clock less `late_ms` while the feed is quiet). Closed
+minutes stay in memory for `amend_ms` more; a tick landing in one
+updates its bar, and every bar touched in a flush cycle is written once
+as an upsert, through the same 1m writer (and spill log) as the original
+inserts, so it always lands after them. Rollups are built only from
+minutes that left that window, so they never need amending. Ticks
+older still are counted and appended to `late_ticks.jsonl`.
+`python aggregator.py` benchmarks ticks/sec against the old per-tick path.
 """
 
 import asyncio
+import heapq
+import json
 import time
+from array import array
 from datetime import datetime, timezone, timedelta
 from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import pytz  # type: ignore
-import motor.motor_asyncio # type: ignore
-from pymongo.errors import ConnectionFailure # type: ignore
+from bar_writer import BulkWriter
+from sinks import make_sink
+
+
+class SymbolTable:
+    """
+    interns symbols to dense integer ids, for the life of the aggregator
+    """
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, symbol):
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = self.ids[symbol] = len(self.names)
+            self.names.append(symbol)
+        return sid
+
+    def __len__(self):
+        return len(self.names)
+
+
+class MinuteBuckets:
+    """
+    OHLCV + tick count for every symbol in one minute, as typed columns
+    indexed by symbol id. count == 0 means the symbol has no bar yet;
+    `sids` lists the ids that do, in order of their first tick.
+    open / close follow tick time (first_ts / last_ts), not arrival
+    order, so a reordered tick lands where it belongs
+    """
+    __slots__ = ("start_ms", "open", "high", "low", "close", "volume", "count", "first_ts", "last_ts", "sids")
+
+    def __init__(self, start_ms, capacity):
+        self.start_ms = start_ms
+        self.sids = []
+        capacity = max(capacity, 16)
+        for name in ("open", "high", "low", "close", "volume"):
+            setattr(self, name, array("d", bytes(8 * capacity)))
+        for name in ("count", "first_ts", "last_ts"):
+            setattr(self, name, array("q", bytes(8 * capacity)))
+
+    def grow(self, capacity):
+        extra = capacity - len(self.count)
+        for name in ("open", "high", "low", "close", "volume", "count", "first_ts", "last_ts"):
+            getattr(self, name).extend(array(getattr(self, name).typecode, bytes(8 * extra)))
+
+    def update(self, sid, price, size, ts_ms):
+        if sid >= len(self.count):
+            self.grow(max(sid + 1, 2 * len(self.count)))
+        if self.count[sid] == 0:
+            self.open[sid] = self.high[sid] = self.low[sid] = self.close[sid] = price
+            self.volume[sid] = size
+            self.count[sid] = 1
+            self.first_ts[sid] = self.last_ts[sid] = ts_ms
+            self.sids.append(sid)
+            return
+        if price > self.high[sid]:
+            self.high[sid] = price
+        elif price < self.low[sid]:
+            self.low[sid] = price
+        if ts_ms >= self.last_ts[sid]:
+            self.close[sid] = price
+            self.last_ts[sid] = ts_ms
+        elif ts_ms < self.first_ts[sid]:
+            self.open[sid] = price
+            self.first_ts[sid] = ts_ms
+        self.volume[sid] += size
+        self.count[sid] += 1
+
+    def merge(self, sid, other, other_sid):
+        """
+        folds bar other_sid of an earlier interval into this one
+        """
+        if sid >= len(self.count):
+            self.grow(max(sid + 1, 2 * len(self.count)))
+        if self.count[sid] == 0:
+            self.open[sid] = other.open[other_sid]
+            self.high[sid] = other.high[other_sid]
+            self.low[sid] = other.low[other_sid]
+            self.volume[sid] = 0.0
+            self.first_ts[sid] = other.first_ts[other_sid]
+            self.sids.append(sid)
+        else:
+            self.high[sid] = max(self.high[sid], other.high[other_sid])
+            self.low[sid] = min(self.low[sid], other.low[other_sid])
+        self.close[sid] = other.close[other_sid]
+        self.last_ts[sid] = other.last_ts[other_sid]
+        self.volume[sid] += other.volume[other_sid]
+        self.count[sid] += other.count[other_sid]
+
+    def bar(self, sid):
+        return {
+            "open": self.open[sid], "high": self.high[sid], "low": self.low[sid], "close": self.close[sid],
+            "volume": self.volume[sid], "count": self.count[sid], "start_ms": self.start_ms,
+        }
+
+    def bars(self, symbols):
+        """
+        (symbol, bar dict) for every symbol with ticks in this minute
+        """
+        return [(symbols.names[sid], self.bar(sid)) for sid in self.sids]
+
+    def __len__(self):
+        return len(self.sids)
+
+
+def parse_hhmm(hhmm):
+    hour, minute = hhmm.split(":")
+    return int(hour), int(minute)
+
+
+class Rollup:
+    """
+    one higher timeframe built from closed 1-minute bars.
+    intervals are aligned to the IST session open, so with the default
+    09:15 - 15:30 session the 1h bars are 09:15, 10:15, ... and the last
+    one of the day is cut at the session close (15:15 - 15:30)
+    """
+    def __init__(self, label, minutes, tz, session_start="09:15", session_end="15:30"):
+        self.label = label
+        self.step_ms = minutes * 60000
+        self.tz = tz
+        self.session_start = parse_hhmm(session_start)
+        self.session_end = parse_hhmm(session_end)
+        self._sessions = {}     # day -> (open ms, close ms)
+        self.buckets = {}       # interval start (ms) -> MinuteBuckets
+        self.heap = []          # (interval end, interval start)
+
+    def _session(self, ts_ms):
+        dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).astimezone(self.tz)
+        day = dt.date()
+        session = self._sessions.get(day)
+        if session is None:
+            at = lambda hm: int(dt.replace(hour=hm[0], minute=hm[1], second=0, microsecond=0).timestamp() * 1000)
+            session = self._sessions[day] = (at(self.session_start), at(self.session_end))
+            if len(self._sessions) > 7:
+                self._sessions.pop(next(iter(self._sessions)))
+        return session
+
+    def interval(self, minute_ms):
+        """
+        (start, end) of the interval holding the minute starting at minute_ms
+        """
+        open_ms, close_ms = self._session(minute_ms)
+        # post-close minutes (closing session) get intervals of their own
+        anchor = close_ms if minute_ms >= close_ms else open_ms
+        start = anchor + (minute_ms - anchor) // self.step_ms * self.step_ms
+        end = start + self.step_ms
+        if start < close_ms < end:
+            end = close_ms
+        return start, end
+
+    def add(self, minute):
+        start, end = self.interval(minute.start_ms)
+        target = self.buckets.get(start)
+        if target is None:
+            target = self.buckets[start] = MinuteBuckets(start, len(minute.count))
+            heapq.heappush(self.heap, (end, start))
+        for sid in minute.sids:
+            target.merge(sid, minute, sid)
+
+    def pop_due(self, cutoff_ms, symbols):
+        bars = []
+        while self.heap and self.heap[0][0] <= cutoff_ms:
+            _, start = heapq.heappop(self.heap)
+            bars.extend(self.buckets.pop(start).bars(symbols))
+        return bars
+
+
+# label -> minutes
+DEFAULT_ROLLUPS = {"5m": 5, "15m": 15, "1h": 60}
 
 
 class TickAggregator:
-    def __init__(self, mongo_uri, db_name="market-data", coll_name="bars_1m"):
+    def __init__(self, sink, db_name="market-data", coll_name="bars_1m", max_batch=5000,
+                 rollups=None, session_start="09:15", session_end="15:30", spill_dir="aggregator_spill",
+                 reorder_ms=2000, amend_ms=120000):
+        """
+        sink: a sink url (mongodb://, sqlite:///, columnar:///, memory://,
+        see sinks.py) or a sink object
+        rollups: label -> minutes for the higher timeframes to maintain
+        (DEFAULT_ROLLUPS when None, {} for 1-minute bars only); each goes
+        to the `bars_<label>` collection of the same sink
+        spill_dir: where bars that cannot be written yet are kept
+        reorder_ms: how far behind the newest tick a tick may be and
+        still reach its minute before the minute is flushed
+        amend_ms: how long a flushed minute still accepts ticks, as
+        amendments to the stored bar
+        """
+        rollups = DEFAULT_ROLLUPS if rollups is None else rollups
         try:
-            self.client = motor.motor_asyncio.AsyncIOMotorClient(
-                mongo_uri, serverSelectionTimeoutMS=5000
-            )
-            self.mongo = self.client[db_name][coll_name]
-            print(f"[{datetime.now()}] MongoDB client initialised.")
+            self.sink = make_sink(sink, db_name)
+            self.collection = self.sink.collection(coll_name)
+            self.rollup_sinks = {label: self.sink.collection(f"bars_{label}") for label in rollups}
+            print(f"[{datetime.now()}] Sink initialised: {self.sink}")
         except Exception as e:
-            print(f"[{datetime.now()}] --[x]-- MongoDB client init failed:", e)
+            print(f"[{datetime.now()}] --[x]-- Sink init failed:", e)
             raise
 
-        self.buckets = {}
+        self.symbols = SymbolTable()
+        self.buckets = {}       # minute start (ms) -> MinuteBuckets
+        self.minute_heap = []   # open minutes, for expiry
+        self.closed = {}        # flushed minutes still open to amendments
+        self.closed_heap = []
+        self.amended = {}       # closed minute start -> sids touched since the last flush
+        self.too_late = []      # ticks past the amendment window, for the dead-letter file
+        self.max_event_ms = 0
         self.lock = asyncio.Lock()
         self.queue = asyncio.Queue()
-        self.late_ms = 5000
+        self.reorder_ms = reorder_ms
+        self.amend_ms = amend_ms
+        self.late_ms = 5000     # wall-clock lateness that closes minutes on a quiet feed
         self.flush_interval = 1.0
+        self.max_batch = max_batch  # ticks applied per processor pass
+        self.report_every = 60.0    # seconds between writer metric reports
+        self.writers = {
+            label: BulkWriter(collection, name=coll_name if label == "1m" else f"bars_{label}", spill_dir=spill_dir)
+            for label, collection in {"1m": self.collection, **self.rollup_sinks}.items()
+        }
+        self.late_path = Path(spill_dir) / "late_ticks.jsonl"
+        self.stats = {"ticks": 0, "batches": 0, "discarded": 0, "amended": 0, "too_late": 0}
 
         
         self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='AggregatorExecutor')
 
         self.tz = pytz.timezone("Asia/Kolkata")
+        self.rollups = [
+            Rollup(label, minutes, self.tz, session_start, session_end)
+            for label, minutes in rollups.items()
+        ]
         now_ist = datetime.now(self.tz)
         
         is_top_of_minute = now_ist.second == 0 and now_ist.microsecond == 0
@@ -55,12 +287,10 @@ class TickAggregator:
 
     async def connect_db(self):
         try:
-            await self.client.admin.command("ping")
-            print(
-                f"[{datetime.now()}] -- Connected to MongoDB ({self.mongo.database.name}.{self.mongo.name})"
-            )
-        except ConnectionFailure as e:
-            print(f"[{datetime.now()}] --[x]-- MongoDB connection failed:", e)
+            await self.sink.ping()
+            print(f"[{datetime.now()}] -- Connected to {self.sink}")
+        except Exception as e:
+            print(f"[{datetime.now()}] --[x]-- Sink connection failed:", e)
             raise
 
     def _bucket_key(self, symbol, ts_ms):
@@ -73,56 +303,92 @@ class TickAggregator:
             print(f"[{datetime.now()}] --[X]-- Error putting tick on queue:", e)
 
     
-    def _update_buckets_sync(self, tick, start_time_utc_ms):
-        symbol, price, size, ts_ms = tick
-        
-        
-        now_ms = int(time.time() * 1000)
-        bucket_start_ms = ts_ms - (ts_ms % 60000)
-        bucket_end_ms = bucket_start_ms + 60000
+    def watermark(self, now_ms):
+        """
+        minutes ending at or before this are complete. tick time is
+        capped at now + late_ms so one bad timestamp cannot close the day
+        """
+        event_ms = min(self.max_event_ms, now_ms + self.late_ms)
+        return max(event_ms - self.reorder_ms, now_ms - self.late_ms)
 
-        if now_ms - bucket_end_ms >= self.late_ms:
-            return False # tick was discarded
+    def _update_buckets_sync(self, tick, start_time_utc_ms, now_ms=None):
+        symbol, price, size, ts_ms = tick
 
         if ts_ms < start_time_utc_ms:
+            self.stats["discarded"] += 1
             return False
+        if ts_ms > self.max_event_ms:
+            self.max_event_ms = ts_ms
 
-        key = (symbol, bucket_start_ms)
-        b = self.buckets.get(key)
-        if not b:
-            self.buckets[key] = {
-                "open": price, "high": price, "low": price, "close": price,
-                "volume": size, "count": 1, "start_ms": key[1],
-            }
-        else:
-            b["high"] = max(b["high"], price)
-            b["low"] = min(b["low"], price)
-            b["close"] = price
-            b["volume"] += size
-            b["count"] += 1
-        
-        return True 
+        bucket_start_ms = ts_ms - (ts_ms % 60000)
+        minute = self.buckets.get(bucket_start_ms)
+        if minute is None:
+            minute = self.closed.get(bucket_start_ms)
+            if minute is None:
+                if now_ms is None:
+                    now_ms = int(time.time() * 1000)
+                watermark = self.watermark(now_ms)
+                bucket_end_ms = bucket_start_ms + 60000
+                if bucket_end_ms > watermark:
+                    minute = self.buckets[bucket_start_ms] = MinuteBuckets(bucket_start_ms, len(self.symbols))
+                    heapq.heappush(self.minute_heap, bucket_start_ms)
+                elif bucket_end_ms > watermark - self.amend_ms:
+                    # a minute that was flushed without this symbol
+                    minute = self.closed[bucket_start_ms] = MinuteBuckets(bucket_start_ms, len(self.symbols))
+                    heapq.heappush(self.closed_heap, bucket_start_ms)
+                else:
+                    self.stats["too_late"] += 1
+                    self.too_late.append(tick)
+                    return False
+            sid = self.symbols.intern(symbol)
+            minute.update(sid, price, size, ts_ms)
+            if minute is self.closed.get(bucket_start_ms):
+                self.amended.setdefault(bucket_start_ms, set()).add(sid)
+                self.stats["amended"] += 1
+            return True
+
+        minute.update(self.symbols.intern(symbol), price, size, ts_ms)
+        return True
+
+    def open_buckets(self):
+        return sum(len(minute) for minute in self.buckets.values())
+
+    def _update_buckets_batch(self, ticks, start_time_utc_ms):
+        # one wall-clock read per batch; a batch spans microseconds
+        now_ms = int(time.time() * 1000)
+        applied = 0
+        for tick in ticks:
+            applied += self._update_buckets_sync(tick, start_time_utc_ms, now_ms)
+        self.stats["ticks"] += len(ticks)
+        self.stats["batches"] += 1
+        return applied
 
     async def _run_processor(self):
         """
         Reads ticks from the queue and updates the in-memory buckets.
+
+        Everything queued since the last pass is applied in one batch,
+        inline on the loop: a bucket update is a few dict operations,
+        far cheaper than a thread hop and a future per tick.
         """
         print(f"[{datetime.now()}] [.] Tick processor coroutine started.")
-        loop = asyncio.get_running_loop() 
 
         while True:
             try:
-                tick = await self.queue.get()
+                batch = [await self.queue.get()]
+                while len(batch) < self.max_batch and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
 
+                # no await inside, so the batch is applied atomically
+                # with respect to the flusher
                 async with self.lock:
-                    await loop.run_in_executor(
-                        self.executor, 
-                        self._update_buckets_sync, 
-                        tick, 
-                        self.start_time_utc_ms
-                    )
+                    self._update_buckets_batch(batch, self.start_time_utc_ms)
+
+                for _ in batch:
+                    self.queue.task_done()
 
-                self.queue.task_done()
+                # let producers and the flusher run between large batches
+                await asyncio.sleep(0)
 
             except asyncio.CancelledError:
                 print(f"[{datetime.now()}] [.] Tick processor shutting down.")
@@ -131,51 +397,126 @@ class TickAggregator:
                 print(f"[{datetime.now()}] --[X]-- Error in tick processor:", e)
 
 
-    def _find_flushable_buckets_sync(self, cutoff_ms):
-        """ bucket discovery logic. """
+    def _pop_due_buckets(self, cutoff_ms):
+        """
+        returns the bars of every minute that closed at or before
+        cutoff_ms; only due minutes are visited. the minutes move to
+        the closed store, where late ticks can still amend them
+        """
         to_flush = []
-        for (symbol, start_ms), b in self.buckets.items():
-            if start_ms + 60000 <= cutoff_ms:
-                to_flush.append((symbol, b))
-        
-        # return the list of buckets to be flushed. The deletion will happen back on the main thread inside the lock.
+        while self.minute_heap and self.minute_heap[0] + 60000 <= cutoff_ms:
+            start = heapq.heappop(self.minute_heap)
+            minute = self.closed[start] = self.buckets.pop(start)
+            heapq.heappush(self.closed_heap, start)
+            to_flush.extend(minute.bars(self.symbols))
         return to_flush
 
+    def _pop_amendments(self):
+        """
+        current bars for everything amended since the last call,
+        one per (minute, symbol) however many late ticks it took
+        """
+        bars = []
+        for start, sids in self.amended.items():
+            minute = self.closed[start]
+            bars.extend((self.symbols.names[sid], minute.bar(sid)) for sid in sids)
+        self.amended = {}
+        return bars
+
+    def _evict_closed(self, horizon_ms):
+        """
+        drops closed minutes that ended at or before horizon_ms, folding
+        their final bars into every rollup on the way out
+        """
+        while self.closed_heap and self.closed_heap[0] + 60000 <= horizon_ms:
+            minute = self.closed.pop(heapq.heappop(self.closed_heap))
+            for rollup in self.rollups:
+                rollup.add(minute)
+
+    def _pop_due_rollups(self, cutoff_ms):
+        """
+        label -> bars for every higher-timeframe interval that ended at or
+        before cutoff_ms. pass the eviction horizon: an interval is only
+        complete once all of its minutes have been folded in
+        """
+        due = {}
+        for rollup in self.rollups:
+            bars = rollup.pop_due(cutoff_ms, self.symbols)
+            if bars:
+                due[rollup.label] = bars
+        return due
+
+    def _cycle(self, cutoff_ms):
+        """
+        one flush cycle under the lock: (new 1m bars, amended 1m bars,
+        label -> rollup bars, too-late ticks)
+        """
+        horizon_ms = cutoff_ms - self.amend_ms
+        to_flush = self._pop_due_buckets(cutoff_ms)
+        amendments = self._pop_amendments()
+        self._evict_closed(horizon_ms)
+        rollups_due = self._pop_due_rollups(horizon_ms)
+        too_late, self.too_late = self.too_late, []
+        return to_flush, amendments, rollups_due, too_late
+
+    def _dead_letter_sync(self, ticks):
+        with open(self.late_path, "a") as f:
+            for tick in ticks:
+                f.write(json.dumps(tick) + "\n")
+
+    def metrics(self):
+        """
+        per-timeframe writer metrics: backlog, spill, write latency, counters
+        """
+        return {label: writer.metrics() for label, writer in self.writers.items()}
+
     async def flush_completed(self):
         print(f"[{datetime.now()}] [.] Flush coroutine started.")
-        loop = asyncio.get_running_loop()
+        # the writers live and die with the flusher
+        writer_tasks = [asyncio.create_task(w.run()) for w in self.writers.values()]
+        next_report = time.monotonic() + self.report_every
         while True:
             try:
                 await asyncio.sleep(self.flush_interval)
                 
                 now_ms = int(time.time() * 1000)
-                cutoff = now_ms - self.late_ms
-                
 
-                # find which buckets to flush in a background thread. a read-only operation and is safe to do outside the lock.
-                to_flush = await loop.run_in_executor(
-                    self.executor, self._find_flushable_buckets_sync, cutoff
-                )
-                
-                if to_flush:
-                    async with self.lock:
-                        for symbol, b in to_flush:
-                            if (symbol, b['start_ms']) in self.buckets:
-                                del self.buckets[(symbol, b['start_ms'])]
-                    
-                    await self._insert_to_db(to_flush)
+                # cheap enough to do inline: only due buckets are touched
+                async with self.lock:
+                    to_flush, amendments, rollups_due, too_late = self._cycle(self.watermark(now_ms))
+
+                await self._write_cycle(to_flush, amendments, rollups_due, too_late)
+
+                if time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.report_every
+                    print(f"[{datetime.now()}] [DB] Tick stats: {self.stats}")
+                    print(f"[{datetime.now()}] [DB] Writer metrics: {self.metrics()}")
 
             except asyncio.CancelledError:
                 print(f"[{datetime.now()}] [.] Flusher shutting down.")
+                for task in writer_tasks:
+                    task.cancel()
+                await asyncio.gather(*writer_tasks, return_exceptions=True)
                 return
             except Exception as e:
                 print(f"[{datetime.now()}] --[X]-- Error in flush loop:", e)
                 await asyncio.sleep(2)
 
 
+    async def _write_cycle(self, to_flush, amendments, rollups_due, too_late):
+        if to_flush:
+            await self._insert_to_db(to_flush)
+        if amendments:
+            await self._insert_to_db(amendments, upsert=True)
+        for label, bars in rollups_due.items():
+            await self._insert_to_db(bars, label)
+        if too_late:
+            await asyncio.to_thread(self._dead_letter_sync, too_late)
+            print(f"[{datetime.now()}] [!] {len(too_late)} tick(s) past the amendment window, kept in {self.late_path}")
+
     def _prepare_docs_sync(self, bars_to_flush):
         """
-        formatting the doc to be inserted into Mongo
+        formatting the doc to be inserted into the sink
         """
         docs = []
         for symbol, b in bars_to_flush:
@@ -191,7 +532,7 @@ class TickAggregator:
             docs.append(doc)
         return docs
 
-    async def _insert_to_db(self, bars_to_flush):
+    async def _insert_to_db(self, bars_to_flush, label="1m", upsert=False):
         
         loop = asyncio.get_running_loop()
 
@@ -202,42 +543,87 @@ class TickAggregator:
         if not docs:
             return
 
-        print(f"\n[{datetime.now()}] [...] Preparing to insert {len(docs)} bar(s):")
+        print(f"\n[{datetime.now()}] [...] Preparing to {'amend' if upsert else 'insert'} {len(docs)} {label} bar(s):")
         for d in docs[:5]:
              print(f"→ {d['meta']['symbol']} @ {d['ts_ist']} IST: O:{d['open']} H:{d['high']} L:{d['low']} C:{d['close']}")
         if len(docs) > 5:
             print(f"  ...and {len(docs) - 5} more.")
 
-        try:
-            print(f"[{datetime.now()}] [DB] Writing {len(docs)} bars to MongoDB...")
-            result = await self.mongo.insert_many(docs)
-            print(
-                f"[{datetime.now()}] ---- Inserted {len(result.inserted_ids)} bars into MongoDB.\n"
-            )
-        except Exception as e:
-            print(f"[{datetime.now()}] --[X]-- Mongo insert_many error:", e)
+        # non-blocking: the writer batches, retries and spills
+        await self.writers[label].submit(docs, upsert=upsert)
 
     async def flush_all_and_close(self):
         print(f"\n[{datetime.now()}] [!] Shutdown initiated. Flushing all remaining buckets...")
         
 
-        final_flush = []
+        # every open minute is closed now, and so is every (partial) rollup
         async with self.lock:
-            if self.buckets:
-                final_flush = [(key[0], b) for key, b in self.buckets.items()]
-                self.buckets.clear()
+            final_flush, amendments, rollups_due, too_late = self._cycle(float("inf"))
         
         if final_flush:
             print(f"[{datetime.now()}] [!] Found {len(final_flush)} remaining bars to flush.")
-            await self._insert_to_db(final_flush)
         else:
             print(f"[{datetime.now()}] [!] No remaining bars in memory.")
+        await self._write_cycle(final_flush, amendments, rollups_due, too_late)
 
-        self.client.close()
-        print(f"[{datetime.now()}] [!] MongoDB connection closed.")
+        for label, writer in self.writers.items():
+            await writer.close()
+            print(f"[{datetime.now()}] [!] {label} writer closed: {writer.metrics()}")
+
+        await self.sink.close()
+        print(f"[{datetime.now()}] [!] Sink closed.")
         
 
         # ensure that all pending tasks are completed before we exit.
         print(f"[{datetime.now()}] [!] Shutting down background thread pool...")
         self.executor.shutdown(wait=True)
-        print(f"[{datetime.now()}] [!] Executor shut down.")
\ No newline at end of file
+        print(f"[{datetime.now()}] [!] Executor shut down.")
+
+
+async def benchmark(n_ticks=200000, n_symbols=500):
+    """
+    ticks/sec of the batched inline processor against the previous
+    design (one lock, executor hop and future per tick).
+    runs against the in-memory sink, no database needed
+    """
+    now_ms = int(time.time() * 1000)
+    ticks = [
+        (f"SYM{i % n_symbols}", 100.0 + (i % 97) * 0.05, 1.0, now_ms - (i % 1000))
+        for i in range(n_ticks)
+    ]
+
+    async def per_tick(agg):
+        loop = asyncio.get_running_loop()
+        while True:
+            tick = await agg.queue.get()
+            async with agg.lock:
+                await loop.run_in_executor(agg.executor, agg._update_buckets_sync, tick, agg.start_time_utc_ms)
+            agg.queue.task_done()
+
+    results = {}
+    for name, runner in (("per_tick_executor", per_tick), ("batched_inline", lambda agg: agg._run_processor())):
+        agg = TickAggregator("memory://")
+        agg.start_time_utc_ms = 0
+        for tick in ticks:
+            agg.queue.put_nowait(tick)
+
+        started = time.perf_counter()
+        task = asyncio.create_task(runner(agg))
+        await agg.queue.join()
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        agg.executor.shutdown(wait=True)
+
+        results[name] = {
+            "ticks_per_sec": round(n_ticks / elapsed),
+            "elapsed_s": round(elapsed, 3),
+            "buckets": agg.open_buckets(),
+        }
+
+    results["speedup"] = round(results["batched_inline"]["ticks_per_sec"] / results["per_tick_executor"]["ticks_per_sec"], 1)
+    return results
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark()))
@@ -0,0 +1,360 @@
+"""
+Read side of the bar store written by TickAggregator.
+
+`BarStore(url)` takes the same sink urls as `make_sink` (sinks.py) and
+answers range queries by (symbol, timeframe, start, end) with a dict of
+numpy arrays:
+
+    ts (epoch ms, int64), open, high, low, close, volume, count
+
+Symbols are the aggregator's (the part of the instrument key after
+`|`), timeframes its collection suffixes ("1m", "5m", "15m", "1h").
+
+Recent windows are cached per symbol (LRU over symbols), so repeated
+or overlapping queries, e.g. a backtest walking one symbol, are sliced
+from memory. Only the settled part of a window is cached: bars newer
+than `settle_ms` can still be written or amended (watermark + amendment
+window), and are always read from the store.
+
+`python bar_store.py` benchmarks cold and cached queries on a
+synthetic columnar store.
+"""
+
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import numpy as np # type: ignore
+import pytz  # type: ignore
+from sinks import COLUMNS, InMemorySink, read_columnar
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def to_ms(t):
+    """
+    epoch ms from epoch ms, a datetime (naive = IST) or an ISO string (IST)
+    """
+    if t is None or isinstance(t, (int, np.integer)):
+        return t
+    if isinstance(t, str):
+        t = datetime.fromisoformat(t)
+    if t.tzinfo is None:
+        t = IST.localize(t)
+    return int(t.timestamp() * 1000)
+
+
+def empty_bars():
+    return {c: np.empty(0, dtype=np.int64 if t == "q" else np.float64) for c, t in COLUMNS}
+
+
+def from_rows(rows):
+    """
+    (ts, open, high, low, close, volume, count) tuples -> arrays
+    """
+    if not rows:
+        return empty_bars()
+    table = list(zip(*rows))
+    return {
+        c: np.asarray(col, dtype=np.int64 if t == "q" else np.float64)
+        for (c, t), col in zip(COLUMNS, table)
+    }
+
+
+def slice_bars(bars, start_ms, end_ms):
+    lo = 0 if start_ms is None else np.searchsorted(bars["ts"], start_ms, "left")
+    hi = len(bars["ts"]) if end_ms is None else np.searchsorted(bars["ts"], end_ms, "left")
+    return {c: v[lo:hi] for c, v in bars.items()}
+
+
+class ColumnarReader:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _days(self, timeframe, symbol):
+        base = self.root / f"bars_{timeframe}"
+        if not base.exists():
+            return []
+        safe = symbol.replace("/", "_").replace(" ", "_")
+        return sorted((day.name, day / safe) for day in base.iterdir() if (day / safe).is_dir())
+
+    def range(self, symbol, timeframe, start_ms, end_ms):
+        first = None if start_ms is None else _ist_day(start_ms)
+        last = None if end_ms is None else _ist_day(end_ms)
+        parts = [
+            read_columnar(path) for day, path in self._days(timeframe, symbol)
+            if (first is None or day >= first) and (last is None or day <= last)
+        ]
+        parts = [p for p in parts if "ts" in p and len(p["ts"])]
+        if not parts:
+            return empty_bars()
+        bars = {c: np.concatenate([p[c] for p in parts]) for c, _ in COLUMNS}
+        return slice_bars(bars, start_ms, end_ms)
+
+    def tail(self, symbol, timeframe, n):
+        parts, have = [], 0
+        for _, path in reversed(self._days(timeframe, symbol)):
+            part = read_columnar(path)
+            if "ts" in part and len(part["ts"]):
+                parts.append(part)
+                have += len(part["ts"])
+            if have >= n:
+                break
+        if not parts:
+            return empty_bars()
+        bars = {c: np.concatenate([p[c] for p in reversed(parts)]) for c, _ in COLUMNS}
+        return {c: v[-n:] for c, v in bars.items()}
+
+
+class SQLiteReader:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def _query(self, sql, args):
+        if self.conn is None:
+            # read-only: the aggregator is the writer
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            return self.conn.execute(sql, args).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return []
+            raise
+
+    def range(self, symbol, timeframe, start_ms, end_ms):
+        rows = self._query(
+            f'SELECT ts, open, high, low, close, volume, count FROM "bars_{timeframe}" '
+            "WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (symbol, start_ms if start_ms is not None else -2**63, end_ms if end_ms is not None else 2**63 - 1),
+        )
+        return from_rows(rows)
+
+    def tail(self, symbol, timeframe, n):
+        rows = self._query(
+            f'SELECT ts, open, high, low, close, volume, count FROM "bars_{timeframe}" '
+            "WHERE symbol = ? ORDER BY ts DESC LIMIT ?",
+            (symbol, n),
+        )
+        return from_rows(rows[::-1])
+
+
+class MongoReader:
+    """
+    synchronous pymongo: backtests and priming are not on an event loop
+    """
+    def __init__(self, uri, db_name):
+        from pymongo import MongoClient # type: ignore
+        self.db = MongoClient(uri, serverSelectionTimeoutMS=5000, tz_aware=True)[db_name]
+
+    def _rows(self, cursor):
+        return [
+            (int(d["ts"].timestamp() * 1000), d["open"], d["high"], d["low"], d["close"], d["volume"], d["count"])
+            for d in cursor
+        ]
+
+    def range(self, symbol, timeframe, start_ms, end_ms):
+        query = {"meta.symbol": symbol}
+        ts = {}
+        if start_ms is not None:
+            ts["$gte"] = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+        if end_ms is not None:
+            ts["$lt"] = datetime.fromtimestamp(end_ms / 1000, tz=timezone.utc)
+        if ts:
+            query["ts"] = ts
+        cursor = self.db[f"bars_{timeframe}"].find(query, {"_id": 0, "meta": 0, "ts_ist": 0}).sort("ts", 1)
+        # amendments are replaced, but time-series buckets can still
+        # hold a duplicate after a retried insert; keep the last one
+        bars = from_rows(self._rows(cursor))
+        if len(bars["ts"]) > 1:
+            keep = np.append(bars["ts"][1:] != bars["ts"][:-1], True)
+            bars = {c: v[keep] for c, v in bars.items()}
+        return bars
+
+    def tail(self, symbol, timeframe, n):
+        cursor = self.db[f"bars_{timeframe}"].find({"meta.symbol": symbol}, {"_id": 0, "meta": 0, "ts_ist": 0}).sort("ts", -1).limit(n)
+        return from_rows(self._rows(cursor)[::-1])
+
+
+class MemoryReader:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def _bars(self, symbol, timeframe):
+        docs = self.sink.collection(f"bars_{timeframe}").docs
+        rows = sorted(
+            (int(d["ts"].timestamp() * 1000), d["open"], d["high"], d["low"], d["close"], d["volume"], d["count"])
+            for d in docs if d["meta"]["symbol"] == symbol
+        )
+        return from_rows(rows)
+
+    def range(self, symbol, timeframe, start_ms, end_ms):
+        return slice_bars(self._bars(symbol, timeframe), start_ms, end_ms)
+
+    def tail(self, symbol, timeframe, n):
+        return {c: v[-n:] for c, v in self._bars(symbol, timeframe).items()}
+
+
+def _ist_day(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).astimezone(IST).strftime("%Y-%m-%d")
+
+
+def make_reader(url, db_name="market-data"):
+    """
+    reader for a sink url (see make_sink); an InMemorySink is read in place
+    """
+    if isinstance(url, InMemorySink):
+        return MemoryReader(url)
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoReader(url, db_name)
+    if url.startswith("sqlite:///"):
+        return SQLiteReader(url[len("sqlite:///"):])
+    if url.startswith("columnar:///"):
+        return ColumnarReader(url[len("columnar:///"):])
+    raise ValueError(f"no reader for sink url: {url!r}")
+
+
+class BarStore:
+    def __init__(self, url, db_name="market-data", cache_symbols=256, max_rows=500000, settle_ms=180000):
+        """
+        url: a sink url, as given to TickAggregator
+        cache_symbols: symbols kept in the LRU (every timeframe of a symbol counts as one)
+        max_rows: windows longer than this are not cached
+        settle_ms: bars younger than this are never cached
+        """
+        self.reader = make_reader(url, db_name)
+        self.cache_symbols = cache_symbols
+        self.max_rows = max_rows
+        self.settle_ms = settle_ms
+        self.cache = OrderedDict()  # symbol -> {timeframe: (start, covered until, bars)}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def range(self, symbol, timeframe="1m", start=None, end=None):
+        """
+        bars of symbol with start <= ts < end (either open-ended when None);
+        start / end as epoch ms, datetimes or ISO strings (naive = IST)
+        """
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        now_ms = int(time.time() * 1000)
+        windows = self.cache.get(symbol)
+        window = windows.get(timeframe) if windows else None
+
+        if window is not None:
+            self.cache.move_to_end(symbol)
+            w_start, w_end, bars = window
+            # an open start reaches back before any cached window that has a start
+            if (w_start is None or (start_ms is not None and w_start <= start_ms)) and end_ms is not None and end_ms <= w_end:
+                self.stats["hits"] += 1
+                return slice_bars(bars, start_ms, end_ms)
+            # overlapping or adjacent: read the union so the window grows
+            if _le(w_start, end_ms) and _le(start_ms, w_end):
+                start_ms = _min(start_ms, w_start)
+                end_ms = None if end_ms is None else max(end_ms, w_end)
+
+        self.stats["misses"] += 1
+        bars = self.reader.range(symbol, timeframe, start_ms, end_ms)
+        settled = now_ms - self.settle_ms
+        covered = settled if end_ms is None else min(end_ms, settled)
+        if (start_ms is None or start_ms < covered) and len(bars["ts"]) <= self.max_rows:
+            self._store(symbol, timeframe, (start_ms, covered, slice_bars(bars, None, covered)))
+        return slice_bars(bars, to_ms(start), to_ms(end))
+
+    def tail(self, symbol, timeframe="1m", n=100):
+        """
+        the last n bars, straight from the store (the newest ones are never cached)
+        """
+        return self.reader.tail(symbol, timeframe, n)
+
+    def closes(self, symbol, timeframe="1m", n=100, max_age_ms=None):
+        """
+        the last n closes as a list, for priming strategies. with
+        max_age_ms, only closes that continue into the live feed: none
+        when the newest bar is older than that (aggregator down, symbol
+        not traded), and none from before the newest bar's IST day
+        """
+        bars = self.tail(symbol, timeframe, n)
+        ts = bars["ts"]
+        if max_age_ms is not None and len(ts):
+            if int(ts[-1]) < int(time.time() * 1000) - max_age_ms:
+                return []
+            day = _ist_day(int(ts[-1]))
+            first = len(ts)
+            while first and _ist_day(int(ts[first - 1])) == day:
+                first -= 1
+            return bars["close"][first:].tolist()
+        return bars["close"].tolist()
+
+    def _store(self, symbol, timeframe, window):
+        self.cache.setdefault(symbol, {})[timeframe] = window
+        self.cache.move_to_end(symbol)
+        while len(self.cache) > self.cache_symbols:
+            self.cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, symbol=None):
+        if symbol is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(symbol, None)
+
+
+def _le(a, b):
+    """
+    a <= b, None being -inf on the left and +inf on the right
+    """
+    return a is None or b is None or a <= b
+
+
+def _min(a, b):
+    return None if a is None or b is None else min(a, b)
+
+
+def benchmark(days=20, symbols=50, queries=2000, root=None):
+    """
+    ms per range query (one symbol, one random trading day) on a
+    synthetic columnar store, uncached and through the LRU
+    """
+    import asyncio
+    import random
+    import tempfile
+    from sinks import ColumnarFileSink
+
+    root = root or tempfile.mkdtemp(prefix="bar_store_")
+    session = IST.localize(datetime(2024, 1, 1, 9, 15))
+    day_starts = [int((session + timedelta(days=d)).timestamp() * 1000) for d in range(days)]
+
+    async def write():
+        collection = ColumnarFileSink(root).collection("bars_1m")
+        for day_ms in day_starts:
+            docs = []
+            for s in range(symbols):
+                px = 100.0 + s
+                for m in range(375):
+                    ts = datetime.fromtimestamp((day_ms + m * 60000) / 1000, tz=timezone.utc)
+                    px += random.uniform(-0.5, 0.5)
+                    docs.append({"meta": {"symbol": f"SYM{s}"}, "ts": ts,
+                                 "ts_ist": ts.astimezone(IST).strftime("%Y-%m-%d %H:%M:%S"),
+                                 "open": px, "high": px + 0.2, "low": px - 0.2, "close": px, "volume": 10.0, "count": 5})
+            await collection.insert_many(docs)
+    asyncio.run(write())
+
+    picks = [(f"SYM{random.randrange(symbols)}", random.choice(day_starts)) for _ in range(queries)]
+    results = {}
+    for name, store in (("uncached", BarStore(f"columnar:///{root}", cache_symbols=0)),
+                        ("cached", BarStore(f"columnar:///{root}"))):
+        # a backtest loads a symbol once, then walks it
+        for s in range(symbols):
+            store.range(f"SYM{s}", "1m")
+        started = time.perf_counter()
+        rows = 0
+        for symbol, day_ms in picks:
+            rows += len(store.range(symbol, "1m", day_ms, day_ms + 375 * 60000)["ts"])
+        elapsed = time.perf_counter() - started
+        results[name] = {"ms_per_query": round(elapsed * 1000 / queries, 3), "rows_per_query": rows // queries, **store.stats}
+    results["store"] = root
+    return results
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,307 @@
+"""
+Resilient bulk writer for aggregated bars.
+
+Bars handed to `submit` go into a bounded in-memory buffer and are
+written by a background task with unordered `insert_many` batches.
+Failed batches are retried with exponential backoff; what still cannot
+be written (or does not fit in the buffer) is appended to an on-disk
+spill log, which is replayed once the sink accepts writes again
+(tried every `replay_interval` seconds while anything is spilled, new
+bars or not). A replay works off `<name>.replaying`, which is only
+removed once its bars are written or spilled again; one left behind by
+a crash is picked up first by the next replay.
+
+Delivery is at-least-once. Documents keep the `_id` the driver assigns on
+the first attempt, so on a regular collection a retry or replay of an
+already-written document is a duplicate-key error, counted as written
+(time-series collections do not enforce unique `_id`s).
+
+`submit(docs, upsert=True)` replaces bars by (symbol, ts) through the
+collection's `upsert_many` instead (amendments); a replace is idempotent,
+so a failed batch is simply retried whole. Inserts and upserts share the
+buffer and the spill log and are written strictly in submission order:
+the spill log only ever holds items older than the buffer, and nothing
+newer is written while it is not empty. An amendment therefore never
+lands before the insert of the bar it amends, across outages and restarts.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from bson import json_util # type: ignore
+from pymongo.errors import BulkWriteError # type: ignore
+
+
+DUPLICATE_KEY = 11000
+UPSERT_KEY = "_upsert"  # spill log lines of upserts are {"_upsert": doc}
+
+
+class BulkWriter:
+    def __init__(self,
+                 collection,
+                 name="bars",
+                 spill_dir="aggregator_spill",
+                 max_buffer=50000,
+                 max_batch=1000,
+                 max_retries=5,
+                 backoff=0.5,
+                 max_backoff=30.0,
+                 replay_interval=5.0):
+        self.collection = collection
+        self.name = name
+        self.spill_path = Path(spill_dir) / f"{name}.jsonl"
+        self.replaying_path = self.spill_path.with_suffix(".replaying")
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_buffer = max_buffer
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.replay_interval = replay_interval
+
+        self.buffer = deque()   # (upsert, doc), oldest first
+        self._inflight = []
+        self._wake = asyncio.Event()
+        self._spill_lock = asyncio.Lock()
+        self._latencies_ms = deque(maxlen=1000)
+        self.spill_pending = self._count_spilled()
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0, "duplicates": 0}
+
+    def _count_spilled(self):
+        count = 0
+        for path in (self.replaying_path, self.spill_path):
+            if path.exists():
+                with open(path, "rb") as f:
+                    count += sum(1 for line in f if line.strip())
+        return count
+
+    async def submit(self, docs, upsert=False):
+        """
+        queues docs for writing (as replacements with upsert=True). when
+        they do not fit, the whole buffer goes to the spill log ahead of
+        them, keeping the order
+        """
+        items = [(upsert, d) for d in docs]
+        if len(self.buffer) + len(items) > self.max_buffer:
+            items = list(self.buffer) + items
+            self.buffer.clear()
+            await self._spill(items)
+        else:
+            self.buffer.extend(items)
+        self._wake.set()
+
+    def _next_batch(self, source=None):
+        """
+        up to max_batch items off the buffer (or `source`), all inserts
+        or all upserts
+        """
+        source = self.buffer if source is None else source
+        upsert = source[0][0]
+        batch = []
+        while source and len(batch) < self.max_batch and source[0][0] == upsert:
+            batch.append(source.popleft())
+        return batch
+
+    async def _insert(self, items):
+        """
+        one unordered insert_many (or upsert_many); returns the items
+        that must be retried
+        """
+        upsert = items[0][0]
+        docs = [d for _, d in items]
+        started = time.perf_counter()
+        try:
+            if upsert:
+                await self.collection.upsert_many(docs)
+            else:
+                await self.collection.insert_many(docs, ordered=False)
+            written, retry = len(docs), []
+        except BulkWriteError as e:
+            if upsert:
+                raise
+            errors = e.details.get("writeErrors", [])
+            duplicates = sum(1 for err in errors if err.get("code") == DUPLICATE_KEY)
+            retry = [items[err["index"]] for err in errors if err.get("code") != DUPLICATE_KEY]
+            written = e.details.get("nInserted", 0) + duplicates
+            self.stats["duplicates"] += duplicates
+        self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        return retry
+
+    async def _write_with_retry(self, items, max_retries=None):
+        """
+        returns the items that could not be written
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                items = await self._insert(items)
+                if not items:
+                    return []
+            except Exception as e:
+                print(f"[{datetime.now()}] --[X]-- [{self.name}] write failed (attempt {attempt + 1}): {e}")
+            if attempt < max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+        return items
+
+    def _spill_sync(self, items, front=False):
+        """
+        appends to the spill log, or puts items ahead of what it already
+        holds (front=True, items older than anything spilled meanwhile)
+        """
+        lines = "".join(
+            json_util.dumps({UPSERT_KEY: d} if upsert else d) + "\n" for upsert, d in items
+        )
+        if front and self.spill_path.exists():
+            rewritten = self.spill_path.with_suffix(".rewrite")
+            with open(rewritten, "w") as f:
+                f.write(lines)
+                with open(self.spill_path, "r") as old:
+                    shutil.copyfileobj(old, f)
+            os.replace(rewritten, self.spill_path)
+        else:
+            with open(self.spill_path, "a") as f:
+                f.write(lines)
+
+    async def _spill(self, items, front=False):
+        async with self._spill_lock:
+            await asyncio.to_thread(self._spill_sync, items, front)
+            self.spill_pending += len(items)
+        self.stats["spilled"] += len(items)
+        print(f"[{datetime.now()}] [{self.name}] Spilled {len(items)} bars to {self.spill_path}")
+
+    def _take_spill_sync(self):
+        """
+        moves the spill log to .replaying (behind what an interrupted
+        replay left there) and returns its items; the file stays until
+        _done_replaying
+        """
+        if self.spill_path.exists():
+            if self.replaying_path.exists():
+                with open(self.replaying_path, "a") as f, open(self.spill_path, "r") as log:
+                    shutil.copyfileobj(log, f)
+                self.spill_path.unlink()
+            else:
+                os.replace(self.spill_path, self.replaying_path)
+        if not self.replaying_path.exists():
+            return []
+        items = []
+        with open(self.replaying_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    d = json_util.loads(line)
+                    items.append((True, d[UPSERT_KEY]) if UPSERT_KEY in d else (False, d))
+        return items
+
+    def _done_replaying(self):
+        self.replaying_path.unlink(missing_ok=True)
+
+    async def _replay_spill(self, max_retries=0):
+        async with self._spill_lock:
+            items = await asyncio.to_thread(self._take_spill_sync)
+            self.spill_pending = 0
+        if not items:
+            self._done_replaying()
+            return
+        pending = deque(items)
+        remaining = []
+        try:
+            while pending:
+                batch = self._next_batch(pending)
+                left = await self._write_with_retry(batch, max_retries=max_retries)
+                if left:
+                    remaining = left + list(pending)
+                    break
+        except asyncio.CancelledError:
+            self._spill_sync(batch + list(pending), front=True)
+            self.spill_pending += len(batch) + len(pending)
+            self._done_replaying()
+            raise
+        if remaining:
+            # sink is down again, the rest goes back ahead of anything
+            # spilled meanwhile (not counted as spilled a second time)
+            async with self._spill_lock:
+                await asyncio.to_thread(self._spill_sync, remaining, True)
+                self.spill_pending += len(remaining)
+        self._done_replaying()
+        done = len(items) - len(remaining)
+        self.stats["replayed"] += done
+        print(f"[{datetime.now()}] [{self.name}] Replayed {done} of {len(items)} spilled bars.")
+
+    async def run(self):
+        """
+        writer loop, runs until cancelled
+        """
+        try:
+            if self.spill_pending:
+                await self._replay_spill()
+            while True:
+                if self.spill_pending:
+                    # spilled bars are retried even when no new ones arrive
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.replay_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._wake.wait()
+                self._wake.clear()
+                if self.spill_pending and not self.buffer:
+                    await self._replay_spill()
+                while self.buffer:
+                    if self.spill_pending:
+                        # older items first; with the sink still down the
+                        # buffer goes behind them
+                        await self._replay_spill(max_retries=self.max_retries)
+                        if self.spill_pending:
+                            items = list(self.buffer)
+                            self.buffer.clear()
+                            await self._spill(items)
+                            break
+                        continue
+                    batch = self._inflight = self._next_batch()
+                    left = await self._write_with_retry(batch)
+                    self._inflight = []
+                    if left:
+                        await self._spill(left, front=True)
+        except asyncio.CancelledError:
+            # back to the buffer for close(); already-written docs are duplicates
+            self.buffer.extendleft(reversed(self._inflight))
+            self._inflight = []
+            raise
+
+    async def close(self, max_retries=1):
+        """
+        one last attempt at the spill log and the buffer, the rest is spilled
+        """
+        if self.spill_pending:
+            await self._replay_spill(max_retries=max_retries)
+        while self.buffer:
+            if self.spill_pending:
+                items = list(self.buffer)
+                self.buffer.clear()
+                await self._spill(items)
+                break
+            batch = self._next_batch()
+            left = await self._write_with_retry(batch, max_retries=max_retries)
+            if left:
+                items = left + list(self.buffer)
+                self.buffer.clear()
+                await self._spill(items, front=True)
+
+    def metrics(self):
+        lat = sorted(self._latencies_ms)
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 2) if lat else None
+        return {
+            "backlog": len(self.buffer),
+            "spill_pending": self.spill_pending,
+            "write_latency_ms": {"last": round(self._latencies_ms[-1], 2) if lat else None,
+                                 "p50": pct(0.5), "p99": pct(0.99), "max": round(lat[-1], 2) if lat else None},
+            **self.stats,
+        }
@@ -0,0 +1,368 @@
+"""
+Per-minute order-book statistics from full-mode depth snapshots.
+
+Every `MarketLevel.bidAskQuote` snapshot (with `tbq` / `tsq`) is folded
+into its symbol's open minute as it arrives; no frames are kept. A
+snapshot's book is taken to hold until the next one, so the means are
+time-weighted: each book state counts for as long as it was live, and
+the last state of a minute carries into the next (for up to
+`max_carry_ms`). Per minute and symbol:
+
+    snapshots                         count
+    spread, spread_min/max/last       ask1 - bid1
+    microprice, microprice_last       (bid1 * askQ1 + ask1 * bidQ1) / (bidQ1 + askQ1)
+    imbalance, imbalance_last         (bidQ1 - askQ1) / (bidQ1 + askQ1)
+    depth_imbalance                   same over the quantity of all levels
+    bid_depth, ask_depth              quantity over all levels
+    tbq, tsq                          total buy / sell quantity, last
+
+Closed minutes go to `DepthStore`: one file per IST day and symbol,
+each row stored as zigzag varint deltas of fixed-point values against
+the previous row, typically 20-30 bytes a minute. A failed append is
+cut off again and its rows are kept for the next flush. `read_depth`
+decodes a file back to numpy arrays.
+"""
+
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import pytz  # type: ignore
+
+
+PRICE_SCALE = 10000     # 1/100 paise
+RATIO_SCALE = 10000     # basis points
+
+# (field, fixed-point scale); minute is the row's start in epoch minutes
+FIELDS = (
+    ("minute", 1), ("snapshots", 1),
+    ("spread", PRICE_SCALE), ("spread_min", PRICE_SCALE), ("spread_max", PRICE_SCALE), ("spread_last", PRICE_SCALE),
+    ("microprice", PRICE_SCALE), ("microprice_last", PRICE_SCALE),
+    ("imbalance", RATIO_SCALE), ("imbalance_last", RATIO_SCALE), ("depth_imbalance", RATIO_SCALE),
+    ("bid_depth", 1), ("ask_depth", 1), ("tbq", 1), ("tsq", 1),
+)
+
+MAGIC = b"DPT1"
+
+
+def book_metrics(bids, asks):
+    """
+    (spread, microprice, imbalance, depth_imbalance, bid_depth, ask_depth)
+    of one snapshot; bids / asks are (price, qty) levels, best first
+    """
+    bid, bid_q = bids[0]
+    ask, ask_q = asks[0]
+    top = bid_q + ask_q
+    bid_depth = sum(q for _, q in bids)
+    ask_depth = sum(q for _, q in asks)
+    depth = bid_depth + ask_depth
+    return (
+        ask - bid,
+        (bid * ask_q + ask * bid_q) / top if top else (bid + ask) / 2,
+        (bid_q - ask_q) / top if top else 0.0,
+        (bid_depth - ask_depth) / depth if depth else 0.0,
+        bid_depth,
+        ask_depth,
+    )
+
+
+class DepthMinute:
+    """
+    running sums for one symbol's open minute; `sums` holds
+    book_metrics weighted by the ms each book state was live
+    """
+    __slots__ = ("start_ms", "snapshots", "weight", "sums", "spread_min", "spread_max")
+
+    def __init__(self, start_ms):
+        self.start_ms = start_ms
+        self.snapshots = 0
+        self.weight = 0
+        self.sums = [0.0] * 6
+        self.spread_min = float("inf")
+        self.spread_max = float("-inf")
+
+
+class DepthState:
+    __slots__ = ("minute", "book", "book_ts", "tbq", "tsq")
+
+    def __init__(self):
+        self.minute = None
+        self.book = None        # book_metrics of the live book
+        self.book_ts = 0        # up to when the live book is accounted for
+        self.tbq = self.tsq = 0.0
+
+    def hold(self, until_ms):
+        """
+        accounts for the live book up to until_ms
+        """
+        dt = until_ms - self.book_ts
+        if self.book is not None and dt > 0:
+            sums = self.minute.sums
+            for i, value in enumerate(self.book):
+                sums[i] += value * dt
+            self.minute.weight += dt
+        self.book_ts = max(self.book_ts, until_ms)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def encode_rows(rows, prev):
+    """
+    rows of fixed-point ints -> varint deltas against prev (updated in place)
+    """
+    out = bytearray()
+    for row in rows:
+        for i, value in enumerate(row):
+            n = _zigzag(value - prev[i])
+            prev[i] = value
+            while n >= 0x80:
+                out.append((n & 0x7F) | 0x80)
+                n >>= 7
+            out.append(n)
+    return bytes(out)
+
+
+def decode_rows(data):
+    """
+    -> (rows of fixed-point ints, bytes used by complete rows); a torn
+    last row (crash mid-append) is left out
+    """
+    rows, row, prev = [], [], [0] * len(FIELDS)
+    used = n = shift = 0
+    for pos, byte in enumerate(data):
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        value = prev[len(row)] + _unzigzag(n)
+        row.append(value)
+        n = shift = 0
+        if len(row) == len(FIELDS):
+            rows.append(row)
+            prev, row, used = row, [], pos + 1
+    return rows, used
+
+
+class DepthStore:
+    """
+    <root>/<YYYY-MM-DD>/<symbol>.depth, IST days. the last row of every
+    file is kept to delta-encode the next append; a file seen for the
+    first time is read (and cut back to its last complete row) once
+    """
+    def __init__(self, root="depth"):
+        self.root = Path(root)
+        self.tz = pytz.timezone("Asia/Kolkata")
+        self._last = {}     # path -> last row written
+
+    def path(self, symbol, start_ms):
+        day = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc).astimezone(self.tz).strftime("%Y-%m-%d")
+        return self.root / day / (symbol.replace("/", "_").replace(" ", "_") + ".depth")
+
+    def _open_prev(self, path):
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(MAGIC)
+            return [0] * len(FIELDS)
+        data = path.read_bytes()
+        rows, used = decode_rows(data[len(MAGIC):])
+        if len(MAGIC) + used < len(data):
+            os.truncate(path, len(MAGIC) + used)
+        return list(rows[-1]) if rows else [0] * len(FIELDS)
+
+    def write_sync(self, rows):
+        """
+        rows: (symbol, row dict) of closed minutes, oldest first per symbol.
+        returns the rows of every file that could not be appended to, in
+        order, for the next attempt
+        """
+        by_path = {}
+        for symbol, row in rows:
+            by_path.setdefault(self.path(symbol, row["start_ms"]), []).append((symbol, row))
+        failed = []
+        for path, path_rows in by_path.items():
+            try:
+                self._append(path, [[round(row[name] * scale) for name, scale in FIELDS] for _, row in path_rows])
+            except Exception as e:
+                print(f"[{datetime.now()}] --[X]-- Depth write to {path} failed: {e}")
+                failed.extend(path_rows)
+        if len(self._last) > 10000:
+            # mostly older days; anything dropped is re-read on demand
+            self._last = {p: self._last[p] for p in by_path if p in self._last}
+        return failed
+
+    def _append(self, path, fixed_rows):
+        """
+        appends whole rows or nothing: the file's last row only moves on
+        once they are on disk, a failed append is cut off again
+        """
+        prev = self._last.get(path)
+        if prev is None:
+            prev = self._open_prev(path)
+        prev = list(prev)
+        data = encode_rows(fixed_rows, prev)
+        size = path.stat().st_size
+        try:
+            with open(path, "ab") as f:
+                f.write(data)
+        except Exception:
+            # if the cut fails too, the file is re-read (and its torn
+            # row dropped) on the next append
+            self._last.pop(path, None)
+            try:
+                os.truncate(path, size)
+            except OSError:
+                pass
+            raise
+        self._last[path] = prev
+
+
+def read_depth(path):
+    """
+    one .depth file -> dict of numpy arrays, scaled back to prices,
+    ratios and quantities; `ts` is the minute start in epoch ms
+    """
+    import numpy as np # type: ignore
+    data = Path(path).read_bytes()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a depth file")
+    rows, _ = decode_rows(data[len(MAGIC):])
+    table = np.array(rows, dtype=np.int64).reshape(-1, len(FIELDS))
+    out = {"ts": table[:, 0] * 60000}
+    for i, (name, scale) in enumerate(FIELDS[1:], start=1):
+        out[name] = table[:, i] if scale == 1 else table[:, i] / scale
+    return out
+
+
+class DepthAggregator:
+    def __init__(self, root="depth", late_ms=5000, max_carry_ms=300000):
+        """
+        root: DepthStore directory
+        late_ms: how long after its end a minute with no newer
+        snapshot is closed by the flusher
+        max_carry_ms: a book older than this is not carried into a
+        new minute (feed gap, halt)
+        """
+        self.store = DepthStore(root)
+        self.late_ms = late_ms
+        self.max_carry_ms = max_carry_ms
+        self.flush_interval = 1.0
+        self.states = {}        # symbol -> DepthState
+        self.minute_heap = []   # (open minute start, symbol), for expiry
+        self.closed = []        # (symbol, row) waiting for the flusher, oldest first
+        self.stats = {"snapshots": 0, "late": 0, "one_sided": 0, "rows": 0, "write_failed": 0}
+
+    def update(self, symbol, ts_ms, bids, asks, tbq=0.0, tsq=0.0):
+        """
+        folds one snapshot in. out-of-order snapshots cannot be placed in a
+        time-weighted series and are only counted (`late`), as are
+        snapshots with an empty side (`one_sided`)
+        """
+        self.stats["snapshots"] += 1
+        if not bids or not asks:
+            self.stats["one_sided"] += 1
+            return False
+        state = self.states.get(symbol)
+        if state is None:
+            state = self.states[symbol] = DepthState()
+        if ts_ms < state.book_ts:
+            self.stats["late"] += 1
+            return False
+
+        start_ms = ts_ms - ts_ms % 60000
+        if state.minute is not None and state.minute.start_ms < start_ms:
+            self._close(symbol, state)
+        if state.minute is None:
+            state.minute = DepthMinute(start_ms)
+            heapq.heappush(self.minute_heap, (start_ms, symbol))
+            if state.book is not None and start_ms - state.book_ts <= self.max_carry_ms:
+                # the carried book is live at the minute start
+                state.book_ts = start_ms
+                state.minute.spread_min = state.minute.spread_max = state.book[0]
+            else:
+                state.book = None
+        state.hold(ts_ms)
+
+        book = state.book = book_metrics(bids, asks)
+        state.book_ts = ts_ms
+        state.tbq, state.tsq = tbq, tsq
+        minute = state.minute
+        minute.snapshots += 1
+        minute.spread_min = min(minute.spread_min, book[0])
+        minute.spread_max = max(minute.spread_max, book[0])
+        return True
+
+    async def process_snapshot(self, symbol, ts_ms, bids, asks, tbq=0.0, tsq=0.0):
+        self.update(symbol, ts_ms, bids, asks, tbq, tsq)
+
+    def _close(self, symbol, state):
+        minute, book = state.minute, state.book
+        state.hold(minute.start_ms + 60000)
+        state.minute = None
+        self.stats["rows"] += 1
+        weight = minute.weight
+        mean = [s / weight for s in minute.sums] if weight else list(book)
+        self.closed.append((symbol, {
+            "start_ms": minute.start_ms,
+            "minute": minute.start_ms // 60000,
+            "snapshots": minute.snapshots,
+            "spread": mean[0], "spread_min": minute.spread_min, "spread_max": minute.spread_max, "spread_last": book[0],
+            "microprice": mean[1], "microprice_last": book[1],
+            "imbalance": mean[2], "imbalance_last": book[2], "depth_imbalance": mean[3],
+            "bid_depth": mean[4], "ask_depth": mean[5],
+            "tbq": state.tbq, "tsq": state.tsq,
+        }))
+
+    def _pop_due(self, cutoff_ms):
+        """
+        closes every open minute that ended at or before cutoff_ms and
+        returns all closed rows
+        """
+        while self.minute_heap and self.minute_heap[0][0] + 60000 <= cutoff_ms:
+            start_ms, symbol = heapq.heappop(self.minute_heap)
+            state = self.states[symbol]
+            # a minute already closed by a newer snapshot is a stale entry
+            if state.minute is not None and state.minute.start_ms == start_ms:
+                self._close(symbol, state)
+        rows, self.closed = self.closed, []
+        return rows
+
+    async def _write(self, rows):
+        """
+        rows that could not be written go back ahead of anything closed
+        meanwhile and are retried on the next flush
+        """
+        failed = await asyncio.to_thread(self.store.write_sync, rows)
+        if failed:
+            self.stats["write_failed"] += len(failed)
+            self.closed[:0] = failed
+
+    async def flush_completed(self):
+        print(f"[{datetime.now()}] [.] Depth flush coroutine started.")
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                rows = self._pop_due(int(time.time() * 1000) - self.late_ms)
+                if rows:
+                    await self._write(rows)
+            except asyncio.CancelledError:
+                print(f"[{datetime.now()}] [.] Depth flusher shutting down.")
+                return
+            except Exception as e:
+                print(f"[{datetime.now()}] --[X]-- Error in depth flush loop:", e)
+                await asyncio.sleep(2)
+
+    async def flush_all_and_close(self):
+        rows = self._pop_due(float("inf"))
+        if rows:
+            await self._write(rows)
+        if self.closed:
+            print(f"[{datetime.now()}] --[X]-- {len(self.closed)} depth rows could not be written and are lost.")
+        print(f"[{datetime.now()}] [!] Depth aggregator closed: {self.stats}")
@@ -18,10 +18,18 @@ from concurrent.futures import ThreadPoolExecutor
 
 from utils import MarketDataFeedV3_pb2 as pb
 from aggregator import TickAggregator 
+from sharded_aggregator import ShardedAggregator
+from depth_aggregator import DepthAggregator
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_CONN_STRING")
+# e.g. sqlite:///bars.db or columnar:///bars to run without Mongo (see sinks.py)
+BAR_SINK = os.getenv("BAR_SINK", MONGO_URI)
+# > 1 spreads the symbols over that many aggregator processes
+AGG_WORKERS = int(os.getenv("AGG_WORKERS", "1"))
+# where per-minute order-book stats go (see depth_aggregator.py); unset = off
+DEPTH_DIR = os.getenv("DEPTH_DIR")
 ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 
 
@@ -31,29 +39,53 @@ def decode_protobuf(buffer):
     return feed_response
 
 
+def _parse_quotes(market_level):
+    """
+    bidAskQuote levels -> (bids, asks) as (price, qty), best first
+    """
+    bids, asks = [], []
+    for q in market_level.get("bidAskQuote", []):
+        if float(q.get("bidP", 0)) > 0:
+            bids.append((float(q["bidP"]), float(q.get("bidQ", 0))))
+        if float(q.get("askP", 0)) > 0:
+            asks.append((float(q["askP"]), float(q.get("askQ", 0))))
+    return bids, asks
+
+
 def _decode_and_parse_sync(buffer):
     """
-    Decodes protobuf, converts to dict, and extracts tick data.
+    Decodes protobuf, converts to dict, and extracts tick data
+    and (full mode, non-index feeds) depth snapshots.
     """
     decoded = decode_protobuf(buffer)
     data_dict = MessageToDict(decoded)
     ticks = []
+    snapshots = []
+    current_ts = int(data_dict.get("currentTs", 0))
 
     for feed_key, feed_val in data_dict.get("feeds", {}).items():
-        ff = feed_val.get("fullFeed", {}).get("indexFF", {})
+        full = feed_val.get("fullFeed", {})
+        ff = full.get("indexFF", {})
         ltpc = ff.get("ltpc", {})
         
         price = float(ltpc.get("ltp", 0))
         size = float(ltpc.get("ltq", 0))
         ts_ms = int(ltpc.get("ltt", 0))
+        symbol = feed_key.split("|")[-1]
         
         if price > 0 and ts_ms > 0: # Basic data validation
-            symbol = feed_key.split("|")[-1]
             tick = (symbol, price, size, ts_ms)
             print(f"[{datetime.now()}] [.] Parsed tick: {tick}")
             ticks.append(tick)
+
+        market = full.get("marketFF", {})
+        if "marketLevel" in market:
+            bids, asks = _parse_quotes(market["marketLevel"])
+            snapshot_ts = current_ts or int(market.get("ltpc", {}).get("ltt", 0))
+            snapshots.append((symbol, snapshot_ts, bids, asks,
+                              float(market.get("tbq", 0)), float(market.get("tsq", 0))))
             
-    return ticks
+    return ticks, snapshots
 
 
 async def get_market_data_feed_authorize_v3():
@@ -74,7 +106,8 @@ async def get_market_data_feed_authorize_v3():
             raise
 
 
-async def fetch_market_data(aggregator: TickAggregator, loop: asyncio.AbstractEventLoop, executor: ThreadPoolExecutor):
+async def fetch_market_data(aggregator: TickAggregator, loop: asyncio.AbstractEventLoop, executor: ThreadPoolExecutor,
+                            depth: DepthAggregator | None = None):
     """
     [BACKGROUND TASK]
     Connects to websocket and feeds ticks to the aggregator's queue.
@@ -106,12 +139,15 @@ async def fetch_market_data(aggregator: TickAggregator, loop: asyncio.AbstractEv
             while True:
                 msg = await websocket.recv()
                 
-                parsed_ticks = await loop.run_in_executor(
+                parsed_ticks, snapshots = await loop.run_in_executor(
                     executor, _decode_and_parse_sync, msg
                 )
 
                 for tick in parsed_ticks:
                     await aggregator.process_tick(*tick)
+                if depth is not None:
+                    for snapshot in snapshots:
+                        await depth.process_snapshot(*snapshot)
 
     except asyncio.CancelledError:
         print(f"[{datetime.now()}] [.] Websocket task shutting down.")
@@ -123,7 +159,7 @@ async def fetch_market_data(aggregator: TickAggregator, loop: asyncio.AbstractEv
         traceback.print_exc() # Print full error
 
 
-async def shutdown(sig, loop, aggregator, executor, tasks):
+async def shutdown(sig, loop, aggregator, executor, tasks, depth=None):
     """Graceful shutdown handler."""
     print(f"\n[{datetime.now()}] [!] Received exit signal {sig.name}...")
 
@@ -137,6 +173,8 @@ async def shutdown(sig, loop, aggregator, executor, tasks):
 
     # Now, flush all remaining data from the aggregator
     await aggregator.flush_all_and_close()
+    if depth is not None:
+        await depth.flush_all_and_close()
     
     # shut down the executor
     print(f"[{datetime.now()}] [!] Shutting down thread pool executor...")
@@ -148,7 +186,11 @@ async def shutdown(sig, loop, aggregator, executor, tasks):
 
 async def main():
     # Initialize the aggregator and the thread pool executor
-    aggregator = TickAggregator(MONGO_URI)
+    if AGG_WORKERS > 1:
+        aggregator = ShardedAggregator(BAR_SINK, workers=AGG_WORKERS)
+    else:
+        aggregator = TickAggregator(BAR_SINK)
+    depth = DepthAggregator(DEPTH_DIR) if DEPTH_DIR else None
     executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='LiveFeedExecutor')
     
     await aggregator.connect_db()
@@ -158,17 +200,21 @@ async def main():
 
     # Update the shutdown handler to also close the executor
     def shutdown_handler(sig):
-        asyncio.create_task(shutdown(sig, loop, aggregator, executor, tasks))
+        asyncio.create_task(shutdown(sig, loop, aggregator, executor, tasks, depth))
 
     for s in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(s, shutdown_handler, s)
 
     # Create and register all background tasks
-    flusher_task = asyncio.create_task(aggregator.flush_completed())
-    processor_task = asyncio.create_task(aggregator._run_processor())
-    ws_task = asyncio.create_task(fetch_market_data(aggregator, loop, executor))
-    
-    tasks.extend([flusher_task, processor_task, ws_task])
+    if AGG_WORKERS > 1:
+        # the workers process and flush, the parent only routes
+        tasks.append(asyncio.create_task(aggregator.run()))
+    else:
+        tasks.append(asyncio.create_task(aggregator.flush_completed()))
+        tasks.append(asyncio.create_task(aggregator._run_processor()))
+    if depth is not None:
+        tasks.append(asyncio.create_task(depth.flush_completed()))
+    tasks.append(asyncio.create_task(fetch_market_data(aggregator, loop, executor, depth)))
 
     print(f"[{datetime.now()}] All tasks started. Running... (Press Ctrl+C to stop)")
     
@@ -0,0 +1,253 @@
+"""
+Tick aggregation sharded across processes by symbol.
+
+Each tick is routed by a stable hash of its symbol (crc32, the same in
+every run) to one of N spawn worker processes. Every worker owns a plain
+TickAggregator for its symbols, with its own buckets, watermark, rollups
+and flush cycle, and writes to the same sink as the others. A symbol
+lives in exactly one worker, so no two workers ever write the same bar.
+
+The parent only routes: ticks are buffered per shard and shipped as
+lists (one pickle per batch, not per tick) when a buffer fills up or
+every `send_interval` seconds. Each worker keeps its spill files under
+`<spill_dir>/shard-<i>`. Dead workers are restarted; their open buckets
+are lost, but spilled bars are replayed.
+
+memory:// sinks stay inside each worker and are only useful for
+`python sharded_aggregator.py`, which benchmarks ticks/sec against the
+number of workers.
+"""
+
+import asyncio
+import os
+import queue
+import signal
+import time
+import zlib
+import multiprocessing as mp
+from datetime import datetime
+
+
+def shard_of(symbol, n_shards):
+    return zlib.crc32(symbol.encode()) % n_shards
+
+
+def _shard_main(shard_id, sink, db_name, spill_dir, kwargs, inbox, outbox):
+    """
+    worker process: feeds tick batches from inbox into its aggregator.
+    "sync" is answered with the worker's stats once every batch before
+    it is applied; None flushes everything and exits. Ctrl-C reaches
+    the whole process group: workers ignore it and wait for the
+    parent's None, so every tick it routed is applied and flushed
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from aggregator import TickAggregator
+
+    async def _run():
+        agg = TickAggregator(sink, db_name, spill_dir=os.path.join(spill_dir, f"shard-{shard_id}"), **kwargs)
+        await agg.connect_db()
+        flusher = asyncio.create_task(agg.flush_completed())
+        loop = asyncio.get_running_loop()
+        outbox.put(("ready", shard_id, None))
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, inbox.get)
+                if batch is None:
+                    break
+                if batch == "sync":
+                    outbox.put(("sync", shard_id, dict(agg.stats)))
+                    continue
+                async with agg.lock:
+                    agg._update_buckets_batch(batch, agg.start_time_utc_ms)
+        finally:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+            await agg.flush_all_and_close()
+            outbox.put(("closed", shard_id, dict(agg.stats)))
+
+    asyncio.run(_run())
+
+
+class ShardedAggregator:
+    """
+    parent side, with the TickAggregator interface live.py uses:
+    `connect_db()`, `process_tick(...)`, `run()` (instead of the
+    processor + flusher tasks) and `flush_all_and_close()`
+    """
+    def __init__(self, sink, workers=2, db_name="market-data", batch_size=2000,
+                 send_interval=0.05, spill_dir="aggregator_spill", **kwargs):
+        """
+        sink: a sink url (see sinks.py); every worker opens its own connection
+        kwargs: passed on to every worker's TickAggregator (rollups, reorder_ms, ...)
+        """
+        if not isinstance(sink, str):
+            raise ValueError("workers open the sink themselves, pass a sink url")
+        self.sink = sink
+        self.db_name = db_name
+        self.spill_dir = spill_dir
+        self.kwargs = kwargs
+        self.n = max(1, workers)
+        self.batch_size = batch_size
+        self.send_interval = send_interval
+
+        self.ctx = mp.get_context("spawn")
+        self.inboxes = [self.ctx.Queue() for _ in range(self.n)]
+        self.outbox = self.ctx.Queue()
+        self.pending = [[] for _ in range(self.n)]
+        self.route = {}     # symbol -> shard
+        self.procs = {}
+        self.stats = {"ticks": 0, "batches": 0, "restarts": 0}
+
+    def _start(self, shard_id):
+        proc = self.ctx.Process(
+            target=_shard_main,
+            args=(shard_id, self.sink, self.db_name, self.spill_dir, self.kwargs,
+                  self.inboxes[shard_id], self.outbox),
+            name=f"aggregator-shard-{shard_id}",
+            daemon=True,
+        )
+        proc.start()
+        self.procs[shard_id] = proc
+        print(f"[{datetime.now()}] [SHARD-{shard_id}] Process {proc.pid} started.")
+
+    async def _collect(self, kind, timeout=None, poll=1.0):
+        """
+        waits for one `kind` message from every worker: shard -> payload.
+        raises RuntimeError once a worker that has not answered is gone,
+        TimeoutError after timeout seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        got = {}
+        while len(got) < self.n:
+            wait = poll if deadline is None else min(poll, deadline - loop.time())
+            if wait <= 0:
+                missing = [i for i in range(self.n) if i not in got]
+                raise TimeoutError(f"shards {missing} did not answer {kind!r} within {timeout}s")
+            try:
+                msg_kind, shard_id, payload = await loop.run_in_executor(None, self.outbox.get, True, wait)
+            except queue.Empty:
+                dead = [i for i in range(self.n) if i not in got and not self.procs[i].is_alive()]
+                if dead:
+                    raise RuntimeError(f"shards {dead} exited before answering {kind!r}")
+                continue
+            if msg_kind == kind:
+                got[shard_id] = payload
+        return got
+
+    async def connect_db(self, timeout=60.0):
+        """
+        starts the workers and waits until every one has reached the sink
+        """
+        for shard_id in range(self.n):
+            self._start(shard_id)
+        await self._collect("ready", timeout)
+        print(f"[{datetime.now()}] -- {self.n} aggregator shards connected to {self.sink}")
+
+    def route_tick(self, tick):
+        shard = self.route.get(tick[0])
+        if shard is None:
+            shard = self.route[tick[0]] = shard_of(tick[0], self.n)
+        buf = self.pending[shard]
+        buf.append(tick)
+        if len(buf) >= self.batch_size:
+            self._send(shard)
+
+    async def process_tick(self, symbol, price, size, ts_ms):
+        self.route_tick((symbol, price, size, ts_ms))
+
+    def _send(self, shard):
+        batch, self.pending[shard] = self.pending[shard], []
+        self.inboxes[shard].put(batch)
+        self.stats["ticks"] += len(batch)
+        self.stats["batches"] += 1
+
+    def _send_pending(self):
+        for shard in range(self.n):
+            if self.pending[shard]:
+                self._send(shard)
+
+    async def run(self, supervise_every=5.0):
+        """
+        ships partial batches every send_interval and restarts dead
+        workers, until cancelled
+        """
+        loop = asyncio.get_running_loop()
+        next_check = loop.time() + supervise_every
+        while True:
+            await asyncio.sleep(self.send_interval)
+            self._send_pending()
+            if loop.time() >= next_check:
+                next_check = loop.time() + supervise_every
+                for shard_id, proc in list(self.procs.items()):
+                    if not proc.is_alive():
+                        print(f"[{datetime.now()}] [SHARD-{shard_id}] Exited ({proc.exitcode}), restarting")
+                        self.stats["restarts"] += 1
+                        self._start(shard_id)
+
+    async def sync(self, timeout=60.0):
+        """
+        shard -> aggregator stats, once every tick routed so far is applied
+        """
+        self._send_pending()
+        for inbox in self.inboxes:
+            inbox.put("sync")
+        return await self._collect("sync", timeout)
+
+    async def flush_all_and_close(self, timeout=60.0):
+        self._send_pending()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        try:
+            final = await self._collect("closed", timeout)
+            print(f"[{datetime.now()}] [!] Shards closed: {final}")
+        except Exception as e:
+            print(f"[{datetime.now()}] --[X]-- Shards did not close cleanly: {e}")
+        for proc in self.procs.values():
+            proc.join(timeout=5.0)
+            if proc.is_alive():
+                proc.terminate()
+
+
+async def benchmark(n_ticks=400000, n_symbols=1000, workers=(1, 2, 4)):
+    """
+    end-to-end ticks/sec (parent routing + worker aggregation) per
+    worker count. timestamps start at the next minute so every tick
+    lands after the aggregators' start time
+    """
+    start_ms = (int(time.time() * 1000) // 60000 + 1) * 60000
+    ticks = [
+        (f"SYM{i % n_symbols}", 100.0 + (i % 97) * 0.05, 1.0, start_ms + (i % 1000))
+        for i in range(n_ticks)
+    ]
+
+    results = {"cores": os.cpu_count()}
+    for n in workers:
+        agg = ShardedAggregator("memory://", workers=n, rollups={})
+        await agg.connect_db()
+
+        started = time.perf_counter()
+        for tick in ticks:
+            agg.route_tick(tick)
+        routed = time.perf_counter() - started
+        stats = await agg.sync()
+        elapsed = time.perf_counter() - started
+        await agg.flush_all_and_close()
+
+        applied = sum(s["ticks"] - s["discarded"] - s["too_late"] for s in stats.values())
+        results[f"workers_{n}"] = {
+            "ticks_per_sec": round(n_ticks / elapsed),
+            "elapsed_s": round(elapsed, 3),
+            # the parent's share: the ceiling once workers keep up
+            "routing_s": round(routed, 3),
+            "applied": applied,
+        }
+
+    base = results[f"workers_{workers[0]}"]["ticks_per_sec"]
+    for n in workers:
+        results[f"workers_{n}"]["speedup"] = round(results[f"workers_{n}"]["ticks_per_sec"] / base, 2)
+    return results
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark()))
@@ -0,0 +1,322 @@
+"""
+Storage sinks for aggregated bars.
+
+A sink hands out named collections (one per timeframe, e.g. `bars_1m`,
+`bars_5m`), each with an async `insert_many(docs, ordered=False)` taking
+the documents built by TickAggregator:
+
+    {"meta": {"symbol": ...}, "ts": <utc datetime>, "ts_ist": ...,
+     "open", "high", "low", "close", "volume", "count"}
+
+and an async `upsert_many(docs)` that replaces bars by (symbol, ts),
+used for amendments to bars already written by late ticks;
+plus `async ping()` and `async close()`. `make_sink(url)` picks the
+implementation from configuration:
+
+    mongodb://... / mongodb+srv://...   MongoSink (motor)
+    sqlite:///bars.db                   SQLiteSink (sqlite:////abs/bars.db)
+    columnar:///bars                    ColumnarFileSink (columnar:////abs/bars)
+    memory://                           InMemorySink
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from datetime import timezone
+from pathlib import Path
+
+
+def ts_ms(doc):
+    return int(doc["ts"].replace(tzinfo=doc["ts"].tzinfo or timezone.utc).timestamp() * 1000)
+
+
+class MongoCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    async def insert_many(self, docs, ordered=False):
+        await self.collection.insert_many(docs, ordered=ordered)
+
+    async def upsert_many(self, docs):
+        """
+        delete + insert per bar in one ordered bulk write: time-series
+        collections do not take upserts, but (MongoDB 7.0+) do take
+        deletes filtered on any field
+        """
+        from pymongo import DeleteMany, InsertOne # type: ignore
+        ops = []
+        for d in docs:
+            d = {k: v for k, v in d.items() if k != "_id"}
+            ops.append(DeleteMany({"meta.symbol": d["meta"]["symbol"], "ts": d["ts"]}))
+            ops.append(InsertOne(d))
+        await self.collection.bulk_write(ops, ordered=True)
+
+
+class MongoSink:
+    def __init__(self, mongo_uri, db_name="market-data"):
+        import motor.motor_asyncio # type: ignore
+        self.client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        self.db = self.client[db_name]
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = MongoCollection(self.db[name])
+        return self.collections[name]
+
+    async def ping(self):
+        await self.client.admin.command("ping")
+
+    async def close(self):
+        self.client.close()
+
+    def __str__(self):
+        return f"MongoDB ({self.db.name})"
+
+
+class InMemoryCollection:
+    """
+    set `available = False` to simulate an outage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.available = True
+
+    async def insert_many(self, docs, ordered=False):
+        if not self.available:
+            raise ConnectionError(f"in-memory collection {self.name} unavailable")
+        self.docs.extend(docs)
+
+    async def upsert_many(self, docs):
+        if not self.available:
+            raise ConnectionError(f"in-memory collection {self.name} unavailable")
+        index = {(d["meta"]["symbol"], d["ts"]): i for i, d in enumerate(self.docs)}
+        for d in docs:
+            i = index.get((d["meta"]["symbol"], d["ts"]))
+            if i is None:
+                index[(d["meta"]["symbol"], d["ts"])] = len(self.docs)
+                self.docs.append(d)
+            else:
+                self.docs[i] = d
+
+
+class InMemorySink:
+    """
+    for tests and benchmarks, nothing leaves the process
+    """
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = InMemoryCollection(name)
+        return self.collections[name]
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def __str__(self):
+        return "in-memory sink"
+
+
+class SQLiteCollection:
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+        with sink.lock:
+            sink.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" ('
+                "symbol TEXT NOT NULL, ts INTEGER NOT NULL, "
+                "open REAL, high REAL, low REAL, close REAL, volume REAL, count INTEGER, "
+                "PRIMARY KEY (symbol, ts))"
+            )
+            sink.conn.commit()
+
+    def _insert_sync(self, rows):
+        with self.sink.lock:
+            # a bar written twice (retry, replay) replaces itself
+            self.sink.conn.executemany(
+                f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self.sink.conn.commit()
+
+    async def insert_many(self, docs, ordered=False):
+        rows = [
+            (d["meta"]["symbol"], ts_ms(d), d["open"], d["high"], d["low"], d["close"], d["volume"], d["count"])
+            for d in docs
+        ]
+        await asyncio.to_thread(self._insert_sync, rows)
+
+    async def upsert_many(self, docs):
+        # INSERT OR REPLACE already is one
+        await self.insert_many(docs)
+
+
+class SQLiteSink:
+    """
+    one table per collection, keyed by (symbol, ts in epoch ms)
+    """
+    def __init__(self, path="bars.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = SQLiteCollection(self, name)
+        return self.collections[name]
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __str__(self):
+        return f"SQLite ({self.path})"
+
+
+COLUMNS = (("ts", "q"), ("open", "d"), ("high", "d"), ("low", "d"), ("close", "d"), ("volume", "d"), ("count", "q"))
+
+
+class ColumnarCollection:
+    def __init__(self, root, name):
+        self.root = Path(root) / name
+        self.name = name
+        self._checked = set()   # partition directories known to have no torn tail
+
+    @staticmethod
+    def _truncate_torn(directory):
+        """
+        cuts every column back to the rows the ts column has (itself to
+        whole rows), so the next append lines up again after a crash
+        """
+        ts_path = directory / "ts"
+        rows = ts_path.stat().st_size // 8 if ts_path.exists() else 0
+        for c, _ in COLUMNS:
+            path = directory / c
+            if path.exists() and path.stat().st_size > rows * 8:
+                os.truncate(path, rows * 8)
+
+    def _append_sync(self, docs):
+        partitions = {}
+        for d in docs:
+            ms = ts_ms(d)
+            day = d["ts_ist"][:10] if "ts_ist" in d else d["ts"].strftime("%Y-%m-%d")
+            cols = partitions.get((day, d["meta"]["symbol"]))
+            if cols is None:
+                cols = partitions[(day, d["meta"]["symbol"])] = {c: array(t) for c, t in COLUMNS}
+            cols["ts"].append(ms)
+            for c in ("open", "high", "low", "close", "volume"):
+                cols[c].append(d[c])
+            cols["count"].append(d["count"])
+        if sys.byteorder != "little":
+            # files are little-endian everywhere, as read_columnar reads them
+            for cols in partitions.values():
+                for values in cols.values():
+                    values.byteswap()
+
+        for (day, symbol), cols in partitions.items():
+            directory = self.root / day / symbol.replace("/", "_").replace(" ", "_")
+            if directory not in self._checked:
+                directory.mkdir(parents=True, exist_ok=True)
+                self._truncate_torn(directory)
+                self._checked.add(directory)
+            # ts last: a partition is only as long as its ts column
+            try:
+                for c, _ in COLUMNS[1:] + COLUMNS[:1]:
+                    with open(directory / c, "ab") as f:
+                        f.write(cols[c].tobytes())
+            except BaseException:
+                # possibly torn now, checked again before the next append
+                self._checked.discard(directory)
+                raise
+        if len(self._checked) > 10000:
+            # mostly older days; anything dropped is checked again on demand
+            self._checked = set()
+
+    async def insert_many(self, docs, ordered=False):
+        await asyncio.to_thread(self._append_sync, docs)
+
+    async def upsert_many(self, docs):
+        # appended as well; read_columnar keeps the last row per ts
+        await asyncio.to_thread(self._append_sync, docs)
+
+
+class ColumnarFileSink:
+    """
+    append-only column files (little-endian int64 / float64), partitioned by IST day and symbol:
+
+        <root>/<collection>/<YYYY-MM-DD>/<symbol>/{ts,open,high,low,close,volume,count}
+
+    `read_columnar` loads one partition as numpy arrays for backtests
+    """
+    def __init__(self, root="bars"):
+        self.root = root
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = ColumnarCollection(self.root, name)
+        return self.collections[name]
+
+    async def ping(self):
+        Path(self.root).mkdir(parents=True, exist_ok=True)
+
+    async def close(self):
+        pass
+
+    def __str__(self):
+        return f"columnar files ({self.root})"
+
+
+def read_columnar(directory):
+    """
+    one partition directory -> dict of numpy arrays, trimmed to the
+    rows every column has (a crash can leave a torn last append).
+    rows come back sorted by ts, an amended bar only in its latest version
+    """
+    import numpy as np # type: ignore
+    cols = {
+        c: np.fromfile(os.path.join(directory, c), dtype="<i8" if t == "q" else "<f8")
+        for c, t in COLUMNS
+        if os.path.exists(os.path.join(directory, c))
+    }
+    n = min((len(v) for v in cols.values()), default=0)
+    cols = {c: v[:n] for c, v in cols.items()}
+    if "ts" not in cols:
+        return cols
+    # np.unique keeps the first occurrence, so look from the end
+    _, last = np.unique(cols["ts"][::-1], return_index=True)
+    keep = n - 1 - last
+    return {c: v[keep] for c, v in cols.items()}
+
+
+def make_sink(url, db_name="market-data"):
+    """
+    sink from a configuration string; sink objects pass through
+    """
+    if not isinstance(url, str):
+        return url
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoSink(url, db_name)
+    # scheme:///relative/path or scheme:////absolute/path
+    if url.startswith("sqlite:///"):
+        return SQLiteSink(url[len("sqlite:///"):])
+    if url.startswith("columnar:///"):
+        return ColumnarFileSink(url[len("columnar:///"):])
+    if url.startswith("memory://"):
+        return InMemorySink()
+    raise ValueError(f"unknown sink url: {url!r}")